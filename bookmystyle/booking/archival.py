@@ -0,0 +1,17 @@
+"""
+Archived appointments of this app.
+
+``user_accounts`` moves past appointments into its ``ArchivedAppointment``
+table. The model is looked up by name so this app does not import
+``user_accounts``; without it there is simply no archive to read.
+"""
+from django.apps import apps
+
+
+def past_appointments(user):
+    """The user's archived appointments, newest first"""
+    try:
+        ArchivedAppointment = apps.get_model('user_accounts', 'ArchivedAppointment')
+    except LookupError:
+        return []
+    return ArchivedAppointment.objects.filter(user=user).order_by('-day')
@@ -2,6 +2,9 @@ from django.shortcuts import render, redirect
 from datetime import datetime, timedelta
 from .models import *
 from django.contrib import messages
+from django.http import JsonResponse
+from . import archival
+from user_accounts import holds
 
 def index(request):
     return render(request, "index.html",{})
@@ -48,8 +51,19 @@ def bookingSubmit(request):
     day = request.session.get('day')
     service = request.session.get('service')
     
-    #Only show the time of the day that has not been selected before:
-    hour = checkTime(times, day)
+    #Only show the time of the day that has not been selected or held by someone else:
+    owner = holds.hold_owner(request)
+    hour = checkTime(times, day, owner)
+
+    #Picking a time places a short hold on it (sent by the page before the final submit):
+    if request.method == 'POST' and request.POST.get('hold'):
+        time = request.POST.get("time")
+        #Holding another time moves the hold:
+        held = time in hour and holds.place_hold(
+            holds.APPOINTMENT_SCOPE, day, None, *holds.appointment_interval(time), owner
+        )
+        return JsonResponse({'held': bool(held), 'expires_in': holds.HOLD_TTL})
+
     if request.method == 'POST':
         time = request.POST.get("time")
         date = dayToWeekday(day)
@@ -59,14 +73,20 @@ def bookingSubmit(request):
                 if date == 'Monday' or date == 'Saturday' or date == 'Wednesday':
                     if Appointment.objects.filter(day=day).count() < 11:
                         if Appointment.objects.filter(day=day, time=time).count() < 1:
-                            AppointmentForm = Appointment.objects.get_or_create(
-                                user = user,
-                                service = service,
-                                day = day,
-                                time = time,
-                            )
-                            messages.success(request, "Appointment Saved!")
-                            return redirect('index')
+                            if time not in times or not holds.held_by_others(
+                                holds.APPOINTMENT_SCOPE, day, None, *holds.appointment_interval(time), owner
+                            ):
+                                AppointmentForm = Appointment.objects.get_or_create(
+                                    user = user,
+                                    service = service,
+                                    day = day,
+                                    time = time,
+                                )
+                                holds.confirm_hold(holds.APPOINTMENT_SCOPE, day, owner)
+                                messages.success(request, "Appointment Saved!")
+                                return redirect('index')
+                            else:
+                                messages.success(request, "The Selected Time Is Being Booked By Someone Else!")
                         else:
                             messages.success(request, "The Selected Time Has Been Reserved Before!")
                     else:
@@ -86,9 +106,11 @@ def bookingSubmit(request):
 def userPanel(request):
     user = request.user
     appointments = Appointment.objects.filter(user=user).order_by('day', 'time')
+    past_appointments = archival.past_appointments(user) if user.is_authenticated else []
     return render(request, 'userPanel.html', {
         'user':user,
         'appointments':appointments,
+        'past_appointments':past_appointments,
     })
 
 def userUpdate(request, id):
@@ -214,10 +236,13 @@ def isWeekdayValid(x):
             validateWeekdays.append(j)
     return validateWeekdays
 
-def checkTime(times, day):
+def checkTime(times, day, owner=None):
     #Only show the time of the day that has not been selected before:
     x = []
+    held = {start for staff_id, start, length in holds.other_holds(holds.APPOINTMENT_SCOPE, day, owner)}
     for k in times:
+        if holds.appointment_interval(k)[0] in held:
+            continue
         if Appointment.objects.filter(day=day, time=k).count() < 1:
             x.append(k)
     return x
@@ -1,8 +1,6 @@
-from tkinter import Widget
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
 from django import forms
-from django.db import models
 
 
 class RegisterUserForm(UserCreationForm):
@@ -0,0 +1,77 @@
+"""
+Emails sent after account and salon changes.
+
+Registration and salon creation only write to the database; these messages
+are built and sent afterwards by the tasks in ``tasks.py``, queued with
+``transaction.on_commit`` so they never see uncommitted rows. Set
+``CELERY_TASK_ALWAYS_EAGER = True`` in tests to run them inline.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.core.mail import EmailMessage
+from django.urls import reverse
+
+
+SITE_URL = getattr(settings, 'SITE_URL', 'http://localhost:8000').rstrip('/')
+VERIFICATION_MAX_AGE = timedelta(days=getattr(settings, 'EMAIL_VERIFICATION_DAYS', 3))
+# New salons created within this many seconds are reported to admins in one email
+ADMIN_ALERT_WINDOW = getattr(settings, 'ADMIN_SALON_ALERT_WINDOW_SECONDS', 300)
+
+_VERIFICATION_SALT = 'user_accounts.email_verification'
+
+
+def verification_token(user):
+    # Tied to the address, so changing the email invalidates older links
+    return signing.dumps({'user': user.pk, 'email': user.email}, salt=_VERIFICATION_SALT)
+
+
+def verified_user(token):
+    """The user a verification token belongs to, or ``None`` if it is invalid or expired"""
+    from .models import User
+
+    try:
+        data = signing.loads(token, salt=_VERIFICATION_SALT, max_age=VERIFICATION_MAX_AGE)
+    except signing.BadSignature:
+        return None
+    return User.objects.filter(pk=data['user'], email=data['email']).first()
+
+
+def welcome_message(user):
+    if user.is_salon_owner:
+        next_step = 'Add your salon from your dashboard; our team reviews new salons before they go live.'
+    else:
+        next_step = 'Find a salon near you and book your first appointment in a few clicks.'
+    return EmailMessage(
+        subject='Welcome to BookMyStyle',
+        body=(
+            f'Hi {user.first_name or user.email},\n\n'
+            f'Thanks for joining BookMyStyle! {next_step}\n\n'
+            f'See you soon,\nBookMyStyle'
+        ),
+        to=[user.email],
+    )
+
+
+def verification_message(user):
+    link = SITE_URL + reverse('accounts:verify_email', args=[verification_token(user)])
+    return EmailMessage(
+        subject='Confirm your email address',
+        body=(
+            f'Hi {user.first_name or user.email},\n\n'
+            f'Please confirm your email address by opening this link:\n{link}\n\n'
+            f'The link expires in {VERIFICATION_MAX_AGE.days} days.\n\nBookMyStyle'
+        ),
+        to=[user.email],
+    )
+
+
+def new_salons_message(salons, admin_emails):
+    lines = [f'- {salon.name} ({salon.city}) by {salon.owner.email}' for salon in salons]
+    review_link = SITE_URL + reverse('user_admin:salons')
+    return EmailMessage(
+        subject=f'{len(salons)} new salon{"s" if len(salons) != 1 else ""} awaiting approval',
+        body='New salons waiting for review:\n\n' + '\n'.join(lines) + f'\n\nReview them at {review_link}\n',
+        to=admin_emails,
+    )
@@ -1,6 +1,10 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, CustomerProfile, SalonOwnerProfile
+from .models import (
+    User, CustomerProfile, SalonOwnerProfile, SalonHoliday, SalonDailyStats,
+    ArchivedBooking, ArchivedPayment, ArchivedAppointment,
+)
+from .profile_counters import CUSTOMER_COUNTER_FIELDS, OWNER_COUNTER_FIELDS
 
 
 @admin.register(User)
@@ -19,14 +23,69 @@ class UserAdmin(BaseUserAdmin):
     )
 
 
+class CounterProfileAdmin(admin.ModelAdmin):
+    """Shows the maintained counters read-only and never writes them back"""
+    counter_fields = ()
+
+    def get_readonly_fields(self, request, obj=None):
+        return (*super().get_readonly_fields(request, obj), *self.counter_fields)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            return super().save_model(request, obj, form, change)
+        # Bookings may have moved the counters while the form was open
+        obj.save(update_fields=[
+            field.name for field in obj._meta.concrete_fields
+            if not field.primary_key and field.name not in self.counter_fields
+        ])
+
+
 @admin.register(CustomerProfile)
-class CustomerProfileAdmin(admin.ModelAdmin):
+class CustomerProfileAdmin(CounterProfileAdmin):
     list_display = ('user', 'loyalty_points', 'total_bookings')
+    counter_fields = CUSTOMER_COUNTER_FIELDS
     search_fields = ('user__username', 'user__email')
     filter_horizontal = ('preferred_services',)
 
 
 @admin.register(SalonOwnerProfile)
-class SalonOwnerProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'business_license', 'years_of_experience', 'total_salons')
-    search_fields = ('user__username', 'user__email', 'business_license')
\ No newline at end of file
+class SalonOwnerProfileAdmin(CounterProfileAdmin):
+    list_display = ('user', 'business_license', 'years_of_experience', 'total_salons', 'total_bookings')
+    counter_fields = OWNER_COUNTER_FIELDS
+    search_fields = ('user__username', 'user__email', 'business_license')
+
+
+@admin.register(SalonHoliday)
+class SalonHolidayAdmin(admin.ModelAdmin):
+    list_display = ('salon', 'date', 'is_closed', 'open_time', 'close_time', 'note')
+    list_filter = ('is_closed', 'date')
+    search_fields = ('salon__name', 'note')
+
+
+@admin.register(SalonDailyStats)
+class SalonDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ('salon', 'date', 'total_bookings', 'cancelled_bookings', 'revenue', 'refreshed_at')
+    list_filter = ('date',)
+    search_fields = ('salon__name',)
+
+@admin.register(ArchivedBooking)
+class ArchivedBookingAdmin(admin.ModelAdmin):
+    list_display = ('id', 'customer', 'salon', 'service_name', 'appointment_date', 'status', 'archived_at')
+    list_filter = ('status', 'appointment_date')
+    search_fields = ('customer__email', 'salon__name', 'service_name')
+    raw_id_fields = ('customer', 'salon', 'service', 'staff')
+
+
+@admin.register(ArchivedPayment)
+class ArchivedPaymentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'booking', 'amount', 'status', 'created_at')
+    list_filter = ('status',)
+    raw_id_fields = ('booking',)
+
+
+@admin.register(ArchivedAppointment)
+class ArchivedAppointmentAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'service', 'day', 'time', 'archived_at')
+    list_filter = ('day',)
+    search_fields = ('user__email', 'service')
+    raw_id_fields = ('user',)
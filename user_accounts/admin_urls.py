@@ -12,6 +12,8 @@ urlpatterns = [
     path('salons/<int:salon_id>/approve/', views.approve_salon, name='approve_salon'),
     path('salons/<int:salon_id>/reject/', views.reject_salon, name='reject_salon'),
     path('bookings/', views.admin_bookings, name='bookings'),
+    path('bookings/export/', views.export_admin_bookings, name='export_bookings'),
     path('analytics/', views.admin_analytics, name='analytics'),
     path('settings/', views.admin_settings, name='settings'),
+    path('metrics/', views.admin_metrics, name='metrics'),
 ]
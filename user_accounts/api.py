@@ -0,0 +1,97 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .serializers import BookingCreateSerializer, BookingSerializer
+
+
+IDEMPOTENCY_TTL = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 60 * 60 * 24)
+# The 'processing' placeholder must outlive the slowest request: once it
+# expires, a retry of a request that is still running would book again. Keep
+# it above the worker and proxy timeouts (gunicorn --timeout, proxy_read_timeout).
+IDEMPOTENCY_LOCK_TTL = getattr(settings, 'IDEMPOTENCY_LOCK_TTL', 5 * 60)
+
+
+class IsCustomer(permissions.BasePermission):
+    message = 'Access denied. Customer account required.'
+
+    def has_permission(self, request, view):
+        return bool(request.user and request.user.is_authenticated and request.user.is_customer)
+
+
+def idempotency_cache_key(user_id, idempotency_key):
+    return f'idempotency:booking:{user_id}:{idempotency_key}'
+
+
+def _fingerprint(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class BookingCreateAPIView(APIView):
+    """
+    Create a booking in one POST.
+
+    Clients should send an ``Idempotency-Key`` header (any unique string per
+    booking attempt). The first response for a key is stored in the cache and
+    replayed for retries with the same key, so a retried request never creates
+    a second booking or re-runs the availability checks.
+    """
+    permission_classes = [IsCustomer]
+
+    def post(self, request):
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            return self._create(request)
+
+        cache_key = idempotency_cache_key(request.user.id, idempotency_key)
+        fingerprint = _fingerprint(request.data)
+        stored = cache.get(cache_key)
+        if stored is None and cache.add(cache_key, {'state': 'processing', 'fingerprint': fingerprint}, IDEMPOTENCY_LOCK_TTL):
+            try:
+                response = self._create(request)
+            except Exception:
+                cache.delete(cache_key)
+                raise
+            if response.status_code < 500:
+                cache.set(cache_key, {
+                    'state': 'done',
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'data': response.data,
+                }, IDEMPOTENCY_TTL)
+            else:
+                cache.delete(cache_key)
+            return response
+
+        stored = stored or cache.get(cache_key)
+        if stored is None:
+            # The first attempt finished and failed between our two reads; let the client retry
+            return Response({'detail': 'Please retry the request.'}, status=status.HTTP_409_CONFLICT)
+        if stored['fingerprint'] != fingerprint:
+            return Response(
+                {'detail': 'This Idempotency-Key was already used with a different request body.'},
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        if stored['state'] == 'processing':
+            return Response(
+                {'detail': 'A request with this Idempotency-Key is still being processed.'},
+                status=status.HTTP_409_CONFLICT,
+            )
+        response = Response(stored['data'], status=stored['status'])
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def _create(self, request):
+        # No hold: the booking is checked and saved in this one request, and
+        # create_booking serializes bookings per salon. Other customers'
+        # holds still count as taken.
+        serializer = BookingCreateSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        booking = serializer.save()
+
+        return Response(BookingSerializer(booking).data, status=status.HTTP_201_CREATED)
@@ -0,0 +1,209 @@
+"""
+Hot/cold archival of booking history.
+
+Completed and cancelled bookings whose appointment is older than
+``BOOKING_ARCHIVE_AFTER_DAYS`` are moved, with their payments, from the hot
+``Booking``/``Payment`` tables into ``ArchivedBooking``/``ArchivedPayment``
+in batches, each batch in its own short transaction. Past appointments of the
+legacy booking app go to ``ArchivedAppointment``, which that app reads by
+model name. Rows that other rows still point at (a booking with a review, for
+example) stay in the hot table, since moving them would break those links. Dashboards and availability checks then only scan live rows;
+history views read both tables through the helpers below.
+"""
+import heapq
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import ArchivedAppointment, ArchivedBooking, ArchivedPayment
+
+
+ARCHIVE_AFTER_DAYS = getattr(settings, 'BOOKING_ARCHIVE_AFTER_DAYS', 365)
+ARCHIVE_BATCH_SIZE = getattr(settings, 'BOOKING_ARCHIVE_BATCH_SIZE', 1000)
+ARCHIVED_BOOKING_STATUSES = ('completed', 'cancelled')
+
+
+def archive_cutoff(days=None):
+    """Appointments before this date are archived"""
+    days = ARCHIVE_AFTER_DAYS if days is None else days
+    return timezone.localdate() - timedelta(days=days)
+
+
+def _delete_rows(model, ids):
+    """
+    Delete rows of ``model`` by primary key with one plain ``DELETE`` statement.
+
+    ``QuerySet.delete()`` would send ``pre_delete``/``post_delete`` for every
+    row, but moving a finished booking to the archive is not a deletion as far
+    as availability, reminders, rollups or profile counters are concerned, so
+    the statement is issued directly. Cascades are skipped too, so callers
+    only pick rows nothing else points at (see ``_unreferenced``).
+    """
+    if not ids:
+        return 0
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    placeholders = ', '.join(['%s'] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({placeholders})', list(ids))
+        return cursor.rowcount
+
+
+def _unreferenced(queryset, moved=()):
+    """
+    ``queryset`` without the rows another model still points at, other than
+    the ``moved`` models that are archived along with them.
+    """
+    for relation in queryset.model._meta.related_objects:
+        if relation.many_to_many or relation.related_model in moved:
+            continue
+        referencing = relation.related_model._base_manager.filter(**{relation.field.name: OuterRef('pk')})
+        queryset = queryset.filter(~Exists(referencing))
+    return queryset
+
+
+def archivable_bookings(cutoff):
+    from booking_system.models import Booking, Payment
+
+    return _unreferenced(
+        Booking.objects.filter(status__in=ARCHIVED_BOOKING_STATUSES, appointment_date__lt=cutoff),
+        moved=(Payment,),
+    )
+
+
+def archive_booking_batch(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move up to ``batch_size`` bookings older than ``cutoff``. Returns the number moved."""
+    from booking_system.models import Booking, Payment
+
+    with transaction.atomic():
+        booking_ids = list(
+            archivable_bookings(cutoff).order_by('id').select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not booking_ids:
+            return 0
+
+        bookings = Booking.objects.filter(id__in=booking_ids).select_related('service')
+        ArchivedBooking.objects.bulk_create([
+            ArchivedBooking(
+                id=booking.id,
+                customer_id=booking.customer_id,
+                salon_id=booking.salon_id,
+                service_id=booking.service_id,
+                staff_id=booking.staff_id,
+                service_name=booking.service.name,
+                price=booking.service.price,
+                appointment_date=booking.appointment_date,
+                appointment_time=booking.appointment_time,
+                status=booking.status,
+                created_at=booking.created_at,
+            )
+            for booking in bookings
+        ])
+
+        payments = list(
+            Payment.objects.filter(booking_id__in=booking_ids).values('id', 'booking_id', 'amount', 'status', 'created_at')
+        )
+        ArchivedPayment.objects.bulk_create([ArchivedPayment(**payment) for payment in payments])
+
+        _delete_rows(Payment, [payment['id'] for payment in payments])
+        _delete_rows(Booking, booking_ids)
+    return len(booking_ids)
+
+
+def archive_appointment_batch(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move up to ``batch_size`` legacy appointments before ``cutoff``. Returns the number moved."""
+    try:
+        Appointment = apps.get_model('booking', 'Appointment')
+    except LookupError:
+        return 0
+
+    with transaction.atomic():
+        appointments = list(
+            _unreferenced(Appointment.objects.filter(day__lt=cutoff))
+            .order_by('id').select_for_update(skip_locked=True)
+            .values('id', 'user_id', 'service', 'day', 'time', 'time_ordered')[:batch_size]
+        )
+        if not appointments:
+            return 0
+        ArchivedAppointment.objects.bulk_create([ArchivedAppointment(**appointment) for appointment in appointments])
+        _delete_rows(Appointment, [appointment['id'] for appointment in appointments])
+    return len(appointments)
+
+
+def archive_history(days=None, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None):
+    """Archive everything older than the horizon, batch by batch. Returns the counts moved."""
+    cutoff = archive_cutoff(days)
+    moved = {'bookings': 0, 'appointments': 0}
+    for name, archive_batch in (('bookings', archive_booking_batch), ('appointments', archive_appointment_batch)):
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            count = archive_batch(cutoff, batch_size)
+            moved[name] += count
+            batches += 1
+            if count < batch_size:
+                break
+    return moved
+
+
+def _newest_first(*sources):
+    return list(heapq.merge(
+        *sources, key=lambda booking: (booking.appointment_date, booking.appointment_time), reverse=True,
+    ))
+
+
+def with_service_names(archived):
+    """
+    Give archived bookings whose service was deleted (``SET_NULL``) an unsaved
+    stand-in built from the copied name and price, so history pages that show
+    ``booking.service.name`` still read correctly.
+    """
+    from salon_management.models import Service
+
+    for booking in archived:
+        if booking.service is None:
+            booking.service = Service(name=booking.service_name, price=booking.price)
+    return archived
+
+
+class CustomerBookingHistory:
+    """
+    A customer's bookings, live and archived, newest first.
+
+    Supports ``count()`` and slicing, so it can be handed to ``Paginator``:
+    a page only loads as many rows from each table as the page needs.
+    """
+
+    def __init__(self, customer):
+        from booking_system.models import Booking
+
+        self.live = Booking.objects.filter(customer=customer).select_related('salon', 'service').order_by(
+            '-appointment_date', '-appointment_time', '-id',
+        )
+        self.archived = ArchivedBooking.objects.filter(customer=customer).select_related(
+            'salon', 'service',
+        ).order_by('-appointment_date', '-appointment_time', '-id')
+
+    def count(self):
+        return self.live.count() + self.archived.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        # The first ``stop`` merged rows come from the first ``stop`` rows of each table
+        live = self.live if stop is None else self.live[:stop]
+        archived = self.archived if stop is None else self.archived[:stop]
+        return _newest_first(live, with_service_names(list(archived)))[start:stop]
+
+
+def customer_booking_history(customer):
+    """All of a customer's bookings, live and archived, newest first (see ``CustomerBookingHistory``)"""
+    return CustomerBookingHistory(customer)
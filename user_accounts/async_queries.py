@@ -0,0 +1,61 @@
+"""
+Concurrent ORM queries for async views.
+
+Django's async ORM methods (``acount()``, ``aget()``, ``async for``) all run
+on the single thread that owns the request's database connection, so
+``asyncio.gather`` over them still executes the queries one after another.
+``gather_queries`` instead runs each callable in a small pool of worker
+threads, each with its own connection, so a dashboard's independent counts
+and lists hit the database at the same time.
+
+Each call is treated like a request: the worker's connection is checked
+before and closed after it unless ``CONN_MAX_AGE`` allows keeping it, so idle
+workers never hold connections open past that age. The workers do
+not share the caller's transaction, so only use this for read-only queries.
+Setting ``ASYNC_QUERY_THREADS = 0`` (e.g. in tests that rely on transactions)
+runs the callables one after another on the request's own connection.
+"""
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .request_profiling import logging_queries
+
+
+QUERY_THREADS = getattr(settings, 'ASYNC_QUERY_THREADS', 8)
+
+_executor = ThreadPoolExecutor(max_workers=QUERY_THREADS, thread_name_prefix='async-queries') if QUERY_THREADS else None
+
+
+def _run(func):
+    # Same connection handling as request_started / request_finished
+    close_old_connections()
+    try:
+        # A profiled request's log comes along in the copied context
+        with logging_queries():
+            return func()
+    finally:
+        close_old_connections()
+
+
+def evaluated(queryset):
+    """Callable that fills ``queryset``'s result cache and returns it, for templates to reuse"""
+    def fetch():
+        len(queryset)
+        return queryset
+    return fetch
+
+
+async def gather_queries(*funcs):
+    """Run each zero-argument callable concurrently and return their results in order"""
+    if _executor is None:
+        return await sync_to_async(lambda: [func() for func in funcs])()
+    loop = asyncio.get_running_loop()
+    # Each worker gets a copy of the caller's context, e.g. its database routing state
+    return await asyncio.gather(*(
+        loop.run_in_executor(_executor, contextvars.copy_context().run, _run, func) for func in funcs
+    ))
@@ -0,0 +1,305 @@
+"""
+Precomputed per-salon, per-day free-slot index.
+
+Each salon-day is stored in the cache as a small dict::
+
+    {'open': 540, 'step': 30, 'free': [2, 2, 1, 0, ...]}
+
+where ``open`` is the minute of the day of the first slot, ``step`` the slot
+length in minutes and ``free`` the remaining capacity (free staff) of every
+slot until closing time. Entries are built once from the database and then
+adjusted in place by the booking signal handlers, so a cross-salon search is
+three ``get_many`` calls (salon versions, entries, live slot holds) against the
+cache instead of one availability query per salon.
+
+Every change to a salon-day also replaces its ``:changed`` token while holding
+the entry's lock. ``get_days`` reads the token before building a missing entry
+and only stores the entry if the token is unchanged, so a booking adjusted
+while the entry was being built is never lost to a stale write.
+"""
+import math
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+ACTIVE_BOOKING_STATUSES = ('pending', 'confirmed')
+
+SLOT_MINUTES = getattr(settings, 'AVAILABILITY_SLOT_MINUTES', 30)
+INDEX_TIMEOUT = getattr(settings, 'AVAILABILITY_INDEX_TIMEOUT', 60 * 60 * 24)
+LOCK_TIMEOUT = 5
+LOCK_ATTEMPTS = 20
+
+
+def index_key(salon_id, day, version):
+    return f'availability:{salon_id}:{version}:{day.isoformat()}'
+
+
+def _version_key(salon_id):
+    return f'availability:{salon_id}:version'
+
+
+def _token():
+    return uuid.uuid4().hex
+
+
+def salon_versions(salon_ids):
+    """
+    ``{salon_id: version}`` of the salons' entries. ``invalidate_salon`` moves a
+    salon to a new version, which drops all of its days at once. Versions are
+    random rather than counters so an evicted version key can never bring old
+    entries back.
+    """
+    keys = {_version_key(salon_id): salon_id for salon_id in salon_ids}
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _token(), None)
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def minutes_of(value):
+    """Minute of the day for a ``time``"""
+    return value.hour * 60 + value.minute
+
+
+def duration_minutes(duration):
+    """Length in minutes of a ``Service.duration`` (minutes or a timedelta)"""
+    if isinstance(duration, timedelta):
+        return max(1, int(duration.total_seconds() // 60))
+    if duration:
+        return int(duration)
+    return SLOT_MINUTES
+
+
+def _slot_range(entry, start_minute, length):
+    """Indexes of the slots covered by ``length`` minutes from ``start_minute``"""
+    step = entry['step']
+    first = (start_minute - entry['open']) // step
+    last = math.ceil((start_minute + length - entry['open']) / step)
+    return range(max(first, 0), min(last, len(entry['free'])))
+
+
+def build_day(salon_id, day):
+    """Compute the free-slot entry for one salon-day from the database"""
+    from .scheduling import TICK_MINUTES, load_day
+
+    # Holds come and go within minutes; find_available_salons applies them on read
+    schedule = load_day(salon_id, day, with_holds=False)
+    if not schedule.open_mask:
+        return {'open': 0, 'step': SLOT_MINUTES, 'free': []}
+
+    open_mask = schedule.open_mask
+    open_minute = ((open_mask & -open_mask).bit_length() - 1) * TICK_MINUTES
+    close_minute = open_mask.bit_length() * TICK_MINUTES
+    slot_count = (close_minute - open_minute) // SLOT_MINUTES
+    free = [
+        schedule.free_staff_count(open_minute + slot * SLOT_MINUTES, SLOT_MINUTES)
+        for slot in range(slot_count)
+    ]
+    return {'open': open_minute, 'step': SLOT_MINUTES, 'free': free}
+
+
+def _acquire(lock_key, attempts=LOCK_ATTEMPTS):
+    for attempt in range(attempts):
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            return True
+        if attempt + 1 < attempts:
+            time.sleep(0.01)
+    return False
+
+
+def _store_unless_changed(key, entry, token):
+    """Cache a freshly built ``entry`` unless the salon-day changed since ``token`` was read"""
+    lock_key = f'{key}:lock'
+    # A busy lock means a change is being applied; the entry is built again on the next read
+    if not _acquire(lock_key, attempts=1):
+        return
+    try:
+        if cache.get(f'{key}:changed') == token:
+            cache.set(key, entry, INDEX_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+
+
+def get_days(salon_ids, day):
+    """Return ``{salon_id: entry}`` for ``day``, building missing entries"""
+    versions = salon_versions(salon_ids)
+    keys = {index_key(salon_id, day, version): salon_id for salon_id, version in versions.items()}
+    cached = cache.get_many([*keys, *(f'{key}:changed' for key in keys)])
+    entries = {}
+    for key, salon_id in keys.items():
+        if key in cached:
+            entries[salon_id] = cached[key]
+        else:
+            token = cached.get(f'{key}:changed')
+            entries[salon_id] = build_day(salon_id, day)
+            _store_unless_changed(key, entries[salon_id], token)
+    return entries
+
+
+def adjust_booking(salon_id, day, start_time, length, delta):
+    """
+    Add ``delta`` to the free capacity of the slots a booking covers.
+
+    Only entries already in the cache are touched; missing ones are built
+    correctly on their next read. If the entry's lock stays busy the entry is
+    dropped instead, so it is rebuilt rather than left inconsistent.
+    """
+    key = index_key(salon_id, day, salon_versions([salon_id])[salon_id])
+    lock_key = f'{key}:lock'
+    if not _acquire(lock_key):
+        invalidate_days([(salon_id, day)])
+        return
+    try:
+        # Tells a get_days building this entry right now not to store it
+        cache.set(f'{key}:changed', _token(), INDEX_TIMEOUT)
+        entry = cache.get(key)
+        if entry is None:
+            return
+        for slot in _slot_range(entry, minutes_of(start_time), length):
+            entry['free'][slot] += delta
+        cache.set(key, entry, INDEX_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+
+
+SLOT_FIELDS = ('status', 'salon_id', 'appointment_date', 'appointment_time', 'service_id')
+
+
+def _slot(status, salon_id, appointment_date, appointment_time, service_id):
+    if status not in ACTIVE_BOOKING_STATUSES:
+        return None
+    if appointment_date is None or appointment_time is None:
+        return None
+    return (salon_id, appointment_date, appointment_time, service_id)
+
+
+def stored_booking_row(booking, fields=SLOT_FIELDS):
+    """The ``fields`` of the booking's row as it is in the database, or ``None`` if unsaved"""
+    if booking.pk is None or booking._state.adding:
+        return None
+    return type(booking)._base_manager.filter(pk=booking.pk).values(*fields).first()
+
+
+def booking_row(booking, fields=SLOT_FIELDS):
+    """The booking's ``fields``; partially loaded bookings are read back from the database"""
+    if set(fields) & booking.get_deferred_fields():
+        return stored_booking_row(booking, fields)
+    return {field: getattr(booking, field) for field in fields}
+
+
+def row_slot(row):
+    """The slot of a row holding at least the ``SLOT_FIELDS``, or ``None`` if it has none"""
+    return _slot(**{field: row[field] for field in SLOT_FIELDS}) if row else None
+
+
+def booking_slot(booking):
+    """
+    The ``(salon_id, date, time, service_id)`` a booking occupies, or ``None``
+    if it does not hold capacity (cancelled or completed).
+    """
+    return row_slot(booking_row(booking))
+
+
+def apply_slot(slot, delta):
+    """Occupy (``delta=-1``) or release (``delta=1``) the capacity of a slot"""
+    from salon_management.models import Service
+
+    salon_id, day, start_time, service_id = slot
+    duration = Service.objects.filter(pk=service_id).values_list('duration', flat=True).first()
+    adjust_booking(salon_id, day, start_time, duration_minutes(duration), delta)
+
+
+def invalidate_days(salon_days):
+    """Drop the cached entries of ``(salon_id, date)`` pairs"""
+    salon_days = list(salon_days)
+    versions = salon_versions({salon_id for salon_id, day in salon_days})
+    keys = [index_key(salon_id, day, versions[salon_id]) for salon_id, day in salon_days]
+    cache.set_many({f'{key}:changed': _token() for key in keys}, INDEX_TIMEOUT)
+    cache.delete_many(keys)
+
+
+def invalidate_salon(salon_id):
+    """Drop every cached entry of a salon, e.g. after its hours or staff change"""
+    cache.set(_version_key(salon_id), _token(), None)
+
+
+def without_holds(entry, held):
+    """Copy of ``entry`` with one unit of capacity taken for each ``(staff_id, start_minute, length)`` hold"""
+    entry = {**entry, 'free': list(entry['free'])}
+    for staff_id, start_minute, length in held:
+        for slot in _slot_range(entry, start_minute, length):
+            entry['free'][slot] = max(0, entry['free'][slot] - 1)
+    return entry
+
+
+def free_start_times(entry, window_start, window_end, length):
+    """Slot start times within the window with capacity for ``length`` minutes"""
+    free = entry['free']
+    step = entry['step']
+    needed = max(1, math.ceil(length / step))
+    starts = []
+    first = max(0, math.ceil((minutes_of(window_start) - entry['open']) / step))
+    last = (minutes_of(window_end) - entry['open']) // step
+    for slot in range(first, min(last, len(free) - needed) + 1):
+        if all(free[slot + offset] > 0 for offset in range(needed)):
+            minute = entry['open'] + slot * step
+            starts.append(f'{minute // 60:02d}:{minute % 60:02d}')
+    return starts
+
+
+def find_available_salons(category, day, window_start, window_end):
+    """
+    Salons offering a service in ``category`` with capacity on ``day`` between
+    ``window_start`` and ``window_end`` (both ``time`` objects).
+
+    Returns a list of ``(salon, start_times)`` pairs ordered by rating.
+    """
+    from salon_management.models import Salon, Service
+
+    services = Service.objects.filter(salon__status='approved')
+    if category:
+        services = services.filter(category__name=category)
+    shortest = {}
+    for salon_id, duration in services.values_list('salon_id', 'duration'):
+        length = duration_minutes(duration)
+        shortest[salon_id] = min(length, shortest.get(salon_id, length))
+    if not shortest:
+        return []
+
+    # Skip salons that are closed for the whole window without touching their entries
+    from .holds import holds_for_salons
+    from .opening_hours import open_during
+    from .scheduling import interval_mask
+
+    window_mask = interval_mask(minutes_of(window_start), max(1, minutes_of(window_end) - minutes_of(window_start)))
+    candidates = open_during(shortest.keys(), day, window_mask)
+
+    entries = get_days(candidates, day)
+    # Capacity customers are holding right now
+    for salon_id, held in holds_for_salons(candidates, day).items():
+        entries[salon_id] = without_holds(entries[salon_id], held)
+    matches = {}
+    for salon_id, entry in entries.items():
+        starts = free_start_times(entry, window_start, window_end, shortest[salon_id])
+        if starts:
+            matches[salon_id] = starts
+
+    salons = Salon.objects.filter(id__in=matches.keys()).order_by('-rating', 'name')
+    return [(salon, matches[salon.id]) for salon in salons]
+
+
+def parse_window(date_value, start_value, end_value=None):
+    """Parse ``YYYY-MM-DD`` and ``HH:MM`` strings into ``(date, start, end)``"""
+    day = datetime.strptime(date_value, '%Y-%m-%d').date()
+    start = datetime.strptime(start_value, '%H:%M').time()
+    end = datetime.strptime(end_value, '%H:%M').time() if end_value else start
+    if end < start:
+        raise ValueError('The time window ends before it starts.')
+    return day, start, end
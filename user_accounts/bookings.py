@@ -0,0 +1,74 @@
+"""
+Creating and changing bookings.
+
+Every path that creates a booking goes through ``create_booking`` so the slot
+is checked by the scheduling engine right before the row is written, while
+the salon row is locked: two requests for one salon are checked and written
+one after the other, so both cannot pass the check before either has saved.
+"""
+from django.db import transaction
+
+from . import holds, profile_counters
+from .scheduling import validate_booking_slot
+from .signals import bookings_bulk_updated
+
+
+def create_booking(customer, salon, service, day, start_time, staff_id=None, hold_owner=None):
+    """
+    Save a pending booking, or raise ``ValidationError`` if the slot is taken.
+
+    ``staff_id`` is the stylist the customer asked for; without one the
+    booking goes to the first stylist who is free. Slots held by anyone but
+    ``hold_owner`` count as taken, and ``hold_owner``'s own hold is confirmed
+    once the booking has committed.
+    """
+    from booking_system.models import Booking
+    from salon_management.models import Salon
+
+    with transaction.atomic():
+        # Held until commit; a concurrent booking at this salon waits here and
+        # then validates against the booking saved below
+        Salon.objects.select_for_update().only('id').get(pk=salon.id)
+        staff_id = validate_booking_slot(
+            salon.id, day, start_time, service, staff_id=staff_id, hold_owner=hold_owner,
+        )
+        booking = Booking.objects.create(
+            customer=customer,
+            salon=salon,
+            service=service,
+            staff_id=staff_id,
+            appointment_date=day,
+            appointment_time=start_time,
+            status='pending',
+        )
+        if hold_owner is not None:
+            transaction.on_commit(lambda: holds.confirm_hold(salon.id, day, hold_owner))
+    return booking
+
+
+def bulk_update_booking_status(bookings, status):
+    """
+    Set ``status`` on every booking in ``bookings`` with one UPDATE.
+
+    Returns the number of bookings changed. Downstream side effects get a
+    single ``bookings_bulk_updated`` signal after commit instead of N saves.
+    """
+    from booking_system.models import Booking
+
+    with transaction.atomic():
+        changed = list(
+            bookings.select_for_update(of=('self',)).exclude(status=status).values(
+                'id', 'salon_id', 'customer_id', 'service_id',
+                'appointment_date', 'appointment_time', 'status',
+            )
+        )
+        if not changed:
+            return 0
+
+        Booking.objects.filter(id__in=[booking['id'] for booking in changed]).update(status=status)
+        profile_counters.bookings_status_changed(changed, status)
+
+        transaction.on_commit(
+            lambda: bookings_bulk_updated.send(sender=Booking, bookings=changed, status=status)
+        )
+    return len(changed)
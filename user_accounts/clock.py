@@ -0,0 +1,26 @@
+"""
+Clocks for code that measures time against stored deadlines.
+
+Reminders and rate-limit buckets take a clock object with a ``now()`` method
+(seconds since the epoch) instead of calling ``time.time()``, so tests can
+move time with ``FakeClock`` rather than sleeping or patching.
+"""
+import time
+
+
+class SystemClock:
+    def now(self):
+        return time.time()
+
+
+class FakeClock:
+    """Clock for tests; time only moves when ``advance`` is called"""
+
+    def __init__(self, start=0.0):
+        self.current = float(start)
+
+    def now(self):
+        return self.current
+
+    def advance(self, seconds):
+        self.current += seconds
@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from .lazy import lazy_view
 
 app_name = 'customer'
 
@@ -8,6 +9,8 @@ urlpatterns = [
     path('bookings/', views.customer_bookings, name='bookings'),
     path('bookings/<int:booking_id>/', views.booking_detail, name='booking_detail'),
     path('bookings/<int:booking_id>/cancel/', views.cancel_booking, name='cancel_booking'),
+    path('salons/<int:salon_id>/book/', views.book_salon, name='book_salon'),
     path('reviews/', views.customer_reviews, name='reviews'),
     path('notifications/', views.customer_notifications, name='notifications'),
+    path('api/bookings/', lazy_view('user_accounts.api.BookingCreateAPIView', csrf_exempt=True), name='api_create_booking'),
 ]
@@ -0,0 +1,192 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+Enable with::
+
+    DATABASES = {'default': {...primary...}, 'replica': {...}}
+    DATABASE_ROUTERS = ['user_accounts.db_router.ReplicaRouter']
+    MIDDLEWARE = [..., 'user_accounts.db_router.ReadYourWritesMiddleware', ...]
+
+Reads made while serving a request go to the replica; writes always go to the
+primary. A request that writes (or is a POST/PUT/PATCH/DELETE) reads from the
+primary from then on, and the response sets a short-lived cookie so the same
+user keeps reading from the primary for ``REPLICA_PIN_SECONDS`` while the
+replica catches up. Code running outside a request (Celery tasks, management
+commands) reads from the primary unless it opts in with ``replica_reads()``.
+
+Streaming response bodies (the CSV exports) are generated after the view has
+returned; they are read with the same routing as the rest of the request.
+Sessions are always read from and written to the primary, and saving one
+does not count as a write; anything inside a transaction on the primary is
+read from the primary too. Without a ``replica`` database configured every
+query goes to ``default``.
+
+For local testing point ``replica`` at a second SQLite file and copy the
+primary into it with ``manage.py sync_sqlite_replica``; in the test suite set
+``'TEST': {'MIRROR': 'default'}`` on the replica.
+"""
+from asyncio import iscoroutinefunction
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICA_DB = getattr(settings, 'DATABASE_REPLICA_ALIAS', 'replica')
+REPLICA_PIN_COOKIE = getattr(settings, 'REPLICA_PIN_COOKIE', 'primary_pin')
+REPLICA_PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 10)
+
+# Always read from the primary, whatever the request state
+PRIMARY_ONLY_APPS = {'sessions'}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class RoutingState:
+    """Per-request routing state; ``wrote`` is set by the router on the first write"""
+
+    def __init__(self, use_replica=True):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+_state = ContextVar('replica_routing_state', default=None)
+
+
+def has_replica():
+    return REPLICA_DB in settings.DATABASES
+
+
+@contextmanager
+def replica_reads():
+    """Send reads in this block to the replica, e.g. in a reporting task"""
+    token = _state.set(RoutingState(use_replica=True))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Send reads in this block to the primary"""
+    token = _state.set(RoutingState(use_replica=False))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or not has_replica():
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction must see that transaction's writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA_DB
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        # Session saves are not what the user reads back, and would otherwise
+        # pin every request whose session was touched
+        if state is not None and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            state.wrote = True
+            state.use_replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication
+        if db == REPLICA_DB:
+            return False
+        return None
+
+
+def _iter_with_state(content, state):
+    iterator = iter(content)
+    while True:
+        token = _state.set(state)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            _state.reset(token)
+        yield chunk
+
+
+async def _aiter_with_state(content, state):
+    iterator = aiter(content)
+    while True:
+        token = _state.set(state)
+        try:
+            chunk = await anext(iterator)
+        except StopAsyncIteration:
+            return
+        finally:
+            _state.reset(token)
+        yield chunk
+
+
+class ReadYourWritesMiddleware:
+    """
+    Route the request's reads to the replica unless the user wrote recently.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(request, response, state)
+
+    async def __acall__(self, request):
+        state, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._finish(request, response, state)
+
+    def _start(self, request):
+        pinned = REPLICA_PIN_COOKIE in request.COOKIES or request.method not in SAFE_METHODS
+        state = RoutingState(use_replica=not pinned)
+        return state, _state.set(state)
+
+    def _finish(self, request, response, state):
+        if response.streaming:
+            # The body is generated after this middleware has returned (and
+            # reset the state), so each chunk runs with the request's state
+            if response.is_async:
+                response.streaming_content = _aiter_with_state(response.streaming_content, state)
+            else:
+                response.streaming_content = _iter_with_state(response.streaming_content, state)
+        if state.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                REPLICA_PIN_COOKIE, '1',
+                max_age=REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+                secure=request.is_secure(),
+            )
+        return response
@@ -1,49 +1,78 @@
+from asyncio import iscoroutinefunction
 from functools import wraps
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.shortcuts import redirect
 from django.urls import reverse
 
 
+def _role_denied(request, allowed_roles):
+    """Redirect away if the user has none of ``allowed_roles``, otherwise ``None``"""
+    user = request.user
+    
+    # Check if user has any of the allowed roles
+    user_roles = []
+    if user.is_admin:
+        user_roles.append('admin')
+    if user.is_customer:
+        user_roles.append('customer')
+    if user.is_salon_owner:
+        user_roles.append('salon_owner')
+    
+    # Check if user has any allowed role
+    if any(role in user_roles for role in allowed_roles):
+        return None
+    
+    # Redirect to appropriate dashboard with error message
+    messages.error(request, 'Access denied. You do not have permission to access this page.')
+    
+    # Redirect to user's appropriate dashboard
+    if user.is_admin:
+        return redirect('user_admin:dashboard')
+    elif user.is_salon_owner:
+        return redirect('salon_owner:dashboard')
+    elif user.is_customer:
+        return redirect('customer:dashboard')
+    else:
+        return redirect('core:home')
+
+
+# Returns the login redirect for anonymous users and None otherwise
+_login_denied = login_required(lambda request: None)
+
+
 def role_required(*allowed_roles):
     """
     Decorator that checks if the user has the required role.
     
+    Works on both regular and ``async def`` views.
+    
     Usage:
     @role_required('admin')
     @role_required('customer', 'salon_owner')
     """
     def decorator(view_func):
+        if iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # Loading the session and user hits the database, so do it off the event loop
+                denied = await sync_to_async(
+                    lambda: _login_denied(request) or _role_denied(request, allowed_roles)
+                )()
+                if denied is not None:
+                    return denied
+                return await view_func(request, *args, **kwargs)
+            
+            return async_wrapper
+        
         @wraps(view_func)
         @login_required
         def wrapper(request, *args, **kwargs):
-            user = request.user
-            
-            # Check if user has any of the allowed roles
-            user_roles = []
-            if user.is_admin:
-                user_roles.append('admin')
-            if user.is_customer:
-                user_roles.append('customer')
-            if user.is_salon_owner:
-                user_roles.append('salon_owner')
-            
-            # Check if user has any allowed role
-            if any(role in user_roles for role in allowed_roles):
-                return view_func(request, *args, **kwargs)
-            
-            # Redirect to appropriate dashboard with error message
-            messages.error(request, 'Access denied. You do not have permission to access this page.')
-            
-            # Redirect to user's appropriate dashboard
-            if user.is_admin:
-                return redirect('user_admin:dashboard')
-            elif user.is_salon_owner:
-                return redirect('salon_owner:dashboard')
-            elif user.is_customer:
-                return redirect('customer:dashboard')
-            else:
-                return redirect('core:home')
+            denied = _role_denied(request, allowed_roles)
+            if denied is not None:
+                return denied
+            return view_func(request, *args, **kwargs)
         
         return wrapper
     return decorator
@@ -1,7 +1,14 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.core.exceptions import ValidationError
+# This module is only imported on first use (by the views and the booking
+# API), and what it imports is loaded at boot anyway: the models by the app
+# registry, scheduling and holds through .bookings, which the views use
 from .models import User, CustomerProfile, SalonOwnerProfile
+from .availability import duration_minutes
+from .scheduling import find_start_times, validate_booking_slot
+from . import holds
+from salon_management.models import Service, Staff
 
 class CustomerRegistrationForm(UserCreationForm):
     email = forms.EmailField(required=True)
@@ -216,3 +223,57 @@ class AdminUserCreationForm(UserCreationForm):
                 SalonOwnerProfile.objects.create(user=user)
         
         return user
+
+class BookingSlotForm(forms.Form):
+    """Pick a service, date, start time and optional stylist at one salon"""
+    service = forms.ModelChoiceField(queryset=Service.objects.none())
+    appointment_date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    appointment_time = forms.TimeField(widget=forms.TimeInput(attrs={'type': 'time'}))
+    staff = forms.ModelChoiceField(queryset=Staff.objects.none(), required=False)
+    
+    def __init__(self, salon, *args, hold_owner=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.salon = salon
+        self.hold_owner = hold_owner
+        self.fields['service'].queryset = Service.objects.filter(salon=salon)
+        self.fields['staff'].queryset = Staff.objects.filter(salon=salon)
+        # Add Tailwind CSS classes to form fields
+        for field in self.fields.values():
+            field.widget.attrs.update({
+                'class': 'w-full px-3 py-2 border border-gray-300 rounded-md focus:outline-none focus:ring-2 focus:ring-purple-500 focus:border-transparent'
+            })
+    
+    def available_times(self):
+        """Feasible start times for the selected service and date"""
+        service = self.cleaned_data.get('service')
+        day = self.cleaned_data.get('appointment_date')
+        if not service or not day:
+            return []
+        staff = self.cleaned_data.get('staff')
+        return find_start_times(
+            self.salon.id, day, service, staff_id=staff.id if staff else None, hold_owner=self.hold_owner,
+        )
+    
+    def place_hold(self):
+        """Hold the validated slot for ``hold_owner``; ``False`` if someone else got there first"""
+        start_time = self.cleaned_data['appointment_time']
+        return holds.place_hold(
+            self.salon.id, self.cleaned_data['appointment_date'], self.cleaned_data['staff_id'],
+            start_time.hour * 60 + start_time.minute, duration_minutes(self.cleaned_data['service'].duration),
+            self.hold_owner,
+        )
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        service = cleaned_data.get('service')
+        day = cleaned_data.get('appointment_date')
+        start_time = cleaned_data.get('appointment_time')
+        staff = cleaned_data.get('staff')
+        if service and day and start_time:
+            # Times other customers are holding count as taken
+            cleaned_data['staff_id'] = validate_booking_slot(
+                self.salon.id, day, start_time, service,
+                staff_id=staff.id if staff else None,
+                hold_owner=self.hold_owner,
+            )
+        return cleaned_data
@@ -0,0 +1,297 @@
+"""
+Short-lived slot holds.
+
+Picking a time places a hold on that interval for one stylist; it expires on
+its own after ``SLOT_HOLD_TTL`` seconds. While it lives ``load_day`` treats
+the interval as busy for everyone but the holder, so the slot disappears from
+other customers' start times, conflict checks and the availability search.
+Saving the booking confirms the hold. An owner holds one interval per
+salon-day: holding again moves or extends it.
+
+The holds of a salon-day are one Redis hash (``SLOT_HOLD_REDIS_URL``), owner
+-> ``staff:start:length:expires``, changed by Lua scripts: placing (with its
+overlap check), confirming and releasing a hold are each a single atomic
+round trip, with no lock to wait for. Without Redis the holds live in process
+memory (tests, local runs), like the rate-limit buckets.
+
+The legacy appointment flow (``bookmystyle.booking``) holds its fixed
+half-hour times through the same functions, under ``APPOINTMENT_SCOPE`` in
+place of a salon and without a stylist; see ``appointment_interval``. Both
+flows report to the same conversion/expiry counters, kept in the cache.
+"""
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+HOLD_TTL = getattr(settings, 'SLOT_HOLD_TTL', 5 * 60)
+
+METRIC_KEYS = {
+    'placed': 'holds:metrics:placed',
+    'converted': 'holds:metrics:converted',
+    'released': 'holds:metrics:released',
+    'rejected': 'holds:metrics:rejected',
+    'lost': 'holds:metrics:lost',
+}
+
+# What placing a hold did
+PLACED, MOVED = 1, 2
+
+# Legacy appointments: half-hour times such as '3:30 PM', one calendar for everyone
+APPOINTMENT_SCOPE = 'appointment'
+APPOINTMENT_MINUTES = 30
+
+
+def holds_key(salon_id, day):
+    # ``day`` is a date or, in the legacy flow, an ISO date string
+    return f'holds:{salon_id}:{day}'
+
+
+def hold_owner(request):
+    """Identify the holder: the session key (created if needed)"""
+    if not request.session.session_key:
+        request.session.save()
+    return request.session.session_key
+
+
+def appointment_interval(label):
+    """``(start_minute, length)`` of a legacy appointment time such as ``'3 PM'`` or ``'3:30 PM'``"""
+    moment = datetime.strptime(label, '%I:%M %p' if ':' in label else '%I %p')
+    return moment.hour * 60 + moment.minute, APPOINTMENT_MINUTES
+
+
+def _overlaps(hold, staff_id, start_minute, length):
+    held_staff_id, held_start, held_length = hold[:3]
+    return held_staff_id == staff_id and held_start < start_minute + length and start_minute < held_start + held_length
+
+
+class LocalHoldStore:
+    """In-process holds with the same interface as ``RedisHoldStore``"""
+
+    def __init__(self):
+        # key -> {owner: (staff_id, start_minute, length, expires_at)}
+        self._holds = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        holds = {owner: hold for owner, hold in self._holds.get(key, {}).items() if hold[3] > now}
+        if holds:
+            self._holds[key] = holds
+        else:
+            self._holds.pop(key, None)
+        return holds
+
+    def place(self, key, owner, staff_id, start_minute, length, ttl):
+        """``PLACED`` or ``MOVED`` (the owner already held something), or ``None`` on overlap"""
+        now = time.time()
+        with self._lock:
+            holds = self._live(key, now)
+            if any(
+                _overlaps(hold, staff_id, start_minute, length)
+                for other, hold in holds.items() if other != owner
+            ):
+                return None
+            outcome = MOVED if owner in holds else PLACED
+            self._holds[key] = {**holds, owner: (staff_id, start_minute, length, now + ttl)}
+            return outcome
+
+    def take(self, key, owner):
+        """Remove ``owner``'s hold; returns whether it was still live"""
+        now = time.time()
+        with self._lock:
+            holds = self._live(key, now)
+            taken = holds.pop(owner, None) is not None
+            if not holds:
+                self._holds.pop(key, None)
+            return taken
+
+    def get_many(self, keys):
+        """``{key: {owner: (staff_id, start_minute, length)}}`` of the keys with live holds"""
+        now = time.time()
+        with self._lock:
+            found = {key: self._live(key, now) for key in keys}
+        return {key: {owner: hold[:3] for owner, hold in holds.items()} for key, holds in found.items() if holds}
+
+    def clear(self):
+        with self._lock:
+            self._holds.clear()
+
+
+class RedisHoldStore:
+    """One Redis hash per salon-day, changed atomically by Lua scripts using the Redis clock"""
+
+    # ARGV: owner, staff, start, length, ttl; returns 0 on overlap, else PLACED
+    # or MOVED. Drops expired holds on the way
+    PLACE = """
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local start = tonumber(ARGV[3])
+    local length = tonumber(ARGV[4])
+    local expires = now + tonumber(ARGV[5])
+    local latest = expires
+    local entries = redis.call('HGETALL', KEYS[1])
+    for i = 1, #entries, 2 do
+        local staff, held_start, held_length, held_expires = string.match(
+            entries[i + 1], '^(.*):(%-?%d+):(%d+):([%d%.]+)$')
+        held_start, held_length, held_expires = tonumber(held_start), tonumber(held_length), tonumber(held_expires)
+        if held_expires <= now then
+            redis.call('HDEL', KEYS[1], entries[i])
+        elseif entries[i] ~= ARGV[1] then
+            if staff == ARGV[2] and held_start < start + length and start < held_start + held_length then
+                return 0
+            end
+            latest = math.max(latest, held_expires)
+        end
+    end
+    local outcome = 1
+    if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+        outcome = 2
+    end
+    local value = ARGV[2] .. ':' .. ARGV[3] .. ':' .. ARGV[4] .. ':' .. string.format('%.6f', expires)
+    redis.call('HSET', KEYS[1], ARGV[1], value)
+    redis.call('EXPIRE', KEYS[1], math.ceil(latest - now) + 1)
+    return outcome
+    """
+
+    TAKE = """
+    local value = redis.call('HGET', KEYS[1], ARGV[1])
+    if not value then
+        return 0
+    end
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    if tonumber(string.match(value, ':([%d%.]+)$')) <= now then
+        return 0
+    end
+    return 1
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._place = client.register_script(self.PLACE)
+        self._take = client.register_script(self.TAKE)
+
+    @staticmethod
+    def _staff(staff_id):
+        return '' if staff_id is None else str(staff_id)
+
+    def place(self, key, owner, staff_id, start_minute, length, ttl):
+        outcome = self._place(keys=[key], args=[owner, self._staff(staff_id), start_minute, length, ttl])
+        return outcome or None
+
+    def take(self, key, owner):
+        return bool(self._take(keys=[key], args=[owner]))
+
+    def get_many(self, keys):
+        pipeline = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipeline.hgetall(key)
+        now = time.time()
+        found = {}
+        for key, entries in zip(keys, pipeline.execute()):
+            holds = {}
+            for owner, value in entries.items():
+                staff, start, length, expires = value.decode().rsplit(':', 3)
+                if float(expires) > now:
+                    holds[owner.decode()] = (int(staff) if staff else None, int(start), int(length))
+            if holds:
+                found[key] = holds
+        return found
+
+
+_store = None
+
+
+def get_store():
+    """Hold store backed by Redis if ``SLOT_HOLD_REDIS_URL`` is set, else in-process"""
+    global _store
+    if _store is None:
+        redis_url = getattr(settings, 'SLOT_HOLD_REDIS_URL', None)
+        if redis_url:
+            import redis
+
+            _store = RedisHoldStore(redis.Redis.from_url(redis_url))
+        else:
+            _store = LocalHoldStore()
+    return _store
+
+
+def _count(metric):
+    key = METRIC_KEYS[metric]
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def place_hold(salon_id, day, staff_id, start_minute, length, owner, ttl=HOLD_TTL):
+    """
+    Hold ``length`` minutes from ``start_minute`` with ``staff_id`` for ``owner``.
+
+    Returns ``False`` if another owner holds an overlapping interval of the
+    same stylist.
+    """
+    outcome = get_store().place(holds_key(salon_id, day), owner, staff_id, start_minute, length, ttl)
+    if outcome is None:
+        _count('rejected')
+        return False
+    if outcome == PLACED:
+        _count('placed')
+    return True
+
+
+def other_holds(salon_id, day, owner=None):
+    """``(staff_id, start_minute, length)`` of the live holds of everyone but ``owner``"""
+    key = holds_key(salon_id, day)
+    holds = get_store().get_many([key]).get(key, {})
+    return [hold for holder, hold in holds.items() if holder != owner]
+
+
+def held_by_others(salon_id, day, staff_id, start_minute, length, owner):
+    """Whether someone other than ``owner`` holds part of the interval"""
+    return any(_overlaps(hold, staff_id, start_minute, length) for hold in other_holds(salon_id, day, owner))
+
+
+def holds_for_salons(salon_ids, day):
+    """``{salon_id: [(staff_id, start_minute, length), ...]}`` of the salons with live holds on ``day``"""
+    keys = {holds_key(salon_id, day): salon_id for salon_id in salon_ids}
+    return {keys[key]: list(holds.values()) for key, holds in get_store().get_many(list(keys)).items()}
+
+
+def confirm_hold(salon_id, day, owner):
+    """
+    Consume ``owner``'s hold once the booking is committed.
+
+    Returns whether the hold was still live. An expired hold is counted as
+    lost; it does not block the booking, the conflict check decides that.
+    """
+    taken = get_store().take(holds_key(salon_id, day), owner)
+    _count('converted' if taken else 'lost')
+    return taken
+
+
+def release_hold(salon_id, day, owner):
+    """Give a slot back early, e.g. when the booking fails"""
+    if get_store().take(holds_key(salon_id, day), owner):
+        _count('released')
+
+
+def hold_metrics():
+    """
+    Counters plus derived rates.
+
+    ``expired`` counts holds that were neither confirmed nor released; it
+    includes holds that are still live.
+    """
+    values = cache.get_many(METRIC_KEYS.values())
+    metrics = {name: values.get(key, 0) for name, key in METRIC_KEYS.items()}
+    placed = metrics['placed']
+    metrics['expired'] = max(0, placed - metrics['converted'] - metrics['released'])
+    metrics['conversion_rate'] = metrics['converted'] / placed if placed else 0.0
+    metrics['expiry_rate'] = metrics['expired'] / placed if placed else 0.0
+    return metrics
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from user_accounts.archival import (
+    ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, archivable_bookings, archive_cutoff, archive_history,
+)
+
+
+class Command(BaseCommand):
+    help = 'Move completed/cancelled bookings and past appointments older than the horizon to the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                            help=f'Archive appointments older than this many days (default: {ARCHIVE_AFTER_DAYS})')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                            help=f'Rows moved per transaction (default: {ARCHIVE_BATCH_SIZE})')
+        parser.add_argument('--max-batches', type=int, help='Stop after this many batches per table')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the bookings that would be archived')
+
+    def handle(self, *args, **options):
+        cutoff = archive_cutoff(options['days'])
+        if options['dry_run']:
+            count = archivable_bookings(cutoff).count()
+            self.stdout.write(f'{count} bookings before {cutoff} would be archived')
+            return
+
+        moved = archive_history(options['days'], options['batch_size'], options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {moved["bookings"]} bookings and {moved["appointments"]} appointments before {cutoff}'
+        ))
@@ -0,0 +1,135 @@
+import time
+import uuid
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client
+from django.urls import NoReverseMatch, reverse
+
+from user_accounts.api import idempotency_cache_key
+from user_accounts.models import User
+from user_accounts.scheduling import find_start_times
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare booking throughput of the single-request API and the session-based flow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customer', type=str, help='Email of the customer to book as', required=True)
+        parser.add_argument('--salon', type=int, help='Salon id', required=True)
+        parser.add_argument('--service', type=int, help='Service id', required=True)
+        parser.add_argument('--bookings', type=int, help='Bookings per flow', default=100)
+        parser.add_argument('--host', type=str, help='Host header to send', default='localhost')
+
+    def handle(self, *args, **options):
+        from salon_management.models import Service
+
+        try:
+            customer = User.objects.get(email=options['customer'], role='customer')
+            service = Service.objects.get(pk=options['service'], salon_id=options['salon'])
+        except (User.DoesNotExist, Service.DoesNotExist) as exc:
+            raise CommandError(str(exc))
+
+        client = Client(HTTP_HOST=options['host'])
+        client.force_login(customer)
+
+        # API bookings are committed, so their on-commit work (hold confirms,
+        # availability and counter updates) is part of the timing; they are
+        # deleted again afterwards
+        self._bench_api(client, customer, service, options['bookings'])
+
+        # The legacy flow has no on-commit work and its appointments are
+        # rolled back
+        try:
+            with transaction.atomic():
+                self._bench_session_flow(client, options['bookings'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _report(self, label, requests, bookings, elapsed):
+        self.stdout.write(
+            f'{label:<28} {bookings:>5} bookings, {requests:>5} requests in {elapsed:.2f}s '
+            f'-> {bookings / elapsed:.1f} bookings/s, {requests / elapsed:.1f} req/s'
+        )
+
+    def _slots(self, service, count):
+        slots = []
+        day = date.today() + timedelta(days=1)
+        while len(slots) < count and day < date.today() + timedelta(days=90):
+            for start in find_start_times(service.salon_id, day, service, step_minutes=30):
+                slots.append((day.isoformat(), start))
+            day += timedelta(days=1)
+        return slots[:count]
+
+    def _bench_api(self, client, customer, service, count):
+        from booking_system.models import Booking
+
+        url = reverse('customer:api_create_booking')
+        slots = self._slots(service, count)
+        if not slots:
+            self.stdout.write(self.style.WARNING('No free slots found for the API benchmark.'))
+            return
+        keys = [str(uuid.uuid4()) for _ in slots]
+
+        booking_ids = []
+        try:
+            started = time.perf_counter()
+            for key, (day, start) in zip(keys, slots):
+                response = client.post(url, {
+                    'salon': service.salon_id,
+                    'service': service.id,
+                    'appointment_date': day,
+                    'appointment_time': start,
+                }, HTTP_IDEMPOTENCY_KEY=key)
+                if response.status_code == 201:
+                    booking_ids.append(response.json()['id'])
+            self._report('API (one POST)', len(slots), len(booking_ids), time.perf_counter() - started)
+
+            started = time.perf_counter()
+            for key, (day, start) in zip(keys, slots):
+                client.post(url, {
+                    'salon': service.salon_id,
+                    'service': service.id,
+                    'appointment_date': day,
+                    'appointment_time': start,
+                }, HTTP_IDEMPOTENCY_KEY=key)
+            self._report('API retries (replayed)', len(slots), 0, time.perf_counter() - started)
+        finally:
+            # Deleted one by one so the delete signals give the slots back
+            for booking in Booking.objects.filter(id__in=booking_ids):
+                booking.delete()
+            cache.delete_many([idempotency_cache_key(customer.id, key) for key in keys])
+
+    def _bench_session_flow(self, client, count):
+        try:
+            booking_url = reverse('booking')
+            submit_url = reverse('bookingSubmit')
+        except NoReverseMatch:
+            self.stdout.write(self.style.WARNING('Session-based booking URLs are not installed; skipped.'))
+            return
+
+        times = ['3 PM', '3:30 PM', '4 PM', '4:30 PM', '5 PM', '5:30 PM', '6 PM', '6:30 PM', '7 PM', '7:30 PM']
+        days = [
+            day for day in (date.today() + timedelta(days=offset) for offset in range(22))
+            if day.strftime('%A') in ('Monday', 'Wednesday', 'Saturday')
+        ]
+        attempts = [(day.isoformat(), slot) for day in days for slot in times][:count]
+
+        requests = booked = 0
+        started = time.perf_counter()
+        for day, slot in attempts:
+            client.get(booking_url)
+            client.post(booking_url, {'service': 'Other', 'day': day})
+            client.get(submit_url)
+            response = client.post(submit_url, {'time': slot})
+            requests += 4
+            # A saved appointment redirects; a rejected one renders the form again
+            booked += response.status_code == 302
+        self._report('Session flow (4 requests)', requests, booked, time.perf_counter() - started)
@@ -0,0 +1,61 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from .profile_imports import BOOT_SCRIPT, FIRST_REQUEST_SCRIPT, import_times
+
+
+class Command(BaseCommand):
+    help = 'Time how long a fresh worker takes to set up Django and load the URLconf'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, help='Fresh interpreters to start', default=10)
+        parser.add_argument('--budget-ms', type=float,
+                            help='Fail if the median boot takes longer than this (for CI)')
+        parser.add_argument('--top', type=int, help='Project modules to list', default=10)
+
+    def handle(self, *args, **options):
+        # Baseline: an interpreter that does nothing, to separate Python's own start-up
+        baseline = self._median([sys.executable, '-c', 'pass'], options['runs'])
+        boot = self._median([sys.executable, '-c', BOOT_SCRIPT], options['runs'])
+        first_request = self._median([sys.executable, '-c', FIRST_REQUEST_SCRIPT], options['runs'])
+
+        self.stdout.write(f'Interpreter start-up: {baseline:.1f} ms')
+        self.stdout.write(f'Worker boot:          {boot:.1f} ms (median of {options["runs"]})')
+        self.stdout.write(f'Deferred to the first request (forms, API): {first_request - boot:.1f} ms')
+        self.stdout.write(self.style.SUCCESS(f'Django and app imports: {boot - baseline:.1f} ms'))
+
+        # Project modules imported at boot, including what AppConfig.ready() loads
+        packages = self._project_packages()
+        rows = [row for row in import_times() if row[0].split('.')[0] in packages]
+        self.stdout.write('Project modules imported at boot (cumulative):')
+        for module, _, cumulative_us in sorted(rows, key=lambda row: -row[2])[:options['top']]:
+            self.stdout.write(f'  {module:<50} {cumulative_us / 1000:>8.1f} ms')
+
+        if options['budget_ms'] is not None and boot > options['budget_ms']:
+            raise CommandError(f'Worker boot took {boot:.1f} ms, over the {options["budget_ms"]:.0f} ms budget')
+
+    def _project_packages(self):
+        # Not the working directory: the command may be run from anywhere
+        base_dir = getattr(settings, 'BASE_DIR', None)
+        root = str(base_dir) if base_dir else os.path.dirname(apps.get_app_config('user_accounts').path)
+        return {
+            config.name.split('.')[0] for config in apps.get_app_configs()
+            if os.path.abspath(config.path).startswith(os.path.abspath(root))
+        }
+
+    def _median(self, command, runs):
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            result = subprocess.run(command, capture_output=True, text=True)
+            timings.append((time.perf_counter() - started) * 1000)
+            if result.returncode != 0:
+                raise CommandError(f'Boot failed:\n{result.stderr[-2000:]}')
+        return statistics.median(timings)
@@ -0,0 +1,149 @@
+import importlib
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+
+INDEX_MIGRATION = 'user_accounts.migrations.0006_booking_notification_indexes'
+
+
+class _Rollback(Exception):
+    pass
+
+
+class _Recorder:
+    """Keeps the statements as sent, with their parameters, so EXPLAIN sees what the query saw"""
+
+    def __init__(self, executed):
+        self.executed = executed
+
+    def __call__(self, execute, sql, params, many, context):
+        self.executed.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Show EXPLAIN plans and timings of the booking and notification queries with and without '
+        'the indexes of migration 0006. Run it on a seeded benchmark database (generate_synthetic_data): '
+        'the "before" run drops the indexes inside a transaction that is rolled back, which locks the tables'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, help='Timed runs per query', default=20)
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE (PostgreSQL)')
+        parser.add_argument('--no-plans', action='store_true', help='Only print timings')
+
+    def handle(self, *args, **options):
+        from booking_system.models import Booking, Notification
+
+        if not Booking.objects.exists():
+            raise CommandError('No bookings; seed the database with generate_synthetic_data first')
+
+        cases = self.cases(Booking, Notification)
+        after = self.measure(cases, options, 'with indexes')
+        try:
+            with transaction.atomic():
+                self.drop_indexes()
+                before = self.measure(cases, options, 'without indexes')
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        for name, _ in cases:
+            (before_ms, before_plan), (after_ms, after_plan) = before[name], after[name]
+            speedup = before_ms / after_ms if after_ms else float('inf')
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{name}: {before_ms:.2f} ms -> {after_ms:.2f} ms ({speedup:.1f}x)'
+            ))
+            if not options['no_plans']:
+                self.stdout.write('  Before:')
+                self.stdout.write(self._indent(before_plan))
+                self.stdout.write('  After:')
+                self.stdout.write(self._indent(after_plan))
+
+        total_before = sum(ms for ms, _ in before.values())
+        total_after = sum(ms for ms, _ in after.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'All queries: {total_before:.1f} ms -> {total_after:.1f} ms (median per run, summed)'
+        ))
+
+    def cases(self, Booking, Notification):
+        """``(name, callable)`` for each access path, run against the busiest users"""
+        from salon_management.models import Salon
+
+        today = timezone.localdate()
+        customer_id = (
+            Booking.objects.values('customer_id').annotate(total=Count('id')).order_by('-total')[0]['customer_id']
+        )
+        salon_id = Booking.objects.values('salon_id').annotate(total=Count('id')).order_by('-total')[0]['salon_id']
+        owner_id = Salon.objects.filter(pk=salon_id).values_list('owner_id', flat=True)[0]
+        busy_day = (
+            Booking.objects.filter(salon_id=salon_id).values('appointment_date')
+            .annotate(total=Count('id')).order_by('-total')[0]['appointment_date']
+        )
+        customer_bookings = Booking.objects.filter(customer_id=customer_id)
+        owner_bookings = Booking.objects.filter(salon__owner_id=owner_id)
+        notifications = Notification.objects.filter(user_id=customer_id)
+
+        return [
+            ('customer upcoming', lambda: list(customer_bookings.filter(
+                appointment_date__gte=today, status__in=['pending', 'confirmed'],
+            ).order_by('appointment_date', 'appointment_time')[:5])),
+            ('customer recent', lambda: list(customer_bookings.order_by('-created_at')[:5])),
+            ('customer pending count', lambda: customer_bookings.filter(status='pending').count()),
+            ('owner pending count', lambda: owner_bookings.filter(status='pending').count()),
+            ('owner today count', lambda: owner_bookings.filter(appointment_date=today).count()),
+            ('owner recent', lambda: list(owner_bookings.order_by('-created_at')[:5])),
+            ('owner bookings page', lambda: list(owner_bookings.order_by('-appointment_date', '-appointment_time')[:50])),
+            ('owner pending on a day', lambda: list(owner_bookings.filter(
+                status='pending', appointment_date=busy_day,
+            ).values_list('id', flat=True))),
+            ('salon day schedule', lambda: list(Booking.objects.filter(
+                salon_id=salon_id, appointment_date=busy_day, status__in=['pending', 'confirmed'],
+            ).values_list('appointment_time', 'service__duration', 'staff_id'))),
+            ('admin recent bookings', lambda: list(Booking.objects.order_by('-created_at')[:50])),
+            ('notifications page', lambda: list(notifications.order_by('-created_at')[:50])),
+            ('unread notifications', lambda: notifications.filter(is_read=False).count()),
+        ]
+
+    def measure(self, cases, options, phase):
+        """``{name: (median ms, plan)}``"""
+        results = {}
+        for name, run in cases:
+            executed = []
+            with connection.execute_wrapper(_Recorder(executed)):
+                run()
+            timings = []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                run()
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (statistics.median(timings), self.plan(*executed[-1], options, phase))
+        return results
+
+    def plan(self, sql, params, options, phase):
+        explain_options = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+        prefix = connection.ops.explain_query_prefix(**explain_options)
+        with connection.cursor() as cursor:
+            # The comment keeps SQLite from reusing the cached plan of the other phase
+            cursor.execute(f'/* {phase} */ {prefix} {sql}', params)
+            # PostgreSQL returns one line per row; SQLite puts the step in the last column
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def drop_indexes(self):
+        from django.apps import apps
+
+        migration = importlib.import_module(INDEX_MIGRATION)
+        # Only used to build the statements: SQLite's editor can't be entered inside a transaction
+        schema_editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for app_label, model_name, index in migration.INDEXES:
+                cursor.execute(str(index.remove_sql(apps.get_model(app_label, model_name), schema_editor)))
+
+    def _indent(self, plan):
+        return '\n'.join(f'    {line}' for line in plan.splitlines())
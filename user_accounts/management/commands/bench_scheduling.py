@@ -0,0 +1,86 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+
+from user_accounts.availability import ACTIVE_BOOKING_STATUSES
+from user_accounts.scheduling import DaySchedule, TICK_MINUTES, interval_mask, load_day
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the scheduling engine on a synthetic busy salon-day, then load_day on the '
+        'busiest salon-day in the database (seed it with generate_synthetic_data)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bookings', type=int, help='Bookings on the salon-day', default=5000)
+        parser.add_argument('--staff', type=int, help='Staff members at the salon', default=400)
+        parser.add_argument('--repeat', type=int, help='Lookups per service length', default=20)
+        parser.add_argument('--seed', type=int, help='Random seed', default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        open_mask = interval_mask(9 * 60, 12 * 60)
+        lengths = [15, 30, 45, 60, 90, 120]
+        bookings = [
+            (rng.randrange(9 * 60, 20 * 60, TICK_MINUTES), rng.choice(lengths))
+            for _ in range(options['bookings'])
+        ]
+        bookings.sort()
+
+        started = time.perf_counter()
+        schedule = DaySchedule(open_mask, range(1, options['staff'] + 1))
+        for start_minute, length in bookings:
+            schedule.book(start_minute, length)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        self.stdout.write(
+            f'Loaded {len(bookings)} bookings on {options["staff"]} staff '
+            f'in {build_ms:.1f} ms ({schedule.unplaced} could not be placed)'
+        )
+
+        for length in lengths + [180, 240]:
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                starts = schedule.feasible_starts(length)
+            per_call = (time.perf_counter() - started) * 1000 / options['repeat']
+            self.stdout.write(f'  {length:>3} min service: {len(starts):>3} start times in {per_call:.3f} ms')
+
+        started = time.perf_counter()
+        for start_minute, length in bookings[:1000]:
+            schedule.assign(start_minute, length)
+        per_check = (time.perf_counter() - started) * 1e6 / min(1000, len(bookings))
+        self.stdout.write(self.style.SUCCESS(f'Conflict check: {per_check:.1f} us per booking'))
+
+        self.bench_load_day(options['repeat'])
+
+    def bench_load_day(self, repeat):
+        """Time building a schedule from the database, queries included"""
+        from booking_system.models import Booking
+
+        busiest = (
+            Booking.objects.filter(status__in=ACTIVE_BOOKING_STATUSES)
+            .values('salon_id', 'appointment_date').annotate(total=Count('id')).order_by('-total').first()
+        )
+        if busiest is None:
+            self.stdout.write('No bookings in the database; seed it with generate_synthetic_data to time load_day')
+            return
+
+        salon_id, day = busiest['salon_id'], busiest['appointment_date']
+        # The first call compiles and caches the opening hours
+        load_day(salon_id, day)
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                load_day(salon_id, day)
+                timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(self.style.SUCCESS(
+            f'load_day on salon {salon_id}, {day}: {busiest["total"]} bookings, '
+            f'{len(queries)} queries, {statistics.median(timings):.2f} ms (median)'
+        ))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from user_accounts.tiered_cache import get_cache
+
+
+class Command(BaseCommand):
+    help = 'Show hit, miss and latency stats of the two-tier cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('namespaces', nargs='*', default=['tiered', 'fragments'],
+                            help='Cache namespaces to report (default: tiered fragments)')
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        for namespace in options['namespaces']:
+            cache = get_cache(namespace)
+            stats = cache.stats()
+            self.stdout.write(self.style.MIGRATE_HEADING(namespace))
+            self.stdout.write(f'  Lookups:          {stats["lookups"]}')
+            self.stdout.write(f'  L1 hits:          {stats["l1_hits"]} ({stats["l1_hit_rate"]:.1%})')
+            self.stdout.write(f'  L2 hits:          {stats["l2_hits"]}')
+            self.stdout.write(f'  Misses:           {stats["misses"]}')
+            self.stdout.write(f'  Early refreshes:  {stats["early_refreshes"]}')
+            self.stdout.write(f'  Coalesced waits:  {stats["coalesced"]}')
+            self.stdout.write(f'  Computes:         {stats["computes"]} (mean {stats["mean_compute_ms"]:.2f}ms)')
+            self.stdout.write(self.style.SUCCESS(
+                f'  Hit rate: {stats["hit_rate"]:.1%}, mean lookup: {stats["mean_lookup_ms"]:.3f}ms'
+            ))
+            if options['reset']:
+                cache.reset_stats()
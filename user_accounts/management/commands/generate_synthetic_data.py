@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user_accounts.synthetic_data import generate
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with deterministic, realistically skewed users, salons and bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, help='Users across all roles', default=10000)
+        parser.add_argument('--salons', type=int, help='Salons (default: one per 50 users)')
+        parser.add_argument('--bookings', type=int, help='Bookings, with their reviews, notifications and payments',
+                            default=1_000_000)
+        parser.add_argument('--days', type=int, help='Days of booking history before today', default=365)
+        parser.add_argument('--seed', type=int, help='Same seed, same data', default=42)
+        parser.add_argument('--batch-size', type=int, help='Rows per insert and transaction', default=5000)
+        parser.add_argument('--copy', action='store_true',
+                            help='Load the booking tables with COPY (PostgreSQL only)')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            loader = generate(
+                users=options['users'], salons=options['salons'], bookings=options['bookings'],
+                seed=options['seed'], days=options['days'], batch_size=options['batch_size'],
+                use_copy=options['copy'], log=self.stdout.write,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        if options['copy'] and not loader.use_copy:
+            self.stdout.write(self.style.WARNING('COPY needs PostgreSQL; used bulk inserts instead'))
+
+        self.stdout.write(f'{"Model":<32} {"Rows":>12} {"Seconds":>9} {"Rows/s":>10}')
+        total = 0
+        for name, count, seconds, rate in loader.report():
+            total += count
+            self.stdout.write(f'{name:<32} {count:>12,} {seconds:>9.1f} {rate:>10,.0f}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{total:,} rows in {elapsed:.1f} s ({total / elapsed if elapsed else 0:,.0f} rows/s)'
+        ))
+        self.stdout.write(
+            'Bulk inserts skip signals: run reconcile_profile_counters, rebuild rollups '
+            'and run ANALYZE before benchmarking.'
+        )
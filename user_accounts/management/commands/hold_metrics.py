@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from user_accounts.holds import hold_metrics
+
+
+class Command(BaseCommand):
+    help = 'Show slot hold conversion and expiry metrics'
+
+    def handle(self, *args, **options):
+        metrics = hold_metrics()
+        self.stdout.write(f'Holds placed:    {metrics["placed"]}')
+        self.stdout.write(f'Converted:       {metrics["converted"]}')
+        self.stdout.write(f'Released early:  {metrics["released"]}')
+        self.stdout.write(f'Expired/live:    {metrics["expired"]}')
+        self.stdout.write(f'Rejected:        {metrics["rejected"]} (slot already held)')
+        self.stdout.write(f'Confirmed late:  {metrics["lost"]} (hold had expired)')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Conversion rate: {metrics["conversion_rate"]:.1%}, '
+                f'expiry rate: {metrics["expiry_rate"]:.1%}'
+            )
+        )
@@ -0,0 +1,78 @@
+import io
+import pstats
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user_accounts.models import User
+from user_accounts.request_profiling import PROFILE_DIR, TOKEN_MAX_AGE, load_profiles, make_token, stats_path
+
+
+class Command(BaseCommand):
+    help = 'List saved request profiles, summarize one, or issue a profiling token'
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile_id', nargs='?', help='Summarize this profile')
+        parser.add_argument('--limit', type=int, help='Profiles to list', default=20)
+        parser.add_argument('--view', help='Only list profiles of this URL name, e.g. customer:dashboard')
+        parser.add_argument('--top', type=int, help='Functions and queries to show in a summary', default=15)
+        parser.add_argument('--token', metavar='EMAIL', help='Print a profiling token for this admin')
+
+    def handle(self, *args, **options):
+        if options['token']:
+            return self._token(options['token'])
+        if options['profile_id']:
+            return self._summarize(options['profile_id'], options['top'])
+
+        profiles = load_profiles()
+        if options['view']:
+            profiles = [meta for meta in profiles if meta['view'] == options['view']]
+        if not profiles:
+            self.stdout.write(f'No profiles in {PROFILE_DIR}')
+            return
+        for meta in profiles[:options['limit']]:
+            self.stdout.write(
+                f'{meta["id"]:<60} {meta["method"]:<6} {meta["status"]}  '
+                f'{meta["wall_ms"]:>9.1f} ms  {meta["query_count"]:>4} queries ({meta["sql_ms"]:.1f} ms)'
+            )
+
+    def _token(self, email):
+        try:
+            user = User.objects.get(email=email)
+        except User.DoesNotExist:
+            raise CommandError(f'No user with email {email}')
+        if not user.is_admin:
+            raise CommandError(f'{email} is not an admin')
+        self.stdout.write(make_token(user))
+        self.stderr.write(
+            f'Send it as "X-Profile: <token>" or ?_profile=<token> while logged in as {email}; '
+            f'valid for {TOKEN_MAX_AGE // 60} minutes.'
+        )
+
+    def _summarize(self, profile_id, top):
+        meta = next((meta for meta in load_profiles() if meta['id'] == profile_id), None)
+        if meta is None:
+            raise CommandError(f'No profile {profile_id} in {PROFILE_DIR}')
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{meta["method"]} {meta["path"]} ({meta["view"]})'))
+        self.stdout.write(f'  Status {meta["status"]} at {meta["created_at"]}, user {meta["user_id"]}')
+        self.stdout.write(
+            f'  Wall time {meta["wall_ms"]:.1f} ms, {meta["query_count"]} queries taking {meta["sql_ms"]:.1f} ms'
+        )
+
+        out = io.StringIO()
+        stats = pstats.Stats(stats_path(profile_id), stream=out)
+        stats.strip_dirs().sort_stats('cumulative').print_stats(top)
+        self.stdout.write(self.style.MIGRATE_HEADING('Functions by cumulative time:'))
+        self.stdout.write(out.getvalue().split('\n\n', 1)[-1].rstrip())
+
+        queries = meta['queries']
+        self.stdout.write(self.style.MIGRATE_HEADING('Slowest queries:'))
+        for query in sorted(queries, key=lambda query: -query['ms'])[:top]:
+            self.stdout.write(f'  {query["ms"]:>8.2f} ms  {query["sql"][:160]}')
+
+        repeated = [(sql, count) for sql, count in Counter(query['sql'] for query in queries).most_common(top) if count > 1]
+        if repeated:
+            self.stdout.write(self.style.WARNING('Repeated queries (possible N+1):'))
+            for sql, count in repeated:
+                self.stdout.write(f'  {count:>4}x  {sql[:160]}')
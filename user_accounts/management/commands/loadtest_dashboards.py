@@ -0,0 +1,110 @@
+import http.client
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from user_accounts.models import User
+
+
+DASHBOARDS = {
+    'customer': 'customer:dashboard',
+    'salon_owner': 'salon_owner:dashboard',
+    'admin': 'user_admin:dashboard',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test the dashboards of a running server and report requests/s and latency percentiles. '
+        'Run it once against a WSGI server (e.g. gunicorn salon.wsgi) and once against an ASGI server '
+        '(e.g. uvicorn salon.asgi:application) with the same worker count to compare them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', type=str, default='http://127.0.0.1:8000', help='Server to test')
+        parser.add_argument('--user', type=str, action='append', required=True,
+                            help='Email of a user whose dashboard to load; repeat for several roles')
+        parser.add_argument('--concurrency', type=int, default=32, help='Simultaneous connections')
+        parser.add_argument('--duration', type=float, default=20.0, help='Seconds to run per dashboard')
+        parser.add_argument('--label', type=str, default='', help='Label for the report, e.g. wsgi or asgi')
+
+    def handle(self, *args, **options):
+        target = urlsplit(options['base_url'])
+        if target.scheme not in ('http', 'https') or not target.hostname:
+            raise CommandError('--base-url must look like http://host:port')
+
+        for email in options['user']:
+            try:
+                user = User.objects.get(email=email)
+            except User.DoesNotExist:
+                raise CommandError(f'No user with email {email}')
+            role = 'admin' if user.is_admin else user.role
+            path = reverse(DASHBOARDS[role])
+
+            # A logged-in session cookie, created the same way the test client does it
+            client = Client()
+            client.force_login(user)
+            cookie = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+            latencies, errors, elapsed = self._run(target, path, cookie, options['concurrency'], options['duration'])
+            self._report(options['label'], path, latencies, errors, elapsed)
+
+    def _run(self, target, path, cookie, concurrency, duration):
+        connection_class = http.client.HTTPSConnection if target.scheme == 'https' else http.client.HTTPConnection
+        deadline = time.perf_counter() + duration
+        lock = threading.Lock()
+        latencies = []
+        errors = [0]
+
+        def worker():
+            connection = connection_class(target.hostname, target.port, timeout=30)
+            timings = []
+            failed = 0
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers={'Cookie': cookie, 'Host': target.netloc})
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status != 200:
+                        failed += 1
+                        continue
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    connection.close()
+                    connection = connection_class(target.hostname, target.port, timeout=30)
+                    continue
+                timings.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                latencies.extend(timings)
+                errors[0] += failed
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(worker)
+        return latencies, errors[0], time.perf_counter() - started
+
+    def _report(self, label, path, latencies, errors, elapsed):
+        prefix = f'[{label}] ' if label else ''
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f'{prefix}{path}: no successful requests ({errors} errors)'))
+            return
+        latencies.sort()
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        self.stdout.write(
+            f'{prefix}{path:<28} {len(latencies) / elapsed:8.1f} req/s  '
+            f'mean {statistics.mean(latencies) * 1000:7.1f}ms  p50 {percentile(0.50):7.1f}ms  '
+            f'p99 {percentile(0.99):7.1f}ms  errors {errors}'
+        )
@@ -0,0 +1,61 @@
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+BOOT_SCRIPT = (
+    'import django; django.setup(); '
+    'from django.urls import get_resolver; get_resolver().url_patterns'
+)
+# Boot plus the modules the views defer to their first request (see user_accounts.lazy)
+FIRST_REQUEST_SCRIPT = BOOT_SCRIPT + '; import user_accounts.forms, user_accounts.api'
+
+
+def import_times(script=BOOT_SCRIPT):
+    """``(module, self_us, cumulative_us)`` for every module a fresh worker imports running ``script``"""
+    # The child inherits DJANGO_SETTINGS_MODULE from manage.py
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', script],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise CommandError(f'Boot failed:\n{result.stderr[-2000:]}')
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        rows.append((module.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Show which modules a worker spends its start-up time importing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, help='Modules to list', default=25)
+        parser.add_argument('--package', help='Only list modules of this top-level package')
+
+    def handle(self, *args, **options):
+        rows = import_times()
+        total_us = sum(self_us for _, self_us, _ in rows)
+
+        per_package = defaultdict(int)
+        for module, self_us, _ in rows:
+            per_package[module.split('.')[0]] += self_us
+
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'{len(rows)} modules imported in {total_us / 1000:.1f} ms'
+        ))
+        self.stdout.write('By package (self time):')
+        for package, self_us in sorted(per_package.items(), key=lambda item: -item[1])[:options['top']]:
+            self.stdout.write(f'  {package:<40} {self_us / 1000:>8.1f} ms  {self_us / total_us:>6.1%}')
+
+        if options['package']:
+            rows = [row for row in rows if row[0].split('.')[0] == options['package']]
+        self.stdout.write('Slowest modules (cumulative, including what they import):')
+        for module, _, cumulative_us in sorted(rows, key=lambda row: -row[2])[:options['top']]:
+            self.stdout.write(f'  {module:<60} {cumulative_us / 1000:>8.1f} ms')
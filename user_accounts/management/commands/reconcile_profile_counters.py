@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from user_accounts.models import CustomerProfile, SalonOwnerProfile
+from user_accounts.profile_counters import RECONCILE_BATCH_SIZE, reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recount the booking and salon counters on customer and salon owner profiles and repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Profiles locked and recounted per transaction',
+                            default=RECONCILE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without repairing it')
+
+    def handle(self, *args, **options):
+        verb = 'would repair' if options['dry_run'] else 'repaired'
+        for model in (CustomerProfile, SalonOwnerProfile):
+            checked = repaired = 0
+            for count, drifted in reconcile(model, options['batch_size'], options['dry_run']):
+                checked += count
+                repaired += len(drifted)
+                if options['verbosity'] > 1:
+                    for profile, changes in drifted:
+                        details = ', '.join(f'{field} {stored} -> {counted}' for field, (stored, counted) in changes.items())
+                        self.stdout.write(f'  {model.__name__} of user {profile.user_id}: {details}')
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural.capitalize()}: checked {checked}, {verb} {repaired}'
+            ))
@@ -0,0 +1,30 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from user_accounts.db_router import REPLICA_DB
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary database into the SQLite replica (simulates replication for local testing)'
+
+    def handle(self, *args, **options):
+        if REPLICA_DB not in settings.DATABASES:
+            raise CommandError(f'No "{REPLICA_DB}" database is configured.')
+        primary, replica = settings.DATABASES[DEFAULT_DB_ALIAS], settings.DATABASES[REPLICA_DB]
+        for config in (primary, replica):
+            if config['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError('Both databases must use the SQLite backend; use real replication otherwise.')
+        if str(primary['NAME']) == str(replica['NAME']):
+            raise CommandError('The primary and the replica point at the same file.')
+
+        source = sqlite3.connect(str(primary['NAME']))
+        target = sqlite3.connect(str(replica['NAME']))
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+        self.stdout.write(self.style.SUCCESS(f'Copied {primary["NAME"]} to {replica["NAME"]}'))
@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.shortcuts import redirect
 from django.contrib import messages
 from django.urls import reverse, resolve
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils.deprecation import MiddlewareMixin
 
+from . import page_versions
+
 
 class RoleBasedAccessMiddleware(MiddlewareMixin):
     """
@@ -126,7 +130,54 @@ class SessionSecurityMiddleware(MiddlewareMixin):
                 logout(request)
                 return redirect('accounts:login')
             
-            # Update session with current role
-            request.session['user_role'] = current_role
+            # Update session with current role (only when it changes, so the
+            # session is not saved again on every request)
+            if session_role != current_role:
+                request.session['user_role'] = current_role
+        
+        return None
+
+class ConditionalGetMiddleware(MiddlewareMixin):
+    """
+    Answer revalidations of public pages with 304 before the view runs.
+    
+    Must come after the authentication and message middleware.
+    """
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ('GET', 'HEAD') or request.resolver_match is None:
+            return None
         
-        return None
\ No newline at end of file
+        view_name = request.resolver_match.view_name
+        if view_name not in page_versions.PAGE_VALIDATORS:
+            return None
+        
+        # A page carrying a flash message must be rendered. Without a session
+        # cookie there is no session to load, so anonymous visitors skip it
+        if 'messages' in request.COOKIES:
+            return None
+        if settings.SESSION_COOKIE_NAME in request.COOKIES and request.session.get('_messages'):
+            return None
+        
+        etag = page_versions.page_etag(view_name, request, view_kwargs)
+        if etag is None:
+            return None
+        
+        request.page_etag = etag
+        return get_conditional_response(request, etag=etag)
+    
+    def process_response(self, request, response):
+        etag = getattr(request, 'page_etag', None)
+        if etag is None or response.status_code not in (200, 304):
+            return response
+        
+        if not response.has_header('ETag'):
+            response['ETag'] = etag
+        # No Last-Modified: the page differs per viewer, a date cannot (see page_versions)
+        
+        # Shared caches may keep anonymous pages; everyone revalidates each time
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        return response
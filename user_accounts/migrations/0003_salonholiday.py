@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon_management', '0001_initial'),
+        ('user_accounts', '0002_alter_user_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalonHoliday',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('is_closed', models.BooleanField(default=True)),
+                ('open_time', models.TimeField(blank=True, null=True)),
+                ('close_time', models.TimeField(blank=True, null=True)),
+                ('note', models.CharField(blank=True, max_length=100)),
+                ('salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holidays', to='salon_management.salon')),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('salon', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 10:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('salon_management', '0001_initial'),
+        ('user_accounts', '0003_salonholiday'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SalonDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('total_bookings', models.IntegerField(default=0)),
+                ('pending_bookings', models.IntegerField(default=0)),
+                ('confirmed_bookings', models.IntegerField(default=0)),
+                ('completed_bookings', models.IntegerField(default=0)),
+                ('cancelled_bookings', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('service_counts', models.JSONField(default=dict)),
+                ('hourly_counts', models.JSONField(default=dict)),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='salon_management.salon')),
+            ],
+            options={
+                'ordering': ['-date'],
+                'unique_together': {('salon', 'date')},
+            },
+        ),
+    ]
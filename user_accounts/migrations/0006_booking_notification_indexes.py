@@ -0,0 +1,68 @@
+from django.db import migrations, models
+
+
+# Composite and partial indexes for the booking and notification access paths
+# of the dashboards, lists and scheduling. The models live in booking_system,
+# so the indexes are created here against its tables. On PostgreSQL they are
+# built with CREATE INDEX CONCURRENTLY so the tables stay writable.
+INDEXES = [
+    # Customer dashboard: upcoming bookings in date order; booking history read backwards
+    ('booking_system', 'Booking', models.Index(
+        fields=['customer', 'appointment_date', 'appointment_time'], name='booking_customer_date_idx',
+    )),
+    # Customer dashboard: most recent bookings
+    ('booking_system', 'Booking', models.Index(fields=['customer', '-created_at'], name='booking_customer_created_idx')),
+    # Owner bookings list, today's bookings, day schedules and rollups
+    ('booking_system', 'Booking', models.Index(
+        fields=['salon', 'appointment_date', 'appointment_time'], name='booking_salon_date_idx',
+    )),
+    # Pending counts and bulk moderation of a day's pending bookings
+    ('booking_system', 'Booking', models.Index(
+        fields=['salon', 'appointment_date'], condition=models.Q(status='pending'), name='booking_salon_pending_idx',
+    )),
+    # Admin bookings list, and recent bookings across an owner's salons
+    ('booking_system', 'Booking', models.Index(fields=['-created_at'], name='booking_created_idx')),
+    # Notifications page, newest first
+    ('booking_system', 'Notification', models.Index(fields=['user', '-created_at'], name='notification_user_created_idx')),
+    # Unread notifications
+    ('booking_system', 'Notification', models.Index(
+        fields=['user'], condition=models.Q(is_read=False), name='notification_user_unread_idx',
+    )),
+]
+
+
+def _concurrently(schema_editor):
+    return schema_editor.connection.vendor == 'postgresql'
+
+
+def create_indexes(apps, schema_editor):
+    for app_label, model_name, index in INDEXES:
+        model = apps.get_model(app_label, model_name)
+        if _concurrently(schema_editor):
+            schema_editor.execute(index.create_sql(model, schema_editor, concurrently=True))
+        else:
+            schema_editor.add_index(model, index)
+
+
+def drop_indexes(apps, schema_editor):
+    for app_label, model_name, index in INDEXES:
+        model = apps.get_model(app_label, model_name)
+        if _concurrently(schema_editor):
+            schema_editor.execute(index.remove_sql(model, schema_editor, concurrently=True))
+        else:
+            schema_editor.remove_index(model, index)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('booking_system', '__first__'),
+        ('user_accounts', '0005_archivedbooking_archivedpayment_archivedappointment'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
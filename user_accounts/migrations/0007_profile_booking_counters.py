@@ -0,0 +1,58 @@
+# Generated by Django 4.2.7 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_accounts', '0006_booking_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customerprofile',
+            name='pending_bookings',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customerprofile',
+            name='confirmed_bookings',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customerprofile',
+            name='completed_bookings',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='customerprofile',
+            name='cancelled_bookings',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='salonownerprofile',
+            name='total_bookings',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='salonownerprofile',
+            name='pending_bookings',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='salonownerprofile',
+            name='confirmed_bookings',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='salonownerprofile',
+            name='completed_bookings',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='salonownerprofile',
+            name='cancelled_bookings',
+            field=models.IntegerField(default=0),
+        ),
+    ]
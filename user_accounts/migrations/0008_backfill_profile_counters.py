@@ -0,0 +1,70 @@
+from collections import Counter, defaultdict
+
+from django.db import migrations
+from django.db.models import Count
+
+
+# The counters added in 0007 start at zero; recount them from the existing
+# live and archived bookings and salons. The signal handlers keep them up to
+# date from here on.
+STATUS_FIELDS = {
+    'pending': 'pending_bookings',
+    'confirmed': 'confirmed_bookings',
+    'completed': 'completed_bookings',
+    'cancelled': 'cancelled_bookings',
+}
+CUSTOMER_FIELDS = ['total_bookings', *STATUS_FIELDS.values()]
+OWNER_FIELDS = ['total_salons', *CUSTOMER_FIELDS]
+BATCH_SIZE = 500
+
+
+def _add_bookings(counts, user_id, status, count):
+    counts[user_id]['total_bookings'] += count
+    if status in STATUS_FIELDS:
+        counts[user_id][STATUS_FIELDS[status]] += count
+
+
+def _store(model, counts, fields):
+    last_id = 0
+    while True:
+        profiles = list(model.objects.filter(pk__gt=last_id).order_by('pk')[:BATCH_SIZE])
+        if not profiles:
+            return
+        last_id = profiles[-1].pk
+        for profile in profiles:
+            counted = counts.get(profile.user_id, Counter())
+            for field in fields:
+                setattr(profile, field, counted[field])
+        model.objects.bulk_update(profiles, fields)
+
+
+def backfill_counters(apps, schema_editor):
+    Booking = apps.get_model('booking_system', 'Booking')
+    ArchivedBooking = apps.get_model('user_accounts', 'ArchivedBooking')
+    Salon = apps.get_model('salon_management', 'Salon')
+
+    customers = defaultdict(Counter)
+    owners = defaultdict(Counter)
+    for model in (Booking, ArchivedBooking):
+        for row in model.objects.values('customer_id', 'status').annotate(count=Count('id')).order_by():
+            _add_bookings(customers, row['customer_id'], row['status'], row['count'])
+        for row in model.objects.values('salon__owner_id', 'status').annotate(count=Count('id')).order_by():
+            _add_bookings(owners, row['salon__owner_id'], row['status'], row['count'])
+    for row in Salon.objects.values('owner_id').annotate(count=Count('id')).order_by():
+        owners[row['owner_id']]['total_salons'] += row['count']
+
+    _store(apps.get_model('user_accounts', 'CustomerProfile'), customers, CUSTOMER_FIELDS)
+    _store(apps.get_model('user_accounts', 'SalonOwnerProfile'), owners, OWNER_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking_system', '__first__'),
+        ('salon_management', '0001_initial'),
+        ('user_accounts', '0007_profile_booking_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -63,7 +63,12 @@ class CustomerProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='customer_profile')
     preferred_services = models.ManyToManyField('salon_management.Service', blank=True)
     loyalty_points = models.IntegerField(default=0)
+    # Booking counters, live and archived, kept current by profile_counters
     total_bookings = models.IntegerField(default=0)
+    pending_bookings = models.IntegerField(default=0)
+    confirmed_bookings = models.IntegerField(default=0)
+    completed_bookings = models.IntegerField(default=0)
+    cancelled_bookings = models.IntegerField(default=0)
     
     def __str__(self):
         return f"Customer Profile - {self.user.username}"
@@ -76,7 +81,139 @@ class SalonOwnerProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='salon_owner_profile')
     business_license = models.CharField(max_length=100, blank=True, null=True)
     years_of_experience = models.IntegerField(default=0)
+    # Salon and booking counters over all owned salons, kept current by profile_counters
     total_salons = models.IntegerField(default=0)
+    total_bookings = models.IntegerField(default=0)
+    pending_bookings = models.IntegerField(default=0)
+    confirmed_bookings = models.IntegerField(default=0)
+    completed_bookings = models.IntegerField(default=0)
+    cancelled_bookings = models.IntegerField(default=0)
+    
+    def __str__(self):
+        return f"Salon Owner Profile - {self.user.username}"
+
+
+class SalonHoliday(models.Model):
+    """
+    One-off change to a salon's weekly opening hours (holiday or special hours)
+    """
+    salon = models.ForeignKey('salon_management.Salon', on_delete=models.CASCADE, related_name='holidays')
+    date = models.DateField()
+    is_closed = models.BooleanField(default=True)
+    open_time = models.TimeField(blank=True, null=True)
+    close_time = models.TimeField(blank=True, null=True)
+    note = models.CharField(max_length=100, blank=True)
+    
+    class Meta:
+        unique_together = ('salon', 'date')
+        ordering = ['date']
+    
+    def __str__(self):
+        return f"{self.salon} - {self.date}"
+
+
+class SalonDailyStats(models.Model):
+    """
+    Pre-aggregated booking and revenue figures for one salon on one day
+    """
+    salon = models.ForeignKey('salon_management.Salon', on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    total_bookings = models.IntegerField(default=0)
+    pending_bookings = models.IntegerField(default=0)
+    confirmed_bookings = models.IntegerField(default=0)
+    completed_bookings = models.IntegerField(default=0)
+    cancelled_bookings = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # {service name: bookings} and {hour of day: bookings}
+    service_counts = models.JSONField(default=dict)
+    hourly_counts = models.JSONField(default=dict)
+    refreshed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('salon', 'date')
+        ordering = ['-date']
+    
+    def __str__(self):
+        return f"{self.salon} - {self.date}"
+    
+    @property
+    def cancellation_rate(self):
+        return self.cancelled_bookings / self.total_bookings if self.total_bookings else 0
+
+
+class ArchivedBooking(models.Model):
+    """
+    Completed or cancelled booking moved out of the hot bookings table by
+    ``archive_bookings``; keeps the original booking id as its primary key
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('confirmed', 'Confirmed'),
+        ('completed', 'Completed'),
+        ('cancelled', 'Cancelled'),
+    ]
+    
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_bookings')
+    salon = models.ForeignKey('salon_management.Salon', on_delete=models.CASCADE, related_name='archived_bookings')
+    service = models.ForeignKey('salon_management.Service', on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    staff = models.ForeignKey('salon_management.Staff', on_delete=models.SET_NULL, blank=True, null=True, related_name='+')
+    # Copied so history still reads correctly after the service changes or is deleted
+    service_name = models.CharField(max_length=200)
+    price = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    appointment_date = models.DateField()
+    appointment_time = models.TimeField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    is_archived = True
+    
+    class Meta:
+        ordering = ['-appointment_date', '-appointment_time']
+        indexes = [
+            models.Index(fields=['customer', 'appointment_date'], name='archived_booking_customer_idx'),
+            models.Index(fields=['salon', 'appointment_date'], name='archived_booking_salon_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.customer} - {self.service_name} ({self.appointment_date})"
+
+
+class ArchivedPayment(models.Model):
+    """
+    Payment of an archived booking
+    """
+    id = models.BigIntegerField(primary_key=True)
+    booking = models.ForeignKey(ArchivedBooking, on_delete=models.CASCADE, related_name='payments')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Payment {self.id} - {self.amount}"
+
+
+class ArchivedAppointment(models.Model):
+    """
+    Past appointment of the legacy booking app moved out of its hot table
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True, related_name='archived_appointments')
+    service = models.CharField(max_length=50)
+    day = models.DateField()
+    time = models.CharField(max_length=10)
+    time_ordered = models.DateTimeField(blank=True, null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    
+    is_archived = True
+    
+    class Meta:
+        ordering = ['-day']
+        indexes = [
+            models.Index(fields=['user', 'day'], name='archived_appointment_user_idx'),
+        ]
     
     def __str__(self):
-        return f"Salon Owner Profile - {self.user.username}"
\ No newline at end of file
+        return f"{self.user} - {self.service} ({self.day})"
@@ -0,0 +1,193 @@
+"""
+Compiled weekly opening-hours masks.
+
+A salon's ``SalonHours`` rows are compiled into one integer with a bit per
+5-minute tick of the week (Monday 00:00 is bit 0). Holiday overrides from
+``SalonHoliday`` are kept next to it as ``{date: day_mask}``. Each salon has
+its own cache entry that is only recompiled when the underlying rows change,
+so "is this salon open at T" is a cache read and a bit test. Nothing rewrites
+a shared structure: a change replaces the salon's entry and moves everything
+derived from all salons (the approved ids, the "open now" lists) to a new
+version.
+"""
+import uuid
+from datetime import datetime
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .scheduling import FULL_DAY, TICK_MINUTES, TICKS_PER_DAY, opening_mask
+
+
+WEEK_TICKS = 7 * TICKS_PER_DAY
+
+# Recompiled daily at the latest, so holidays that have passed drop out
+COMPILED_TIMEOUT = 60 * 60 * 24
+VERSION_KEY = 'opening_hours:version'
+BATCH_SIZE = 1000
+
+
+def salon_key(salon_id):
+    return f'opening_hours:{salon_id}'
+
+
+def hours_mask(open_time, close_time):
+    """Day mask for an opening period; periods past midnight spill into the next day"""
+    if close_time > open_time:
+        return opening_mask(open_time, close_time)
+    midnight = datetime.min.time()
+    return opening_mask(open_time, datetime.max.time()) | (opening_mask(midnight, close_time) << TICKS_PER_DAY)
+
+
+def _local(moment):
+    moment = moment or timezone.now()
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment)
+    return moment
+
+
+def compile_week(rows):
+    """Compile ``(day, open_time, close_time, is_closed)`` rows into a weekly mask"""
+    week = 0
+    for day, open_time, close_time, is_closed in rows:
+        if is_closed or open_time is None or close_time is None:
+            continue
+        week |= hours_mask(open_time, close_time) << (day * TICKS_PER_DAY)
+    # Sunday night hours wrap around to Monday morning
+    return (week | (week >> WEEK_TICKS)) & ((1 << WEEK_TICKS) - 1)
+
+
+def _compile(salon_id, replace=False):
+    from salon_management.models import SalonHours
+    from .models import SalonHoliday
+
+    rows = SalonHours.objects.filter(salon_id=salon_id).values_list('day', 'open_time', 'close_time', 'is_closed')
+    week = compile_week(rows)
+
+    overrides = {}
+    holidays = SalonHoliday.objects.filter(salon_id=salon_id, date__gte=_local(None).date())
+    for holiday in holidays:
+        if holiday.is_closed or holiday.open_time is None or holiday.close_time is None:
+            overrides[holiday.date] = 0
+        else:
+            overrides[holiday.date] = hours_mask(holiday.open_time, holiday.close_time) & FULL_DAY
+
+    compiled = (week, overrides)
+    if replace:
+        cache.set(salon_key(salon_id), compiled, COMPILED_TIMEOUT)
+    else:
+        # Filling a miss: never overwrite what a concurrent change just compiled
+        cache.add(salon_key(salon_id), compiled, COMPILED_TIMEOUT)
+    return compiled
+
+
+def compile_salon(salon_id):
+    """Recompile one salon's hours and holidays after they changed"""
+    compiled = _compile(salon_id, replace=True)
+    _new_version()
+    return compiled
+
+
+def forget_salon(salon_id):
+    """Drop a salon's compiled hours, e.g. when it is deleted"""
+    cache.delete(salon_key(salon_id))
+    _new_version()
+
+
+def _new_version():
+    # Salon saves, approvals and deletions all come through here, so the id
+    # list and the "open now" lists built for the old version are never read again
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def get_compiled(salon_id):
+    compiled = cache.get(salon_key(salon_id))
+    if compiled is None:
+        compiled = _compile(salon_id)
+    return compiled
+
+
+def get_compiled_many(salon_ids):
+    """``{salon_id: (week, overrides)}`` for ``salon_ids``, compiling the missing ones"""
+    salon_ids = list(salon_ids)
+    compiled = {}
+    for start in range(0, len(salon_ids), BATCH_SIZE):
+        keys = {salon_key(salon_id): salon_id for salon_id in salon_ids[start:start + BATCH_SIZE]}
+        compiled.update((keys[key], value) for key, value in cache.get_many(keys).items())
+    for salon_id in salon_ids:
+        if salon_id not in compiled:
+            compiled[salon_id] = _compile(salon_id)
+    return compiled
+
+
+def approved_salon_ids(version=None):
+    """Ids of the approved salons, cached per version"""
+    key = f'opening_hours:{version or _version()}:ids'
+    salon_ids = cache.get(key)
+    if salon_ids is None:
+        from salon_management.models import Salon
+
+        salon_ids = list(Salon.objects.filter(status='approved').order_by('id').values_list('id', flat=True))
+        cache.set(key, salon_ids, COMPILED_TIMEOUT)
+    return salon_ids
+
+
+def _day_mask(compiled, day):
+    week, overrides = compiled
+    if day in overrides:
+        return overrides[day]
+    return (week >> (day.weekday() * TICKS_PER_DAY)) & FULL_DAY
+
+
+def _is_open(compiled, moment):
+    minute = moment.hour * 60 + moment.minute
+    return bool(_day_mask(compiled, moment.date()) >> (minute // TICK_MINUTES) & 1)
+
+
+def open_during(salon_ids, day, mask):
+    """Subset of ``salon_ids`` open for at least one tick of ``mask`` on ``day``"""
+    compiled = get_compiled_many(salon_ids)
+    return [salon_id for salon_id in salon_ids if _day_mask(compiled[salon_id], day) & mask]
+
+
+def day_mask(salon_id, day):
+    """Opening-hours tick mask of a salon on ``day``, holidays applied"""
+    return _day_mask(get_compiled(salon_id), day)
+
+
+def is_open(salon_id, moment=None):
+    """Whether a salon is open at ``moment`` (defaults to now, local time)"""
+    return _is_open(get_compiled(salon_id), _local(moment))
+
+
+def open_salon_ids(moment=None):
+    """
+    Ids of approved salons open at ``moment``.
+
+    The answer only changes every tick or when some salon's hours change, so
+    it is computed once per tick and version and then served with one read.
+    """
+    moment = _local(moment)
+    version = _version()
+    tick = (moment.hour * 60 + moment.minute) // TICK_MINUTES
+    key = f'opening_hours:{version}:open:{moment.date().isoformat()}:{tick}'
+    salon_ids = cache.get(key)
+    if salon_ids is None:
+        candidates = approved_salon_ids(version)
+        compiled = get_compiled_many(candidates)
+        salon_ids = [salon_id for salon_id in candidates if _is_open(compiled[salon_id], moment)]
+        cache.set(key, salon_ids, TICK_MINUTES * 60)
+    return salon_ids
+
+
+def filter_open(salons, moment=None):
+    """Restrict a ``Salon`` queryset to salons open at ``moment``"""
+    return salons.filter(id__in=open_salon_ids(moment))
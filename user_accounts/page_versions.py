@@ -0,0 +1,135 @@
+"""
+Cheap ETags for public pages.
+
+Each piece of public content has a "last changed" timestamp in the shared
+cache: ``salons`` for anything shown on the salon list and ``salon:<id>`` for
+one salon's detail, services and reviews pages. Signal handlers call
+``mark_changed`` when a salon, service, staff member, opening hours or review
+is saved or deleted. ``ConditionalGetMiddleware`` builds the ETag from these
+timestamps (plus the salon's ``updated_at``) before the view runs, so a
+revalidation that matches is answered with a 304 without running the view or
+rendering its template.
+
+The pages show who is logged in, so the ETag includes the viewer. There is
+no Last-Modified: a date cannot tell viewers apart, and ``If-Modified-Since``
+alone would answer 304 with another viewer's page after logging in or out.
+
+A timestamp missing from the cache (evicted, or never set) is treated as
+"changed now", so losing the cache only costs one full render per page.
+Templates are part of the page too: set ``PUBLIC_PAGES_RELEASE`` (e.g. to the
+deployed git revision) so a deploy changes every ETag; without it the newest
+template modification time is used.
+"""
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+RELEASE = getattr(settings, 'PUBLIC_PAGES_RELEASE', None)
+KEY_PREFIX = 'page_changed'
+
+_template_release = None
+
+
+def _key(scope):
+    return f'{KEY_PREFIX}:{scope}'
+
+
+def mark_changed(*scopes):
+    """Record that the content behind ``scopes`` changed now"""
+    now = time.time()
+    cache.set_many({_key(scope): now for scope in scopes}, None)
+
+
+def last_changed(*scopes):
+    """Latest change timestamp over ``scopes``, in one cache round trip"""
+    keys = [_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        now = time.time()
+        for key in missing:
+            cache.add(key, now, None)
+        found.update(cache.get_many(missing))
+    return max(found.get(key, time.time()) for key in keys)
+
+
+def release():
+    """What identifies the deployed templates"""
+    global _template_release
+    if RELEASE:
+        return RELEASE
+    if _template_release is None:
+        newest = 0.0
+        for engine in settings.TEMPLATES:
+            for directory in engine.get('DIRS', []):
+                for root, _, files in os.walk(directory):
+                    for name in files:
+                        newest = max(newest, os.path.getmtime(os.path.join(root, name)))
+        _template_release = str(int(newest))
+    return _template_release
+
+
+def _salon_id(kwargs):
+    return kwargs.get('salon_id', kwargs.get('pk'))
+
+
+def _salon_updated_at(salon_id):
+    from salon_management.models import Salon
+
+    if not any(field.name == 'updated_at' for field in Salon._meta.get_fields()):
+        return None
+    updated_at = Salon.objects.filter(pk=salon_id).values_list('updated_at', flat=True).first()
+    return updated_at.timestamp() if updated_at is not None else None
+
+
+def salon_list_changed(request, **kwargs):
+    return last_changed('salons')
+
+
+def salon_changed(request, **kwargs):
+    salon_id = _salon_id(kwargs)
+    if salon_id is None:
+        return None
+    changed = last_changed('salons', f'salon:{salon_id}')
+    updated_at = _salon_updated_at(salon_id)
+    return max(changed, updated_at) if updated_at is not None else changed
+
+
+def static_page_changed(request, **kwargs):
+    # Only the templates change these pages
+    return 0.0
+
+
+# URL name -> function(request, **url_kwargs) returning the page's last change
+# timestamp, or None to skip conditional handling
+PAGE_VALIDATORS = {
+    'salons:list': salon_list_changed,
+    'salons:detail': salon_changed,
+    'salons:services': salon_changed,
+    'salons:reviews': salon_changed,
+    'core:about': static_page_changed,
+    'core:faq': static_page_changed,
+}
+
+
+def page_etag(view_name, request, kwargs):
+    """ETag of a public page, or ``None`` if it has no validator"""
+    changed = PAGE_VALIDATORS.get(view_name)
+    if changed is None:
+        return None
+    changed = changed(request, **kwargs)
+    if changed is None:
+        return None
+
+    # The navigation bar shows who is logged in
+    viewer = request.user.pk if request.user.is_authenticated else 'anon'
+    digest = hashlib.md5(
+        f'{release()}:{view_name}:{sorted(kwargs.items())}:{request.META.get("QUERY_STRING", "")}:'
+        f'{viewer}:{changed!r}'.encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return f'"{digest}"'
@@ -0,0 +1,359 @@
+"""
+Columnar platform snapshot behind the admin analytics page.
+
+``export_snapshot`` copies the columns the page needs from ``User``,
+``Salon``, ``Booking`` and ``Payment`` into NumPy arrays and writes them to a
+single ``.npz`` file (nightly, from celery beat). Text columns such as roles,
+statuses and cities are stored as small integer codes plus a label array. The
+page then answers cohort retention, bookings per city and owner growth with
+vectorized aggregations over that file and never touches the primary
+database.
+"""
+import os
+import tempfile
+import threading
+from datetime import date, datetime
+
+from django.conf import settings
+from django.utils import timezone
+
+from .db_router import replica_reads
+
+
+SNAPSHOT_DIR = getattr(
+    settings, 'ANALYTICS_SNAPSHOT_DIR',
+    os.path.join(getattr(settings, 'BASE_DIR', os.getcwd()), 'var', 'analytics'),
+)
+SNAPSHOT_NAME = 'platform.npz'
+EXPORT_CHUNK_SIZE = 5000
+
+PAID_PAYMENT_STATUSES = getattr(settings, 'ANALYTICS_PAID_PAYMENT_STATUSES', ('completed',))
+
+
+def snapshot_path():
+    return os.path.join(SNAPSHOT_DIR, SNAPSHOT_NAME)
+
+
+def _naive_local(moment):
+    if timezone.is_aware(moment):
+        moment = timezone.localtime(moment).replace(tzinfo=None)
+    return moment
+
+
+def _day(value):
+    if isinstance(value, datetime):
+        return _naive_local(value).date()
+    return value
+
+
+def _columns(querysets, fields):
+    """Stream ``fields`` of each queryset into one Python list per field"""
+    columns = [[] for _ in fields]
+    for queryset in querysets:
+        for row in queryset.values_list(*fields).order_by('pk').iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            for column, value in zip(columns, row):
+                column.append(value)
+    return columns
+
+
+def _encode(values):
+    """Categorical column -> ``(codes, labels)``"""
+    import numpy as np
+
+    labels, codes = np.unique(np.array(['' if value is None else str(value) for value in values], dtype=str), return_inverse=True)
+    return codes.astype(np.int32), labels
+
+
+def _ids(values):
+    import numpy as np
+
+    return np.array([-1 if value is None else value for value in values], dtype=np.int64)
+
+
+def _days(values):
+    import numpy as np
+
+    return np.array([_day(value) for value in values], dtype='datetime64[D]')
+
+
+def _export_arrays():
+    import numpy as np
+    from booking_system.models import Booking, Payment
+    from salon_management.models import Salon
+    from .models import ArchivedBooking, ArchivedPayment, User
+
+    arrays = {}
+
+    user_ids, roles, joined = _columns([User.objects.all()], ['id', 'role', 'date_joined'])
+    arrays['user_id'] = _ids(user_ids)
+    arrays['user_role'], arrays['user_role_labels'] = _encode(roles)
+    arrays['user_joined'] = _days(joined)
+
+    salon_ids, owners, cities, statuses, created = _columns(
+        [Salon.objects.all()], ['id', 'owner_id', 'city', 'status', 'created_at'],
+    )
+    arrays['salon_id'] = _ids(salon_ids)
+    arrays['salon_owner'] = _ids(owners)
+    arrays['salon_city'], arrays['salon_city_labels'] = _encode(cities)
+    arrays['salon_status'], arrays['salon_status_labels'] = _encode(statuses)
+    arrays['salon_created'] = _days(created)
+
+    # Archived bookings keep their original ids, so both tables share one id space
+    booking_ids, customers, salons, statuses, appointments, created = _columns(
+        [Booking.objects.all(), ArchivedBooking.objects.all()],
+        ['id', 'customer_id', 'salon_id', 'status', 'appointment_date', 'created_at'],
+    )
+    arrays['booking_id'] = _ids(booking_ids)
+    arrays['booking_customer'] = _ids(customers)
+    arrays['booking_salon'] = _ids(salons)
+    arrays['booking_status'], arrays['booking_status_labels'] = _encode(statuses)
+    arrays['booking_date'] = _days(appointments)
+    arrays['booking_created'] = _days(created)
+    order = np.argsort(arrays['booking_id'], kind='stable')
+    for name in ('booking_id', 'booking_customer', 'booking_salon', 'booking_status', 'booking_date', 'booking_created'):
+        arrays[name] = arrays[name][order]
+
+    bookings, amounts, statuses, created = _columns(
+        [Payment.objects.all(), ArchivedPayment.objects.all()], ['booking_id', 'amount', 'status', 'created_at'],
+    )
+    arrays['payment_booking'] = _ids(bookings)
+    arrays['payment_amount'] = np.array([float(amount or 0) for amount in amounts], dtype=np.float64)
+    arrays['payment_status'], arrays['payment_status_labels'] = _encode(statuses)
+    arrays['payment_created'] = _days(created)
+
+    arrays['exported_at'] = np.array(_naive_local(timezone.now()), dtype='datetime64[s]')
+    return arrays
+
+
+def export_snapshot(path=None):
+    """Export the platform tables to ``path`` (atomically replaced). Returns the row counts."""
+    import numpy as np
+
+    path = path or snapshot_path()
+    with replica_reads():
+        arrays = _export_arrays()
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            np.savez_compressed(handle, **arrays)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    return {
+        'users': len(arrays['user_id']),
+        'salons': len(arrays['salon_id']),
+        'bookings': len(arrays['booking_id']),
+        'payments': len(arrays['payment_booking']),
+    }
+
+
+_loaded = {}
+_load_lock = threading.Lock()
+
+
+def load_snapshot(path=None):
+    """The snapshot as ``{name: array}``, or ``None`` if it has not been exported yet"""
+    import numpy as np
+
+    path = path or snapshot_path()
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _load_lock:
+        cached = _loaded.get(path)
+        if cached is None or cached[0] != mtime:
+            with np.load(path, allow_pickle=False) as data:
+                cached = (mtime, {name: data[name] for name in data.files})
+            _loaded[path] = cached
+    return cached[1]
+
+
+def _code(snapshot, column, label):
+    """Integer code of ``label`` in a categorical column, -1 if it never occurs"""
+    import numpy as np
+
+    labels = snapshot[f'{column}_labels']
+    position = int(np.searchsorted(labels, label))
+    return position if position < len(labels) and labels[position] == label else -1
+
+
+def _codes(snapshot, column, labels):
+    import numpy as np
+
+    codes = [_code(snapshot, column, label) for label in labels]
+    return np.isin(snapshot[column], [code for code in codes if code >= 0])
+
+
+def _lookup(ids, keys):
+    """Positions of ``keys`` in the sorted ``ids`` array plus a mask of keys that were found"""
+    import numpy as np
+
+    positions = np.searchsorted(ids, keys)
+    positions = np.minimum(positions, max(len(ids) - 1, 0))
+    found = ids[positions] == keys if len(ids) else np.zeros(len(keys), dtype=bool)
+    return positions, found
+
+
+def _months(days):
+    """``datetime64[D]`` -> months since 1970-01"""
+    import numpy as np
+
+    return days.astype('datetime64[M]').astype(np.int64)
+
+
+def _month_date(month):
+    return date(1970 + month // 12, month % 12 + 1, 1)
+
+
+def _current_month(snapshot):
+    return int(_months(snapshot['exported_at'].astype('datetime64[D]')))
+
+
+def totals(snapshot):
+    import numpy as np
+
+    def breakdown(column):
+        counts = np.bincount(snapshot[column], minlength=len(snapshot[f'{column}_labels']))
+        return {str(label): int(count) for label, count in zip(snapshot[f'{column}_labels'], counts)}
+
+    paid = _codes(snapshot, 'payment_status', PAID_PAYMENT_STATUSES)
+    return {
+        'users': len(snapshot['user_id']),
+        'salons': len(snapshot['salon_id']),
+        'bookings': len(snapshot['booking_id']),
+        'revenue': float(snapshot['payment_amount'][paid].sum()),
+        'users_by_role': breakdown('user_role'),
+        'salons_by_status': breakdown('salon_status'),
+        'bookings_by_status': breakdown('booking_status'),
+    }
+
+
+def cohort_retention(snapshot, months=12):
+    """
+    Share of each signup-month cohort of customers that made a booking
+    ``n`` months after signing up, for the last ``months`` cohorts.
+
+    Returns ``[{'month': date, 'size': int, 'rates': [float or None, ...]}]``;
+    a rate is ``None`` where that month has not happened yet.
+    """
+    import numpy as np
+
+    current = _current_month(snapshot)
+    first = current - months + 1
+    customer_code = _code(snapshot, 'user_role', 'customer')
+    is_customer = snapshot['user_role'] == customer_code
+    cohort = _months(snapshot['user_joined']) - first
+
+    in_window = is_customer & (cohort >= 0) & (cohort < months)
+    sizes = np.bincount(cohort[in_window], minlength=months)
+
+    positions, found = _lookup(snapshot['user_id'], snapshot['booking_customer'])
+    offset = _months(snapshot['booking_created']) - _months(snapshot['user_joined'])[positions]
+    valid = found & in_window[positions] & (offset >= 0) & (offset < months)
+
+    # Each customer counts once per month offset however many bookings they made
+    active = np.unique(positions[valid] * months + offset[valid])
+    cells = np.bincount(cohort[active // months] * months + active % months, minlength=months * months)
+    cells = cells.reshape(months, months)
+
+    rows = []
+    for index in range(months):
+        observed = months - index
+        rates = [
+            float(cells[index, n] / sizes[index]) if sizes[index] and n < observed else None
+            for n in range(months)
+        ]
+        rows.append({'month': _month_date(first + index), 'size': int(sizes[index]), 'rates': rates})
+    return rows
+
+
+def bookings_per_city(snapshot, limit=10):
+    """``[(city, bookings, salons, revenue)]`` for the busiest ``limit`` cities"""
+    import numpy as np
+
+    cities = snapshot['salon_city_labels']
+    salon_positions, salon_found = _lookup(snapshot['salon_id'], snapshot['booking_salon'])
+    booking_city = snapshot['salon_city'][salon_positions[salon_found]]
+    bookings = np.bincount(booking_city, minlength=len(cities))
+    salons = np.bincount(snapshot['salon_city'], minlength=len(cities))
+
+    paid = _codes(snapshot, 'payment_status', PAID_PAYMENT_STATUSES)
+    booking_positions, booking_found = _lookup(snapshot['booking_id'], snapshot['payment_booking'][paid])
+    payment_salon = snapshot['booking_salon'][booking_positions[booking_found]]
+    salon_positions, salon_found = _lookup(snapshot['salon_id'], payment_salon)
+    revenue = np.bincount(
+        snapshot['salon_city'][salon_positions[salon_found]],
+        weights=snapshot['payment_amount'][paid][booking_found][salon_found],
+        minlength=len(cities),
+    )
+
+    order = np.lexsort((-salons, -bookings))[:limit]
+    return [
+        (str(cities[index]) or 'Unknown', int(bookings[index]), int(salons[index]), float(revenue[index]))
+        for index in order
+    ]
+
+
+def owner_growth(snapshot, months=12):
+    """``[(month, new_owners, total_owners, new_salons)]`` for the last ``months`` months"""
+    import numpy as np
+
+    current = _current_month(snapshot)
+    first = current - months + 1
+
+    owner_code = _code(snapshot, 'user_role', 'salon_owner')
+    owner_months = _months(snapshot['user_joined'][snapshot['user_role'] == owner_code]) - first
+    before = int((owner_months < 0).sum())
+    new_owners = np.bincount(owner_months[(owner_months >= 0) & (owner_months < months)], minlength=months)
+    total_owners = before + np.cumsum(new_owners)
+
+    salon_months = _months(snapshot['salon_created']) - first
+    new_salons = np.bincount(salon_months[(salon_months >= 0) & (salon_months < months)], minlength=months)
+
+    return [
+        (_month_date(first + index), int(new_owners[index]), int(total_owners[index]), int(new_salons[index]))
+        for index in range(months)
+    ]
+
+
+def monthly_revenue(snapshot, months=12):
+    """``[(month, bookings, revenue)]`` by appointment month for the last ``months`` months"""
+    import numpy as np
+
+    current = _current_month(snapshot)
+    first = current - months + 1
+
+    booking_month = _months(snapshot['booking_date']) - first
+    in_range = (booking_month >= 0) & (booking_month < months)
+    bookings = np.bincount(booking_month[in_range], minlength=months)
+
+    paid = _codes(snapshot, 'payment_status', PAID_PAYMENT_STATUSES)
+    payment_month = _months(snapshot['payment_created'][paid]) - first
+    in_range = (payment_month >= 0) & (payment_month < months)
+    revenue = np.bincount(payment_month[in_range], weights=snapshot['payment_amount'][paid][in_range], minlength=months)
+
+    return [
+        (_month_date(first + index), int(bookings[index]), float(revenue[index]))
+        for index in range(months)
+    ]
+
+
+def platform_report(months=12, path=None):
+    """Everything the admin analytics page shows, or ``None`` without a snapshot"""
+    snapshot = load_snapshot(path)
+    if snapshot is None:
+        return None
+    return {
+        'exported_at': snapshot['exported_at'].item(),
+        'totals': totals(snapshot),
+        'retention': cohort_retention(snapshot, months),
+        'cities': bookings_per_city(snapshot),
+        'owner_growth': owner_growth(snapshot, months),
+        'monthly': monthly_revenue(snapshot, months),
+    }
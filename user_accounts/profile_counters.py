@@ -0,0 +1,222 @@
+"""
+Booking and salon counters kept on the customer and salon owner profiles.
+
+``CustomerProfile`` counts a customer's bookings and ``SalonOwnerProfile`` the
+owner's salons and the bookings of all of them, in total and per status.
+Archived bookings still count, so the numbers match the booking history.
+
+The signal handlers in ``signals.py`` adjust the counters with ``F()``
+updates in the same transaction as the booking or salon change: concurrent
+bookings never lose an increment and a rolled-back booking is never counted.
+``bookings.bulk_update_booking_status`` applies its changes the same way.
+Writes that bypass the ORM signals (raw SQL, ``bulk_create`` as in
+``generate_synthetic_data``) leave the counters behind;
+``manage.py reconcile_profile_counters`` recounts them in batches. Migration
+0008 counted the bookings and salons that existed before the counters did.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Subquery
+
+from .models import ArchivedBooking, CustomerProfile, SalonOwnerProfile
+from .rollups import STATUS_FIELDS
+
+
+BOOKING_COUNTER_FIELDS = ['total_bookings', *STATUS_FIELDS.values()]
+CUSTOMER_COUNTER_FIELDS = BOOKING_COUNTER_FIELDS
+OWNER_COUNTER_FIELDS = ['total_salons', *BOOKING_COUNTER_FIELDS]
+
+RECONCILE_BATCH_SIZE = 500
+
+
+STATE_FIELDS = ('customer_id', 'salon_id', 'status')
+
+
+def booking_state(booking):
+    """``(customer_id, salon_id, status)`` a booking is counted under, or ``None`` if not fully loaded"""
+    if set(STATE_FIELDS) & booking.get_deferred_fields():
+        return None
+    return booking.customer_id, booking.salon_id, booking.status
+
+
+def row_state(row):
+    """``booking_state`` of a row holding at least the ``STATE_FIELDS``, or ``None`` for no row"""
+    return tuple(row[field] for field in STATE_FIELDS) if row else None
+
+
+def _booking_fields(status, count):
+    fields = Counter({'total_bookings': count})
+    if status in STATUS_FIELDS:
+        fields[STATUS_FIELDS[status]] += count
+    return fields
+
+
+def _changes(states):
+    """Net counter changes for ``(state, sign)`` pairs, keyed by ``('customer' | 'salon', id)``"""
+    changes = defaultdict(Counter)
+    for (customer_id, salon_id, status), sign in states:
+        changes['customer', customer_id].update(_booking_fields(status, sign))
+        changes['salon', salon_id].update(_booking_fields(status, sign))
+    return changes
+
+
+def _owner_profiles(salon_id):
+    from salon_management.models import Salon
+
+    owner = Salon.objects.filter(pk=salon_id).values('owner_id')[:1]
+    return SalonOwnerProfile.objects.filter(user_id=Subquery(owner))
+
+
+def _apply(changes):
+    for (kind, key), fields in changes.items():
+        updates = {name: F(name) + delta for name, delta in fields.items() if delta}
+        if key is None or not updates:
+            continue
+        if kind == 'customer':
+            CustomerProfile.objects.filter(user_id=key).update(**updates)
+        elif kind == 'salon':
+            _owner_profiles(key).update(**updates)
+        else:
+            SalonOwnerProfile.objects.filter(user_id=key).update(**updates)
+
+
+def booking_saved(old_state, new_state):
+    """Move a booking's count from ``old_state`` (``None`` when new) to ``new_state``"""
+    if old_state == new_state:
+        return
+    states = [(new_state, 1)]
+    if old_state is not None:
+        states.append((old_state, -1))
+    _apply(_changes(states))
+
+
+def booking_deleted(state):
+    _apply(_changes([(state, -1)]))
+
+
+def bookings_status_changed(bookings, status):
+    """Counters for a bulk status change; ``bookings`` as sent with ``bookings_bulk_updated``"""
+    states = []
+    for booking in bookings:
+        states.append(((booking['customer_id'], booking['salon_id'], booking['status']), -1))
+        states.append(((booking['customer_id'], booking['salon_id'], status), 1))
+    _apply(_changes(states))
+
+
+def _salon_booking_counts(salon_id):
+    from booking_system.models import Booking
+
+    counts = Counter()
+    for model in (Booking, ArchivedBooking):
+        rows = model.objects.filter(salon_id=salon_id).values('status').annotate(count=Count('id')).order_by()
+        for row in rows:
+            counts.update(_booking_fields(row['status'], row['count']))
+    return counts
+
+
+def salon_saved(salon_id, old_owner_id, new_owner_id, created):
+    if created:
+        _apply({('owner', new_owner_id): Counter(total_salons=1)})
+    elif old_owner_id != new_owner_id:
+        # The salon's bookings move to the new owner too
+        moved = _salon_booking_counts(salon_id) + Counter(total_salons=1)
+        _apply({
+            ('owner', old_owner_id): Counter({name: -count for name, count in moved.items()}),
+            ('owner', new_owner_id): moved,
+        })
+
+
+def salon_bookings_deleted(salon_id):
+    """
+    Uncount all of a salon's live and archived bookings before deleting the
+    salon cascades to them: one grouped count per table and one update per
+    customer, instead of ``booking_deleted`` for every row.
+    """
+    from booking_system.models import Booking
+
+    states = []
+    for model in (Booking, ArchivedBooking):
+        rows = model.objects.filter(salon_id=salon_id).values('customer_id', 'status').annotate(count=Count('id')).order_by()
+        states.extend(((row['customer_id'], salon_id, row['status']), -row['count']) for row in rows)
+    _apply(_changes(states))
+
+
+def salon_deleted(owner_id):
+    # Its bookings were uncounted by salon_bookings_deleted
+    _apply({('owner', owner_id): Counter(total_salons=-1)})
+
+
+# Reconciliation
+
+def expected_customer_counts(user_ids):
+    """``{user_id: Counter(field=count)}`` recounted from live and archived bookings"""
+    from booking_system.models import Booking
+
+    counts = defaultdict(Counter)
+    for model in (Booking, ArchivedBooking):
+        rows = (
+            model.objects.filter(customer_id__in=user_ids)
+            .values('customer_id', 'status').annotate(count=Count('id')).order_by()
+        )
+        for row in rows:
+            counts[row['customer_id']].update(_booking_fields(row['status'], row['count']))
+    return counts
+
+
+def expected_owner_counts(user_ids):
+    from booking_system.models import Booking
+    from salon_management.models import Salon
+
+    counts = defaultdict(Counter)
+    for model in (Booking, ArchivedBooking):
+        rows = (
+            model.objects.filter(salon__owner_id__in=user_ids)
+            .values('salon__owner_id', 'status').annotate(count=Count('id')).order_by()
+        )
+        for row in rows:
+            counts[row['salon__owner_id']].update(_booking_fields(row['status'], row['count']))
+    salons = Salon.objects.filter(owner_id__in=user_ids).values('owner_id').annotate(count=Count('id')).order_by()
+    for row in salons:
+        counts[row['owner_id']]['total_salons'] += row['count']
+    return counts
+
+
+RECONCILED = {
+    CustomerProfile: (CUSTOMER_COUNTER_FIELDS, expected_customer_counts),
+    SalonOwnerProfile: (OWNER_COUNTER_FIELDS, expected_owner_counts),
+}
+
+
+def reconcile_batch(model, profile_ids, dry_run=False):
+    """Recount the profiles in ``profile_ids``; returns ``(profile, {field: (stored, counted)})`` for drifted ones"""
+    fields, expected_counts = RECONCILED[model]
+    with transaction.atomic():
+        # Locking the rows first makes concurrent F() updates wait and then apply on top of the recount
+        profiles = list(model.objects.select_for_update().filter(pk__in=profile_ids).order_by('pk'))
+        expected = expected_counts([profile.user_id for profile in profiles])
+        drifted = []
+        for profile in profiles:
+            counts = expected.get(profile.user_id, Counter())
+            changes = {
+                field: (getattr(profile, field), counts[field])
+                for field in fields if getattr(profile, field) != counts[field]
+            }
+            if changes:
+                for field, (_, counted) in changes.items():
+                    setattr(profile, field, counted)
+                drifted.append((profile, changes))
+        if drifted and not dry_run:
+            model.objects.bulk_update([profile for profile, _ in drifted], fields)
+    return drifted
+
+
+def reconcile(model, batch_size=RECONCILE_BATCH_SIZE, dry_run=False):
+    """Recount every profile of ``model`` in batches; yields ``(checked, drifted)`` per batch"""
+    last_id = 0
+    while True:
+        profile_ids = list(model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not profile_ids:
+            return
+        last_id = profile_ids[-1]
+        yield len(profile_ids), reconcile_batch(model, profile_ids, dry_run)
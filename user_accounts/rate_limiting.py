@@ -0,0 +1,335 @@
+"""
+Token-bucket rate limiting and load shedding.
+
+Enable with::
+
+    MIDDLEWARE = [..., 'django.contrib.auth.middleware.AuthenticationMiddleware',
+                  'user_accounts.rate_limiting.RateLimitMiddleware', ...]
+
+Rate limits are rules in ``RATE_LIMITS``. Each rule matches URL names the way
+``RoleBasedAccessMiddleware`` does (``'salons:search'`` exactly, or a whole
+namespace with ``'salons:'``; ``'*'`` matches everything) and gives every
+client a bucket of ``burst`` tokens refilled at ``rate`` tokens per second.
+Clients are counted per IP or per user (``'key': 'user'``; anonymous users
+fall back to their IP). A request needs a token from every matching rule,
+otherwise it gets a 429 with ``Retry-After`` and spends nothing: the buckets
+of a request are checked and spent in one step. Buckets live in Redis when
+``RATE_LIMIT_REDIS_URL`` is set, updated by a Lua script so concurrent
+workers never overspend, and in process memory otherwise (tests, local runs).
+If Redis is unreachable requests are let through.
+
+Load shedding protects the worker pool when it is already saturated. The
+middleware counts the requests in flight in this process and, when the proxy
+sets ``X-Request-Start`` (nginx: ``proxy_set_header X-Request-Start "t=${msec}"``),
+how long the request queued before reaching Django. Past
+``LOAD_SHED_MAX_IN_FLIGHT`` or ``LOAD_SHED_MAX_QUEUE_MS``, low-priority pages
+(``LOAD_SHED_LOW_PRIORITY``: search and listings) get a 503; other pages only
+once the load is twice that; ``LOAD_SHED_CRITICAL`` pages (booking and
+payment) are never shed. Both thresholds are off unless set.
+
+The in-flight count is per process, so ``LOAD_SHED_MAX_IN_FLIGHT`` only means
+something for workers that serve requests concurrently (gthread, ASGI). A
+sync worker serves one request at a time and never sees more than its own;
+there, set ``LOAD_SHED_MAX_QUEUE_MS``: queue time is what grows when every
+worker of the pool is busy.
+"""
+import logging
+import math
+import threading
+import time
+from asyncio import iscoroutinefunction
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+
+from .clock import SystemClock
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RATE_LIMITS = [
+    # Crawlers paging through search results
+    {'name': 'search', 'match': ['salons:search'], 'key': 'ip', 'rate': 1.0, 'burst': 20},
+    # Users resubmitting the booking form
+    {'name': 'booking-submit', 'match': ['bookingSubmit', 'customer:api_create_booking'], 'key': 'user',
+     'rate': 0.2, 'burst': 5},
+    {'name': 'per-ip', 'match': ['*'], 'key': 'ip', 'rate': 10.0, 'burst': 100},
+]
+
+RATE_LIMITS = getattr(settings, 'RATE_LIMITS', DEFAULT_RATE_LIMITS)
+# Number of trusted proxies in front of Django that append to X-Forwarded-For
+PROXY_COUNT = getattr(settings, 'RATE_LIMIT_PROXY_COUNT', 0)
+
+MAX_IN_FLIGHT = getattr(settings, 'LOAD_SHED_MAX_IN_FLIGHT', None)
+MAX_QUEUE_MS = getattr(settings, 'LOAD_SHED_MAX_QUEUE_MS', None)
+LOW_PRIORITY = getattr(settings, 'LOAD_SHED_LOW_PRIORITY', [
+    'salons:search', 'salons:list', 'salons:services', 'salons:reviews',
+])
+CRITICAL = getattr(settings, 'LOAD_SHED_CRITICAL', [
+    'bookingSubmit', 'salons:book', 'customer:api_create_booking', 'customer:cancel_booking', 'payments:', 'accounts:',
+])
+# Pages that are neither low priority nor critical are shed at this multiple of the thresholds
+NORMAL_SHED_FACTOR = 2
+
+SHED_RETRY_AFTER = 5
+
+
+class LocalBucketStore:
+    """In-process buckets with the same interface as ``RedisBucketStore``"""
+
+    MAX_BUCKETS = 100_000
+
+    def __init__(self, clock=None):
+        self.clock = clock or SystemClock()
+        # key -> (tokens, updated, moment the bucket is full again)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, buckets):
+        """
+        Spend a token from each ``(key, rate, burst)`` bucket, or from none.
+
+        Returns ``(allowed, seconds until every bucket has a token)``.
+        """
+        now = self.clock.now()
+        with self._lock:
+            refilled = []
+            wait = 0.0
+            for key, rate, burst in buckets:
+                tokens, updated, _ = self._buckets.get(key, (burst, now, now))
+                tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                refilled.append((key, rate, burst, tokens))
+            allowed = all(tokens >= 1 for _, _, _, tokens in refilled)
+            for key, rate, burst, tokens in refilled:
+                if allowed:
+                    tokens -= 1
+                self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if len(self._buckets) > self.MAX_BUCKETS:
+                self._prune(now)
+            return allowed, wait
+
+    def _prune(self, now):
+        # A full bucket is the same as no bucket
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisBucketStore:
+    """Buckets as Redis hashes, refilled and spent atomically"""
+
+    # Uses the Redis clock so workers with skewed clocks agree. ARGV holds
+    # rate and burst for each key in turn
+    TAKE = """
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local tokens = {}
+    local wait = 0
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[2 * i - 1])
+        local burst = tonumber(ARGV[2 * i])
+        local bucket = redis.call('HMGET', key, 'tokens', 'updated')
+        local updated = tonumber(bucket[2]) or now
+        tokens[i] = math.min(burst, (tonumber(bucket[1]) or burst) + math.max(0, now - updated) * rate)
+        if tokens[i] < 1 then
+            wait = math.max(wait, (1 - tokens[i]) / rate)
+        end
+    end
+    local allowed = 0
+    if wait == 0 then
+        allowed = 1
+    end
+    for i, key in ipairs(KEYS) do
+        local rate = tonumber(ARGV[2 * i - 1])
+        local burst = tonumber(ARGV[2 * i])
+        redis.call('HSET', key, 'tokens', tostring(tokens[i] - allowed), 'updated', tostring(now))
+        redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+    end
+    return {allowed, tostring(wait)}
+    """
+
+    def __init__(self, client, prefix='ratelimit'):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(self.TAKE)
+
+    def take(self, buckets):
+        keys = [f'{self.prefix}:{key}' for key, _, _ in buckets]
+        args = [value for _, rate, burst in buckets for value in (rate, burst)]
+        allowed, wait = self._take(keys=keys, args=args)
+        return bool(allowed), float(wait)
+
+
+_store = None
+
+
+def get_store():
+    """Bucket store backed by Redis if ``RATE_LIMIT_REDIS_URL`` is set, else in-process"""
+    global _store
+    if _store is None:
+        redis_url = getattr(settings, 'RATE_LIMIT_REDIS_URL', None)
+        if redis_url:
+            import redis
+
+            _store = RedisBucketStore(redis.Redis.from_url(redis_url, socket_timeout=0.05))
+        else:
+            _store = LocalBucketStore()
+    return _store
+
+
+def matches(view_name, patterns):
+    for pattern in patterns:
+        if pattern == '*' or view_name == pattern or (pattern.endswith(':') and view_name.startswith(pattern)):
+            return True
+    return False
+
+
+def client_ip(request):
+    if PROXY_COUNT:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= PROXY_COUNT:
+            # Each of our proxies appends the address it got the request from
+            return forwarded[-PROXY_COUNT]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _client_key(request, rule):
+    if rule.get('key') == 'user':
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_authenticated:
+            return f'user:{user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+def check_rate_limits(request, view_name, store=None):
+    """Seconds to wait if ``request`` is over any matching limit, else ``None``"""
+    buckets = [
+        (f'{rule["name"]}:{_client_key(request, rule)}', rule['rate'], rule['burst'])
+        for rule in RATE_LIMITS if matches(view_name, rule['match'])
+    ]
+    if not buckets:
+        return None
+    store = store or get_store()
+    try:
+        allowed, wait = store.take(buckets)
+    except Exception:
+        # Better to serve without limits than to fail every request
+        logger.warning('Rate limit store unavailable', exc_info=True)
+        return None
+    return None if allowed else wait
+
+
+def queue_ms(request, now=None):
+    """Milliseconds between the proxy receiving the request and Django seeing it, if known"""
+    header = request.META.get('HTTP_X_REQUEST_START')
+    if not header:
+        return None
+    try:
+        started = float(header.split('=')[-1])
+    except ValueError:
+        return None
+    # Seconds (nginx $msec), milliseconds or microseconds since the epoch
+    if started > 1e14:
+        started /= 1_000_000
+    elif started > 1e11:
+        started /= 1000
+    return max(0.0, ((now or time.time()) - started) * 1000)
+
+
+class LoadGauge:
+    """Requests currently being served by this process (not the whole pool)"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+
+load_gauge = LoadGauge()
+
+
+def overload(request):
+    """How far past the shedding thresholds this process is (1.0 = at the threshold)"""
+    load = 0.0
+    if MAX_IN_FLIGHT:
+        # This request is already counted
+        load = max(load, (load_gauge.in_flight - 1) / MAX_IN_FLIGHT)
+    if MAX_QUEUE_MS:
+        waited = getattr(request, 'queue_ms', None)
+        if waited is not None:
+            load = max(load, waited / MAX_QUEUE_MS)
+    return load
+
+
+def should_shed(request, view_name):
+    if matches(view_name, CRITICAL):
+        return False
+    load = overload(request)
+    if matches(view_name, LOW_PRIORITY):
+        return load >= 1
+    return load >= NORMAL_SHED_FACTOR
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse('Too many requests, please slow down.', status=429, content_type='text/plain')
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def service_unavailable():
+    response = HttpResponse('The site is busy, please try again shortly.', status=503, content_type='text/plain')
+    response['Retry-After'] = str(SHED_RETRY_AFTER)
+    return response
+
+
+class RateLimitMiddleware:
+    """
+    Shed low-priority pages under load, then apply per-client rate limits.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.queue_ms = queue_ms(request)
+        load_gauge.enter()
+        try:
+            return self.get_response(request)
+        finally:
+            load_gauge.leave()
+
+    async def __acall__(self, request):
+        request.queue_ms = queue_ms(request)
+        load_gauge.enter()
+        try:
+            return await self.get_response(request)
+        finally:
+            load_gauge.leave()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_name = request.resolver_match.view_name
+        # Shedding first: it needs no shared state and is what protects the pool
+        if should_shed(request, view_name):
+            return service_unavailable()
+        retry_after = check_rate_limits(request, view_name)
+        if retry_after is not None:
+            return too_many_requests(retry_after)
+        return None
@@ -0,0 +1,238 @@
+"""
+Appointment reminders scheduled by due time.
+
+Confirming a booking puts its id into a queue scored by the moment the
+reminder is due; cancelling removes it. The periodic ``send_due_reminders``
+task pops only items whose score has passed, in batches, so it never scans the
+bookings table; reminders it could not send go back into the queue. The queue
+is a Redis sorted set (``REMINDER_REDIS_URL``). Tests and local runs can set
+``REMINDER_QUEUE = 'local'`` for an in-process queue instead, which loses its
+reminders on restart and is not shared between processes.
+
+Without either, a system check warns at startup and reminders are skipped
+(and logged); bookings are still saved.
+"""
+import heapq
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core import checks
+from django.core.mail import get_connection, EmailMessage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .clock import SystemClock
+
+
+logger = logging.getLogger(__name__)
+
+
+REMINDER_LEAD = timedelta(hours=getattr(settings, 'REMINDER_LEAD_HOURS', 24))
+REMINDER_BATCH_SIZE = getattr(settings, 'REMINDER_BATCH_SIZE', 200)
+
+
+class LocalReminderQueue:
+    """In-process queue with the same interface as ``RedisReminderQueue``"""
+
+    def __init__(self):
+        self._due = {}
+        self._heap = []
+        self._lock = threading.Lock()
+
+    def add(self, booking_id, due):
+        with self._lock:
+            self._due[booking_id] = due
+            heapq.heappush(self._heap, (due, booking_id))
+
+    def remove(self, booking_id):
+        with self._lock:
+            self._due.pop(booking_id, None)
+
+    def pop_due(self, now, limit):
+        popped = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now and len(popped) < limit:
+                due, booking_id = heapq.heappop(self._heap)
+                # Skip entries that were removed or rescheduled since they were pushed
+                if self._due.get(booking_id) == due:
+                    del self._due[booking_id]
+                    popped.append(booking_id)
+        return popped
+
+    def __len__(self):
+        return len(self._due)
+
+
+class RedisReminderQueue:
+    """Redis sorted set of booking ids scored by due timestamp"""
+
+    # Fetch and remove due members atomically so concurrent workers never
+    # send the same reminder twice
+    POP_DUE = """
+    local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+    if #items > 0 then
+        redis.call('ZREM', KEYS[1], unpack(items))
+    end
+    return items
+    """
+
+    def __init__(self, client, key='reminders:due'):
+        self.client = client
+        self.key = key
+        self._pop_due = client.register_script(self.POP_DUE)
+
+    def add(self, booking_id, due):
+        self.client.zadd(self.key, {str(booking_id): due})
+
+    def remove(self, booking_id):
+        self.client.zrem(self.key, str(booking_id))
+
+    def pop_due(self, now, limit):
+        return [int(item) for item in self._pop_due(keys=[self.key], args=[now, limit])]
+
+    def __len__(self):
+        return self.client.zcard(self.key)
+
+
+def appointment_timestamp(appointment_date, appointment_time):
+    moment = datetime.combine(appointment_date, appointment_time)
+    if settings.USE_TZ:
+        moment = timezone.make_aware(moment)
+    return moment.timestamp()
+
+
+class ReminderScheduler:
+
+    def __init__(self, queue, clock=None, lead=REMINDER_LEAD):
+        self.queue = queue
+        self.clock = clock or SystemClock()
+        self.lead = lead
+
+    def schedule(self, booking_id, appointment_date, appointment_time):
+        """Queue (or move) the reminder of a confirmed booking"""
+        starts = appointment_timestamp(appointment_date, appointment_time)
+        if starts <= self.clock.now():
+            self.queue.remove(booking_id)
+            return
+        due = max(starts - self.lead.total_seconds(), self.clock.now())
+        self.queue.add(booking_id, due)
+
+    def cancel(self, booking_id):
+        self.queue.remove(booking_id)
+
+    def pop_due(self, limit=REMINDER_BATCH_SIZE):
+        return self.queue.pop_due(self.clock.now(), limit)
+
+    def send_due(self, batch_size=REMINDER_BATCH_SIZE):
+        """
+        Send every due reminder, ``batch_size`` at a time. Returns the number sent.
+
+        Reminders are sent one by one over a shared connection; if sending
+        fails, the ones not sent yet are queued again as due now before the
+        error propagates, so a retry picks them up.
+        """
+        from booking_system.models import Booking
+
+        sent = 0
+        connection = get_connection()
+        with connection:
+            while True:
+                booking_ids = self.pop_due(batch_size)
+                if not booking_ids:
+                    return sent
+                bookings = Booking.objects.filter(
+                    id__in=booking_ids, status='confirmed',
+                ).select_related('customer', 'salon', 'service')
+                pending = [(booking.id, reminder_message(booking)) for booking in bookings if booking.customer.email]
+                for position, (booking_id, message) in enumerate(pending):
+                    try:
+                        connection.send_messages([message])
+                    except Exception:
+                        now = self.clock.now()
+                        for unsent_id, _ in pending[position:]:
+                            self.queue.add(unsent_id, now)
+                        raise
+                    sent += 1
+
+
+def reminder_message(booking):
+    return EmailMessage(
+        subject=f'Reminder: your appointment at {booking.salon.name}',
+        body=(
+            f'Hi {booking.customer.first_name or booking.customer.email},\n\n'
+            f'This is a reminder of your {booking.service.name} appointment at {booking.salon.name} '
+            f'on {booking.appointment_date:%A, %d %B} at {booking.appointment_time:%H:%M}.\n\n'
+            f'See you soon,\nBookMyStyle'
+        ),
+        to=[booking.customer.email],
+    )
+
+
+def _configured():
+    return getattr(settings, 'REMINDER_QUEUE', 'redis') == 'local' or getattr(settings, 'REMINDER_REDIS_URL', None)
+
+
+@checks.register()
+def check_reminder_queue(app_configs, **kwargs):
+    if _configured():
+        return []
+    return [checks.Warning(
+        'Appointment reminders have no queue, so none will be sent.',
+        hint="Set REMINDER_REDIS_URL, or REMINDER_QUEUE = 'local' in tests.",
+        id='user_accounts.W001',
+    )]
+
+
+_scheduler = None
+
+
+def get_scheduler():
+    """
+    Scheduler backed by the Redis queue at ``REMINDER_REDIS_URL``, the
+    in-process queue with ``REMINDER_QUEUE = 'local'``, or ``None`` if
+    neither is configured.
+    """
+    global _scheduler
+    if _scheduler is None:
+        if getattr(settings, 'REMINDER_QUEUE', 'redis') == 'local':
+            queue = LocalReminderQueue()
+        elif getattr(settings, 'REMINDER_REDIS_URL', None):
+            import redis
+
+            queue = RedisReminderQueue(redis.Redis.from_url(settings.REMINDER_REDIS_URL))
+        else:
+            return None
+        _scheduler = ReminderScheduler(queue)
+    return _scheduler
+
+
+@receiver(setting_changed)
+def _reset_scheduler(setting, **kwargs):
+    global _scheduler
+    if setting in ('REMINDER_QUEUE', 'REMINDER_REDIS_URL'):
+        _scheduler = None
+
+
+def update_reminders(update):
+    """
+    Call ``update(scheduler)`` once the current transaction commits.
+
+    The booking change is already committed by then, so a missing or
+    unreachable queue is logged instead of failing the request.
+    """
+    from django.db import transaction
+
+    def run():
+        scheduler = get_scheduler()
+        if scheduler is None:
+            logger.warning('Appointment reminder queue is not configured; reminder not updated')
+            return
+        try:
+            update(scheduler)
+        except Exception:
+            logger.exception('Could not update appointment reminders')
+
+    transaction.on_commit(run)
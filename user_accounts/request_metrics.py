@@ -0,0 +1,330 @@
+"""
+Per-view request timings exposed in the Prometheus text format.
+
+Enable with::
+
+    MIDDLEWARE = ['user_accounts.request_metrics.RequestMetricsMiddleware', ...]
+
+and scrape ``/user-admin/metrics/``. For every request the middleware records,
+under the resolved URL name (``customer:dashboard``, ``user_admin:bookings``,
+...), the wall time, the number of SQL queries and the time spent in them, and
+the time spent rendering templates. Each goes into a fixed-bucket histogram
+kept in this process, so recording is a few additions under a lock.
+
+Queries are counted through a wrapper installed on every database connection
+as it opens, and template rendering by wrapping the Django template backend.
+Both report to the current request through a context variable, so queries run
+by ``sync_to_async`` or ``gather_queries`` in other threads are counted too.
+
+Every worker process keeps its own numbers and tags them with a ``worker``
+label (its pid); sum over that label in queries. Admins can read the endpoint
+in the browser; set ``METRICS_TOKEN`` to let a scraper in with
+``Authorization: Bearer <token>``.
+"""
+import hmac
+import os
+import threading
+import time
+from asyncio import iscoroutinefunction
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.template.backends import django as django_backend
+from django.urls import Resolver404, resolve
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+UNRESOLVED_VIEW = '<unresolved>'
+
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', None)
+
+
+class RequestStats:
+    """What one request spent in the database and in templates"""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        # Concurrent queries of one request report from several threads
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds):
+        with self._lock:
+            self.queries += 1
+            self.sql_seconds += seconds
+
+    def add_template(self, seconds):
+        with self._lock:
+            self.template_seconds += seconds
+
+
+_current = ContextVar('request_metrics_stats', default=None)
+
+
+class Histogram:
+    """Prometheus-style histogram per label value, with cumulative buckets"""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                # One count per bucket plus +Inf, then the sum
+                series = self._series[label] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def exposition(self, extra_labels=''):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {label: list(values) for label, values in self._series.items()}
+        for label, values in sorted(series.items()):
+            labels = f'view="{_escape(label)}"{extra_labels}'
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{labels}}} {values[-1]}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+class Counter:
+    """Prometheus counter per ``(view, status)``"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, view, status):
+        with self._lock:
+            self._values[view, status] = self._values.get((view, status), 0) + 1
+
+    def exposition(self, extra_labels=''):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = dict(self._values)
+        for (view, status), value in sorted(values.items()):
+            lines.append(f'{self.name}{{view="{_escape(view)}",status="{status}"{extra_labels}}} {value}')
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+requests_total = Counter('bookmystyle_requests_total', 'Requests by view and status class.')
+request_seconds = Histogram(
+    'bookmystyle_request_duration_seconds', 'Wall time spent serving the request.', DURATION_BUCKETS,
+)
+query_count = Histogram('bookmystyle_request_db_queries', 'SQL queries run per request.', QUERY_COUNT_BUCKETS)
+sql_seconds = Histogram(
+    'bookmystyle_request_db_duration_seconds', 'Time spent in SQL queries per request.', DURATION_BUCKETS,
+)
+template_seconds = Histogram(
+    'bookmystyle_request_template_duration_seconds', 'Time spent rendering templates per request.', DURATION_BUCKETS,
+)
+
+METRICS = (requests_total, request_seconds, query_count, sql_seconds, template_seconds)
+
+
+def record(view, status, wall, stats):
+    requests_total.inc(view, f'{status // 100}xx')
+    request_seconds.observe(view, wall)
+    query_count.observe(view, stats.queries)
+    sql_seconds.observe(view, stats.sql_seconds)
+    template_seconds.observe(view, stats.template_seconds)
+
+
+def exposition():
+    """All metrics of this process in the Prometheus text format"""
+    worker = f',worker="{os.getpid()}"'
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.exposition(worker))
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    for metric in METRICS:
+        metric.reset()
+
+
+# Hooks
+
+def _timed_execute(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(time.perf_counter() - started)
+
+
+def _install_query_timer(sender, connection, **kwargs):
+    # Fired again whenever a closed connection reconnects
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+connection_created.connect(_install_query_timer, dispatch_uid='request_metrics_query_timer')
+
+_render = django_backend.Template.render
+
+
+def _timed_render(self, context=None, request=None):
+    stats = _current.get()
+    if stats is None:
+        return _render(self, context, request)
+    started = time.perf_counter()
+    try:
+        return _render(self, context, request)
+    finally:
+        stats.add_template(time.perf_counter() - started)
+
+
+class _MeteredBody:
+    """
+    Streaming body that counts its queries and templates toward its request,
+    and records the request once the server closes the response.
+    """
+
+    def __init__(self, content, stats, finish):
+        self._content = content
+        self._stats = stats
+        self._finish = finish
+
+    def close(self):
+        finish, self._finish = self._finish, None
+        if finish is not None:
+            finish()
+
+
+class _SyncMeteredBody(_MeteredBody):
+
+    def __init__(self, content, stats, finish):
+        super().__init__(iter(content), stats, finish)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = _current.set(self._stats)
+        try:
+            return next(self._content)
+        finally:
+            _current.reset(token)
+
+
+class _AsyncMeteredBody(_MeteredBody):
+
+    def __init__(self, content, stats, finish):
+        super().__init__(aiter(content), stats, finish)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        token = _current.set(self._stats)
+        try:
+            return await anext(self._content)
+        finally:
+            _current.reset(token)
+
+
+class RequestMetricsMiddleware:
+    """
+    Record wall, SQL and template time of each request under its URL name.
+
+    Streaming responses are recorded when the server closes them, so their
+    numbers include generating and sending the body.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Only patched once the middleware is enabled, so it costs nothing otherwise
+        django_backend.Template.render = _timed_render
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._record(request, response, started, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._record(request, response, started, stats)
+
+    def _record(self, request, response, started, stats):
+        if not response.streaming:
+            self._observe(request, response, time.perf_counter() - started, stats)
+            return response
+
+        def finish():
+            self._observe(request, response, time.perf_counter() - started, stats)
+
+        body = _AsyncMeteredBody if response.is_async else _SyncMeteredBody
+        response.streaming_content = body(response.streaming_content, stats, finish)
+        return response
+
+    def _observe(self, request, response, wall, stats):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            # A middleware answered before the URL was resolved, e.g. a role redirect
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                match = None
+        view = match.view_name if match is not None else UNRESOLVED_VIEW
+        record(view, response.status_code, wall, stats)
+
+
+def metrics_allowed(request):
+    """Admins, or a scraper presenting ``METRICS_TOKEN``"""
+    if METRICS_TOKEN:
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Bearer ') and hmac.compare_digest(header[len('Bearer '):], METRICS_TOKEN):
+            return True
+    user = request.user
+    return user.is_authenticated and user.is_admin
@@ -0,0 +1,211 @@
+"""
+On-demand profiling of single production requests.
+
+Enable with::
+
+    MIDDLEWARE = [..., 'django.contrib.auth.middleware.AuthenticationMiddleware',
+                  'user_accounts.request_profiling.RequestProfilingMiddleware', ...]
+
+An admin gets a token with ``manage.py list_profiles --token <email>`` and
+sends it in an ``X-Profile`` header (or as ``?_profile=<token>``). That request
+alone then runs under ``cProfile``; its stats are written to
+``REQUEST_PROFILE_DIR`` next to a JSON file holding the URL name, status,
+timings and every SQL statement it ran, and the response carries the profile
+id in ``X-Profile-Id``. ``manage.py list_profiles`` lists and summarizes them.
+
+Tokens are signed, tied to the admin who requested them and expire after
+``REQUEST_PROFILE_TOKEN_MAX_AGE`` seconds. Requests without the flag only pay
+for one header lookup and one substring check of the query string.
+
+Profiling needs a WSGI worker. ``cProfile`` only sees the thread that enables
+it, and under ASGI the view runs on another thread than this middleware, so
+profiling tokens are refused there with a 400. Under WSGI, async views run
+their own code on an event loop thread that the stats miss; the ORM calls
+they make through ``sync_to_async`` (and their SQL) are still recorded.
+
+The SQL log is an execute wrapper on the request thread's connections (and
+on ``gather_queries`` workers), installed only while a profiled request runs.
+"""
+import cProfile
+import json
+import os
+import threading
+import time
+from asyncio import iscoroutinefunction
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.http import HttpResponseBadRequest
+from django.urls import Resolver404, resolve
+
+
+PROFILE_DIR = getattr(
+    settings, 'REQUEST_PROFILE_DIR',
+    os.path.join(getattr(settings, 'BASE_DIR', os.getcwd()), 'var', 'profiles'),
+)
+TOKEN_MAX_AGE = getattr(settings, 'REQUEST_PROFILE_TOKEN_MAX_AGE', 60 * 60)
+MAX_LOGGED_QUERIES = 2000
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_PARAM = '_profile'
+
+_signer = signing.TimestampSigner(salt='user_accounts.request_profiling')
+
+
+def make_token(user):
+    """Token that lets ``user`` (an admin) profile their own requests"""
+    return _signer.sign(str(user.pk))
+
+
+def _token(request):
+    token = request.META.get(PROFILE_HEADER)
+    if token is None and f'{PROFILE_PARAM}=' in request.META.get('QUERY_STRING', ''):
+        token = request.GET.get(PROFILE_PARAM)
+    return token
+
+
+def _token_allowed(request, token):
+    try:
+        user_id = _signer.unsign(token, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    user = request.user
+    return user.is_authenticated and user.is_admin and str(user.pk) == user_id
+
+
+class QueryLog:
+    """SQL statements of the profiled request, from whichever thread ran them"""
+
+    def __init__(self):
+        self.queries = []
+        self._lock = threading.Lock()
+
+    def add(self, sql, many, seconds):
+        with self._lock:
+            if len(self.queries) < MAX_LOGGED_QUERIES:
+                self.queries.append({'sql': sql, 'many': many, 'ms': round(seconds * 1000, 3)})
+
+
+_query_log = ContextVar('request_profiling_queries', default=None)
+
+
+def _logged_execute(execute, sql, params, many, context):
+    log = _query_log.get()
+    if log is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        # Statements only, not parameters: the files may be shared outside the admin team
+        log.add(sql, many, time.perf_counter() - started)
+
+
+@contextmanager
+def logging_queries():
+    """Record this thread's SQL into the profiled request's log, if one is running"""
+    if _query_log.get() is None:
+        yield
+        return
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(_logged_execute))
+        yield
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return '<unresolved>'
+    return match.view_name
+
+
+def save_profile(request, response, profiler, log, wall):
+    """Write the stats and their JSON description; returns the profile id"""
+    view = _view_name(request)
+    profile_id = f'{datetime.now():%Y%m%d-%H%M%S-%f}-{view.replace(":", "-")}-{os.getpid()}'
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f'{profile_id}.prof'))
+    meta = {
+        'id': profile_id,
+        'view': view,
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'user_id': request.user.pk,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'wall_ms': round(wall * 1000, 3),
+        'sql_ms': round(sum(query['ms'] for query in log.queries), 3),
+        'query_count': len(log.queries),
+        'queries': log.queries,
+    }
+    with open(os.path.join(PROFILE_DIR, f'{profile_id}.json'), 'w') as fh:
+        json.dump(meta, fh, indent=1)
+    return profile_id
+
+
+def load_profiles():
+    """Descriptions of the saved profiles, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith('.json'):
+            with open(os.path.join(PROFILE_DIR, name)) as fh:
+                profiles.append(json.load(fh))
+    return sorted(profiles, key=lambda meta: meta['id'], reverse=True)
+
+
+def stats_path(profile_id):
+    return os.path.join(PROFILE_DIR, f'{profile_id}.prof')
+
+
+class RequestProfilingMiddleware:
+    """
+    Profile requests that carry a valid admin profiling token.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _token(request)
+        if token is None or not _token_allowed(request, token):
+            return self.get_response(request)
+
+        log = QueryLog()
+        log_token = _query_log.set(log)
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            with logging_queries():
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+        finally:
+            _query_log.reset(log_token)
+        response['X-Profile-Id'] = save_profile(request, response, profiler, log, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        token = _token(request)
+        # Checking the token loads the session and user from the database
+        if token is None or not await sync_to_async(_token_allowed)(request, token):
+            return await self.get_response(request)
+        return HttpResponseBadRequest('Request profiling only runs under WSGI.')
@@ -0,0 +1,187 @@
+"""
+Incremental daily rollups behind the salon analytics page.
+
+Saving or deleting a booking or payment refreshes the salon-days it touches
+right away from signals (neither model has a change timestamp, so a status
+change would otherwise go unnoticed). ``update_rollups`` catches up with rows
+written without signals: it looks only at bookings and payments created since
+its last run, collects the salon-days they touch and recomputes just those
+rows of ``SalonDailyStats``.
+"""
+import operator
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from functools import reduce
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from .models import ArchivedBooking, ArchivedPayment, SalonDailyStats
+
+
+WATERMARK_KEY = 'rollups:watermark'
+# Rows committed slightly out of order are picked up by overlapping runs
+WATERMARK_OVERLAP = timedelta(minutes=5)
+BATCH_SIZE = 500
+
+PAID_PAYMENT_STATUSES = getattr(settings, 'ANALYTICS_PAID_PAYMENT_STATUSES', ('completed',))
+STATUS_FIELDS = {
+    'pending': 'pending_bookings',
+    'confirmed': 'confirmed_bookings',
+    'completed': 'completed_bookings',
+    'cancelled': 'cancelled_bookings',
+}
+
+
+def changed_salon_days(since):
+    """Distinct ``(salon_id, date)`` pairs with bookings or payments created after ``since``"""
+    from booking_system.models import Booking, Payment
+
+    days = set()
+    bookings = Booking.objects.all()
+    if since is not None:
+        bookings = bookings.filter(created_at__gt=since)
+    days.update(bookings.values_list('salon_id', 'appointment_date').distinct())
+
+    payments = Payment.objects.all()
+    if since is not None:
+        payments = payments.filter(created_at__gt=since)
+    days.update(payments.values_list('booking__salon_id', 'booking__appointment_date').distinct())
+    return days
+
+
+def compute_salon_days(salon_days):
+    """Build unsaved ``SalonDailyStats`` for the given ``(salon_id, date)`` pairs"""
+    from booking_system.models import Booking, Payment
+
+    salon_days = set(salon_days)
+    if not salon_days:
+        return []
+    dates_by_salon = defaultdict(set)
+    for salon_id, day in salon_days:
+        dates_by_salon[salon_id].add(day)
+
+    def pairs(prefix=''):
+        # Only the requested salon-days, not every requested salon on every requested date
+        return reduce(operator.or_, (
+            Q(**{f'{prefix}salon_id': salon_id, f'{prefix}appointment_date__in': dates})
+            for salon_id, dates in dates_by_salon.items()
+        ), Q())
+
+    stats = {
+        (salon_id, day): SalonDailyStats(salon_id=salon_id, date=day, service_counts={}, hourly_counts={})
+        for salon_id, day in salon_days
+    }
+
+    # Archived history still counts; rows only move between the two tables
+    booking_sources = (
+        (Booking.objects.filter(pairs()), 'service__name'),
+        (ArchivedBooking.objects.filter(pairs()), 'service_name'),
+    )
+    for bookings, service_name_field in booking_sources:
+        for salon_id, day, status, count in bookings.values_list(
+            'salon_id', 'appointment_date', 'status',
+        ).annotate(count=Count('id')).order_by():
+            row = stats.get((salon_id, day))
+            if row is None:
+                continue
+            row.total_bookings += count
+            if status in STATUS_FIELDS:
+                setattr(row, STATUS_FIELDS[status], getattr(row, STATUS_FIELDS[status]) + count)
+
+        for salon_id, day, service_name, count in bookings.exclude(status='cancelled').values_list(
+            'salon_id', 'appointment_date', service_name_field,
+        ).annotate(count=Count('id')).order_by():
+            row = stats.get((salon_id, day))
+            if row is not None:
+                row.service_counts[service_name] = row.service_counts.get(service_name, 0) + count
+
+        for salon_id, day, hour, count in bookings.exclude(status='cancelled').annotate(
+            hour=ExtractHour('appointment_time'),
+        ).values_list('salon_id', 'appointment_date', 'hour').annotate(count=Count('id')).order_by():
+            row = stats.get((salon_id, day))
+            if row is not None:
+                row.hourly_counts[str(hour)] = row.hourly_counts.get(str(hour), 0) + count
+
+    payment_sources = (
+        Payment.objects.filter(pairs('booking__'), status__in=PAID_PAYMENT_STATUSES),
+        ArchivedPayment.objects.filter(pairs('booking__'), status__in=PAID_PAYMENT_STATUSES),
+    )
+    for payments in payment_sources:
+        for salon_id, day, revenue in payments.values_list(
+            'booking__salon_id', 'booking__appointment_date',
+        ).annotate(revenue=Sum('amount')).order_by():
+            row = stats.get((salon_id, day))
+            if row is not None:
+                row.revenue += revenue or Decimal('0')
+
+    return list(stats.values())
+
+
+def refresh_salon_days(salon_days):
+    """Recompute and upsert the rollup rows of the given salon-days"""
+    salon_days = list(salon_days)
+    for start in range(0, len(salon_days), BATCH_SIZE):
+        rows = compute_salon_days(salon_days[start:start + BATCH_SIZE])
+        now = timezone.now()
+        for row in rows:
+            row.refreshed_at = now
+        with transaction.atomic():
+            SalonDailyStats.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=['salon', 'date'],
+                update_fields=[
+                    'total_bookings', 'pending_bookings', 'confirmed_bookings',
+                    'completed_bookings', 'cancelled_bookings', 'revenue',
+                    'service_counts', 'hourly_counts', 'refreshed_at',
+                ],
+            )
+    return len(salon_days)
+
+
+def update_rollups():
+    """Refresh every salon-day with rows created since the previous run. Returns the rows refreshed."""
+    started = timezone.now()
+    since = cache.get(WATERMARK_KEY)
+    if since is None:
+        # Cache was cleared: resume from the newest rollup, or backfill everything
+        since = SalonDailyStats.objects.aggregate(latest=Max('refreshed_at'))['latest']
+    if since is not None:
+        since -= WATERMARK_OVERLAP
+    refreshed = refresh_salon_days(changed_salon_days(since))
+    cache.set(WATERMARK_KEY, started, None)
+    return refreshed
+
+
+def salon_summary(salon_ids, start_date, end_date):
+    """Totals for the analytics page from the rollup rows of ``salon_ids``"""
+    rows = SalonDailyStats.objects.filter(
+        salon_id__in=salon_ids, date__gte=start_date, date__lte=end_date,
+    ).order_by('date')
+
+    summary = {status: 0 for status in STATUS_FIELDS}
+    summary.update(total=0, revenue=Decimal('0'))
+    services = Counter()
+    hours = Counter()
+    daily = defaultdict(lambda: {'bookings': 0, 'revenue': Decimal('0')})
+    for row in rows:
+        summary['total'] += row.total_bookings
+        for status, field in STATUS_FIELDS.items():
+            summary[status] += getattr(row, field)
+        summary['revenue'] += row.revenue
+        services.update(row.service_counts)
+        hours.update({int(hour): count for hour, count in row.hourly_counts.items()})
+        daily[row.date]['bookings'] += row.total_bookings
+        daily[row.date]['revenue'] += row.revenue
+
+    summary['cancellation_rate'] = summary['cancelled'] / summary['total'] if summary['total'] else 0
+    summary['top_services'] = services.most_common(5)
+    summary['peak_hours'] = sorted(hours.items(), key=lambda item: (-item[1], item[0]))[:5]
+    summary['daily'] = sorted(daily.items())
+    return summary
@@ -9,7 +9,9 @@ urlpatterns = [
     path('salons/create/', views.create_salon, name='create_salon'),
     path('salons/<int:salon_id>/edit/', views.edit_salon, name='edit_salon'),
     path('bookings/', views.salon_owner_bookings, name='bookings'),
+    path('bookings/export/', views.export_salon_owner_bookings, name='export_bookings'),
     path('bookings/<int:booking_id>/approve/', views.approve_booking, name='approve_booking'),
+    path('bookings/bulk/', views.bulk_moderate_bookings, name='bulk_moderate_bookings'),
     path('bookings/<int:booking_id>/cancel/', views.cancel_booking, name='cancel_booking'),
     path('staff/', views.manage_staff, name='staff'),
     path('analytics/', views.salon_analytics, name='analytics'),
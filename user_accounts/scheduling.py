@@ -0,0 +1,194 @@
+"""
+Duration-aware, staff-aware scheduling engine.
+
+A salon-day is modelled as one bitset per staff member where bit ``i`` stands
+for the 5-minute tick starting at minute ``i * 5`` of the day. A set bit in a
+busy mask means the staff member is booked during that tick. Python integers
+are arbitrary-precision, so every operation below works on a whole day at once:
+finding all start times for a service of any length is a handful of
+shift-and-AND steps per staff member rather than a scan over bookings.
+"""
+import math
+
+from django.core.exceptions import ValidationError
+
+from .availability import ACTIVE_BOOKING_STATUSES, duration_minutes, minutes_of
+
+
+TICK_MINUTES = 5
+TICKS_PER_DAY = 24 * 60 // TICK_MINUTES
+FULL_DAY = (1 << TICKS_PER_DAY) - 1
+
+# Salons without Staff rows are modelled as a single anonymous chair
+ANONYMOUS_STAFF = 0
+
+
+def interval_mask(start_minute, length):
+    """Bitset of the ticks covered by ``length`` minutes from ``start_minute``"""
+    first = start_minute // TICK_MINUTES
+    last = min(TICKS_PER_DAY, math.ceil((start_minute + length) / TICK_MINUTES))
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def run_starts(free, ticks):
+    """
+    Bitset of positions ``i`` where ticks ``i .. i + ticks - 1`` are all free.
+
+    Uses doubling: after each step ``result`` marks the starts of free runs of
+    length ``covered``, so the loop runs ``O(log ticks)`` times.
+    """
+    result = free
+    covered = 1
+    while covered < ticks:
+        shift = min(covered, ticks - covered)
+        result &= result >> shift
+        covered += shift
+    return result
+
+
+def iter_bits(mask):
+    """Yield the positions of the set bits of ``mask`` in ascending order"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class DaySchedule:
+    """
+    Busy intervals of every staff member of a salon on one day.
+
+    ``open_mask`` marks the ticks during which the salon accepts appointments.
+    Bookings without a staff member are assigned to the first staff member who
+    is free for their whole duration, the same rule ``assign`` applies to new
+    bookings.
+    """
+
+    def __init__(self, open_mask, staff_ids):
+        self.open_mask = open_mask
+        self.busy = {staff_id: 0 for staff_id in staff_ids}
+        self.unplaced = 0
+
+    def free_mask(self, staff_id):
+        return self.open_mask & ~self.busy[staff_id]
+
+    def is_free(self, staff_id, start_minute, length):
+        needed = interval_mask(start_minute, length)
+        return self.free_mask(staff_id) & needed == needed
+
+    def assign(self, start_minute, length):
+        """First staff member free for the whole interval, or ``None``"""
+        for staff_id in self.busy:
+            if self.is_free(staff_id, start_minute, length):
+                return staff_id
+        return None
+
+    def book(self, start_minute, length, staff_id=None):
+        """
+        Mark an interval busy for ``staff_id`` (or whoever is free).
+
+        Returns the staff member the interval was placed on. Overlapping
+        existing bookings are still recorded; ``unplaced`` counts bookings that
+        no staff member could take.
+        """
+        if staff_id is None or staff_id not in self.busy:
+            staff_id = self.assign(start_minute, length)
+        if staff_id is None:
+            self.unplaced += 1
+            return None
+        self.busy[staff_id] |= interval_mask(start_minute, length)
+        return staff_id
+
+    def start_mask(self, length, staff_id=None):
+        """Bitset of ticks at which ``length`` minutes fit for any (or one) staff member"""
+        ticks = max(1, math.ceil(length / TICK_MINUTES))
+        staff_ids = [staff_id] if staff_id is not None else self.busy
+        starts = 0
+        for member in staff_ids:
+            starts |= run_starts(self.free_mask(member), ticks)
+        return starts & FULL_DAY
+
+    def feasible_starts(self, length, step_minutes=TICK_MINUTES, staff_id=None):
+        """Start minutes of the day at which a service of ``length`` minutes fits"""
+        step = max(1, step_minutes // TICK_MINUTES)
+        return [
+            tick * TICK_MINUTES
+            for tick in iter_bits(self.start_mask(length, staff_id))
+            if tick % step == 0
+        ]
+
+    def free_staff_count(self, start_minute, length):
+        """Number of staff members free for the whole interval"""
+        return sum(1 for staff_id in self.busy if self.is_free(staff_id, start_minute, length))
+
+
+def opening_mask(open_time, close_time):
+    """Bitset of the ticks between ``open_time`` and ``close_time``"""
+    open_minute = minutes_of(open_time)
+    return interval_mask(open_minute, minutes_of(close_time) - open_minute)
+
+
+def load_day(salon_id, day, exclude_booking_id=None, hold_owner=None, with_holds=True):
+    """
+    Build the ``DaySchedule`` of a salon-day from the database.
+
+    Live slot holds of everyone but ``hold_owner`` count as busy, unless
+    ``with_holds`` is false (the availability index applies holds itself).
+    """
+    from salon_management.models import Staff
+    from booking_system.models import Booking
+    from . import holds
+    from .opening_hours import day_mask
+
+    open_mask = day_mask(salon_id, day)
+    staff_ids = list(Staff.objects.filter(salon_id=salon_id).order_by('id').values_list('id', flat=True))
+    schedule = DaySchedule(open_mask, staff_ids or [ANONYMOUS_STAFF])
+
+    bookings = Booking.objects.filter(
+        salon_id=salon_id,
+        appointment_date=day,
+        status__in=ACTIVE_BOOKING_STATUSES,
+    ).exclude(pk=exclude_booking_id).values_list('appointment_time', 'service__duration', 'staff_id')
+    # Bookings pinned to a staff member first, then the rest in time order
+    for start_time, duration, staff_id in sorted(bookings, key=lambda row: (row[2] is None, row[0])):
+        schedule.book(minutes_of(start_time), duration_minutes(duration), staff_id)
+    if with_holds:
+        for staff_id, start_minute, length in holds.other_holds(salon_id, day, hold_owner):
+            schedule.book(start_minute, length, staff_id)
+    return schedule
+
+
+def find_start_times(salon_id, day, service, staff_id=None, step_minutes=TICK_MINUTES, hold_owner=None):
+    """Feasible ``HH:MM`` start times for ``service`` at a salon on ``day``"""
+    schedule = load_day(salon_id, day, hold_owner=hold_owner)
+    starts = schedule.feasible_starts(duration_minutes(service.duration), step_minutes, staff_id)
+    return [f'{minute // 60:02d}:{minute % 60:02d}' for minute in starts]
+
+
+def validate_booking_slot(salon_id, day, start_time, service, staff_id=None, exclude_booking_id=None,
+                          hold_owner=None):
+    """
+    Raise ``ValidationError`` unless the slot can still be booked.
+
+    Shared by ``BookingSlotForm.clean``, the booking API and ``create_booking``,
+    so they all apply the same conflict rules. Slots held by anyone but
+    ``hold_owner`` count as taken. Returns the staff member the booking fits on.
+    """
+    schedule = load_day(salon_id, day, exclude_booking_id=exclude_booking_id, hold_owner=hold_owner)
+    start_minute = minutes_of(start_time)
+    length = duration_minutes(service.duration)
+
+    if interval_mask(start_minute, length) & ~schedule.open_mask:
+        raise ValidationError('The salon is not open for the whole appointment.')
+    if staff_id is not None:
+        if staff_id == ANONYMOUS_STAFF or staff_id not in schedule.busy:
+            raise ValidationError('The selected stylist does not work at this salon.')
+        if not schedule.is_free(staff_id, start_minute, length):
+            raise ValidationError('The selected stylist is already booked at this time.')
+        return staff_id
+    assigned = schedule.assign(start_minute, length)
+    if assigned is None:
+        raise ValidationError('The selected time is no longer available.')
+    return assigned or None
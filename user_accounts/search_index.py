@@ -0,0 +1,215 @@
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+AUTOCOMPLETE_VERSION_KEY = 'autocomplete:version'
+# How long a worker trusts its copy before asking the cache for the shared version
+VERSION_CHECK_SECONDS = getattr(settings, 'AUTOCOMPLETE_VERSION_CHECK_SECONDS', 2)
+
+
+def normalize(text):
+    """Lower-case and collapse whitespace so lookups are case-insensitive"""
+    return ' '.join((text or '').lower().split())
+
+
+class PrefixIndex:
+    """
+    Sorted-array prefix index for typeahead lookups.
+
+    Entries are kept as a sorted list of ``(key, kind, label, ref)`` tuples so a
+    prefix query is one ``bisect`` plus a short forward scan. ``ref`` identifies the
+    source row (for example ``('salon', 12)``) so entries can be replaced or
+    removed when that row changes.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._refs = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self._refs = {}
+
+    def add(self, ref, kind, label):
+        """Add a single searchable label that belongs to ``ref``"""
+        key = normalize(label)
+        if not key:
+            return
+        entry = (key, kind, label, ref)
+        with self._lock:
+            position = bisect.bisect_left(self._entries, entry)
+            if position < len(self._entries) and self._entries[position] == entry:
+                return
+            self._entries.insert(position, entry)
+            self._refs.setdefault(ref, []).append(entry)
+
+    def remove(self, ref):
+        """Remove every label that belongs to ``ref``"""
+        with self._lock:
+            for entry in self._refs.pop(ref, []):
+                position = bisect.bisect_left(self._entries, entry)
+                if position < len(self._entries) and self._entries[position] == entry:
+                    del self._entries[position]
+
+    def replace(self, ref, labels):
+        """Atomically swap the labels of ``ref`` for ``labels`` ((kind, label) pairs)"""
+        with self._lock:
+            self.remove(ref)
+            for kind, label in labels:
+                self.add(ref, kind, label)
+
+    def bulk_load(self, items):
+        """Replace the whole index from ``(ref, kind, label)`` triples"""
+        entries = []
+        refs = {}
+        for ref, kind, label in items:
+            key = normalize(label)
+            if not key:
+                continue
+            entry = (key, kind, label, ref)
+            entries.append(entry)
+            refs.setdefault(ref, []).append(entry)
+        entries = sorted(set(entries))
+        with self._lock:
+            self._entries = entries
+            self._refs = refs
+
+    def search(self, prefix, limit=10):
+        """
+        Return up to ``limit`` suggestions whose label starts with ``prefix``.
+
+        City and service labels are de-duplicated, so ten salons in "Mumbai"
+        produce a single city suggestion; salons are always listed separately.
+        """
+        key = normalize(prefix)
+        if not key:
+            return []
+        entries = self._entries
+        start = bisect.bisect_left(entries, (key,))
+        results = []
+        seen = set()
+        for position in range(start, len(entries)):
+            entry_key, kind, label, ref = entries[position]
+            if not entry_key.startswith(key):
+                break
+            identity = ref if kind == 'salon' else (kind, entry_key)
+            if identity in seen:
+                continue
+            seen.add(identity)
+            result = {'type': kind, 'label': label}
+            if kind == 'salon':
+                result['salon_id'] = ref[1]
+            results.append(result)
+            if len(results) >= limit:
+                break
+        return results
+
+
+class AutocompleteIndex(PrefixIndex):
+    """
+    Process-wide index over approved salon names, cities and service names.
+
+    The index is loaded lazily on first use and then kept current by the
+    ``Salon``/``Service`` signal handlers in ``user_accounts.signals`` once the
+    change has committed. Each change also bumps a shared cache version, so
+    other worker processes notice they are stale and reload; they look at the
+    version at most every ``VERSION_CHECK_SECONDS`` rather than per keystroke.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._version = None
+        self._checked_at = None
+
+    def _shared_version(self):
+        self._checked_at = time.monotonic()
+        return cache.get(AUTOCOMPLETE_VERSION_KEY, 0)
+
+    def _bump_version(self):
+        try:
+            version = cache.incr(AUTOCOMPLETE_VERSION_KEY)
+            self._checked_at = time.monotonic()
+        except ValueError:
+            cache.add(AUTOCOMPLETE_VERSION_KEY, 1, None)
+            version = self._shared_version()
+        # Another process changed the index since we last synced; our local
+        # copy is missing that change, so reload on the next lookup.
+        if self._version is None or version != self._version + 1:
+            self._version = None
+        else:
+            self._version = version
+
+    def rebuild(self):
+        """Reload the whole index from the database"""
+        from salon_management.models import Salon, Service
+
+        items = []
+        for salon_id, name, city in Salon.objects.filter(status='approved').values_list('id', 'name', 'city'):
+            items.append((('salon', salon_id), 'salon', name))
+            items.append((('salon', salon_id), 'city', city))
+        services = Service.objects.filter(salon__status='approved').values_list('id', 'name')
+        for service_id, name in services:
+            items.append((('service', service_id), 'service', name))
+
+        version = self._shared_version()
+        self.bulk_load(items)
+        self._version = version
+
+    def ensure_current(self):
+        if self._version is not None and time.monotonic() - self._checked_at < VERSION_CHECK_SECONDS:
+            return
+        if self._version is None or self._version != self._shared_version():
+            self.rebuild()
+
+    def search(self, prefix, limit=10):
+        self.ensure_current()
+        return super().search(prefix, limit)
+
+    def update_salon(self, salon):
+        """Re-index a salon after it was saved"""
+        if self._version is None:
+            self._bump_version()
+            return
+        from salon_management.models import Service
+
+        ref = ('salon', salon.pk)
+        if salon.status == 'approved':
+            self.replace(ref, [('salon', salon.name), ('city', salon.city)])
+            services = Service.objects.filter(salon=salon).values_list('id', 'name')
+            for service_id, name in services:
+                self.replace(('service', service_id), [('service', name)])
+        else:
+            self.remove(ref)
+            for service_id in Service.objects.filter(salon=salon).values_list('id', flat=True):
+                self.remove(('service', service_id))
+        self._bump_version()
+
+    def update_service(self, service):
+        """Re-index a service after it was saved"""
+        if self._version is None:
+            self._bump_version()
+            return
+        ref = ('service', service.pk)
+        if service.salon.status == 'approved':
+            self.replace(ref, [('service', service.name)])
+        else:
+            self.remove(ref)
+        self._bump_version()
+
+    def remove_ref(self, kind, pk):
+        """Drop a deleted salon or service from the index"""
+        if self._version is not None:
+            self.remove((kind, pk))
+        self._bump_version()
+
+
+autocomplete_index = AutocompleteIndex()
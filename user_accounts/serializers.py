@@ -0,0 +1,62 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+
+from .bookings import create_booking
+from .scheduling import validate_booking_slot
+from salon_management.models import Salon, Service, Staff
+from booking_system.models import Booking
+
+
+class BookingCreateSerializer(serializers.Serializer):
+    """Everything needed to create a booking in a single request"""
+    salon = serializers.PrimaryKeyRelatedField(queryset=Salon.objects.filter(status='approved'))
+    service = serializers.PrimaryKeyRelatedField(queryset=Service.objects.all())
+    staff = serializers.PrimaryKeyRelatedField(queryset=Staff.objects.all(), required=False, allow_null=True)
+    appointment_date = serializers.DateField()
+    appointment_time = serializers.TimeField()
+    
+    def validate(self, attrs):
+        salon = attrs['salon']
+        if attrs['service'].salon_id != salon.id:
+            raise serializers.ValidationError({'service': 'This service is not offered by the selected salon.'})
+        staff = attrs.get('staff')
+        if staff is not None and staff.salon_id != salon.id:
+            raise serializers.ValidationError({'staff': 'This stylist does not work at the selected salon.'})
+        
+        try:
+            attrs['staff_id'] = validate_booking_slot(
+                salon.id,
+                attrs['appointment_date'],
+                attrs['appointment_time'],
+                attrs['service'],
+                staff_id=staff.id if staff else None,
+            )
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({'appointment_time': exc.messages})
+        return attrs
+    
+    def create(self, validated_data):
+        try:
+            return create_booking(
+                self.context['request'].user,
+                validated_data['salon'],
+                validated_data['service'],
+                validated_data['appointment_date'],
+                validated_data['appointment_time'],
+                staff_id=validated_data['staff_id'],
+            )
+        except DjangoValidationError as exc:
+            raise serializers.ValidationError({'appointment_time': exc.messages})
+
+
+class BookingSerializer(serializers.ModelSerializer):
+    salon_name = serializers.CharField(source='salon.name', read_only=True)
+    service_name = serializers.CharField(source='service.name', read_only=True)
+    
+    class Meta:
+        model = Booking
+        fields = (
+            'id', 'salon', 'salon_name', 'service', 'service_name', 'staff',
+            'appointment_date', 'appointment_time', 'status', 'created_at',
+        )
+        read_only_fields = fields
@@ -0,0 +1,288 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from . import availability, opening_hours, page_versions, profile_counters
+from .reminders import update_reminders
+from .search_index import autocomplete_index
+
+
+# Sent once after a bulk status change of bookings has been committed, with
+# ``bookings`` (a list of dicts holding id, salon_id, customer_id,
+# appointment_date, appointment_time, service_id and the previous status) and
+# the new ``status``. Bulk updates skip the per-row save signals, so anything
+# that reacts to booking changes must also listen here.
+bookings_bulk_updated = Signal()
+
+
+# Autocomplete index (updated after commit: bumping the version earlier would
+# let another worker rebuild without the uncommitted row and keep that copy)
+
+@receiver(post_save, sender='salon_management.Salon')
+def index_salon(sender, instance, **kwargs):
+    salon_id = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.update_salon(instance))
+    transaction.on_commit(lambda: opening_hours.compile_salon(salon_id))
+
+
+@receiver(post_delete, sender='salon_management.Salon')
+def unindex_salon(sender, instance, **kwargs):
+    salon_id = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove_ref('salon', salon_id))
+    transaction.on_commit(lambda: opening_hours.forget_salon(salon_id))
+
+
+@receiver(post_save, sender='salon_management.Service')
+def index_service(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocomplete_index.update_service(instance))
+
+
+@receiver(post_delete, sender='salon_management.Service')
+def unindex_service(sender, instance, **kwargs):
+    service_id = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove_ref('service', service_id))
+
+
+# Availability index
+
+# What the booking receivers below compare before and after a save
+STORED_BOOKING_FIELDS = tuple(dict.fromkeys(availability.SLOT_FIELDS + profile_counters.STATE_FIELDS))
+
+
+@receiver(pre_save, sender='booking_system.Booking')
+def remember_stored_booking(sender, instance, raw=False, **kwargs):
+    # Read from the stored row when saving: a post_init receiver would run for every Booking loaded
+    if not raw:
+        instance._stored_row = availability.stored_booking_row(instance, STORED_BOOKING_FIELDS)
+
+
+@receiver(post_save, sender='booking_system.Booking')
+def update_availability_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_slot = availability.row_slot(getattr(instance, '_stored_row', None))
+    new_slot = availability.booking_slot(instance)
+    if old_slot == new_slot:
+        return
+    if old_slot:
+        transaction.on_commit(lambda: availability.apply_slot(old_slot, 1))
+    if new_slot:
+        transaction.on_commit(lambda: availability.apply_slot(new_slot, -1))
+
+
+@receiver(pre_delete, sender='booking_system.Booking')
+def update_availability_on_delete(sender, instance, **kwargs):
+    slot = availability.booking_slot(instance)
+    if slot:
+        transaction.on_commit(lambda: availability.apply_slot(slot, 1))
+
+
+@receiver(bookings_bulk_updated)
+def update_availability_on_bulk_update(sender, bookings, status, **kwargs):
+    if status in availability.ACTIVE_BOOKING_STATUSES:
+        return
+    released = {
+        (booking['salon_id'], booking['appointment_date'])
+        for booking in bookings
+        if booking['status'] in availability.ACTIVE_BOOKING_STATUSES
+    }
+    # One rebuild per salon-day is cheaper than adjusting slot by slot
+    availability.invalidate_days(released)
+
+
+@receiver(post_save, sender='salon_management.Staff')
+@receiver(post_delete, sender='salon_management.Staff')
+def invalidate_availability(sender, instance, **kwargs):
+    salon_id = instance.salon_id
+    transaction.on_commit(lambda: availability.invalidate_salon(salon_id))
+
+
+# Opening hours
+
+@receiver(post_save, sender='salon_management.SalonHours')
+@receiver(post_delete, sender='salon_management.SalonHours')
+@receiver(post_save, sender='user_accounts.SalonHoliday')
+@receiver(post_delete, sender='user_accounts.SalonHoliday')
+def recompile_opening_hours(sender, instance, **kwargs):
+    salon_id = instance.salon_id
+
+    def recompile():
+        opening_hours.compile_salon(salon_id)
+        availability.invalidate_salon(salon_id)
+
+    transaction.on_commit(recompile)
+
+
+# Public page validators
+
+@receiver(post_save, sender='salon_management.Salon')
+@receiver(post_delete, sender='salon_management.Salon')
+def mark_salon_changed(sender, instance, **kwargs):
+    salon_id = instance.pk
+    transaction.on_commit(lambda: page_versions.mark_changed('salons', f'salon:{salon_id}'))
+
+
+@receiver(post_save, sender='salon_management.Service')
+@receiver(post_delete, sender='salon_management.Service')
+@receiver(post_save, sender='salon_management.Staff')
+@receiver(post_delete, sender='salon_management.Staff')
+@receiver(post_save, sender='salon_management.SalonHours')
+@receiver(post_delete, sender='salon_management.SalonHours')
+@receiver(post_save, sender='booking_system.Review')
+@receiver(post_delete, sender='booking_system.Review')
+def mark_salon_content_changed(sender, instance, **kwargs):
+    salon_id = instance.salon_id
+    # The list shows ratings and prices too
+    transaction.on_commit(lambda: page_versions.mark_changed('salons', f'salon:{salon_id}'))
+
+
+# Appointment reminders
+
+@receiver(post_save, sender='booking_system.Booking')
+def schedule_reminder(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old_row = getattr(instance, '_stored_row', None)
+    new_row = availability.booking_row(instance, STORED_BOOKING_FIELDS)
+    booking_id = instance.pk
+    if new_row['status'] == 'confirmed':
+        when = (new_row['appointment_date'], new_row['appointment_time'])
+        if old_row and old_row['status'] == 'confirmed' and (
+            (old_row['appointment_date'], old_row['appointment_time']) == when
+        ):
+            # Already queued for this time
+            return
+        update_reminders(lambda scheduler: scheduler.schedule(booking_id, *when))
+    elif old_row and old_row['status'] == 'confirmed':
+        update_reminders(lambda scheduler: scheduler.cancel(booking_id))
+
+
+@receiver(post_delete, sender='booking_system.Booking')
+def cancel_reminder(sender, instance, **kwargs):
+    if 'status' not in instance.get_deferred_fields() and instance.status != 'confirmed':
+        return
+    booking_id = instance.pk
+    update_reminders(lambda scheduler: scheduler.cancel(booking_id))
+
+
+@receiver(bookings_bulk_updated)
+def schedule_reminders_on_bulk_update(sender, bookings, status, **kwargs):
+    def update(scheduler):
+        for booking in bookings:
+            if status == 'confirmed':
+                scheduler.schedule(booking['id'], booking['appointment_date'], booking['appointment_time'])
+            elif booking['status'] == 'confirmed':
+                scheduler.cancel(booking['id'])
+
+    update_reminders(update)
+
+
+# Analytics rollups (Booking and Payment have no change timestamp, so every
+# change made through the ORM refreshes its salon-days directly; the periodic
+# task picks up rows created without signals)
+
+def _refresh_rollups(salon_days):
+    from .tasks import refresh_salon_day_rollups
+
+    salon_days = sorted({(salon_id, day.isoformat()) for salon_id, day in salon_days})
+    if salon_days:
+        transaction.on_commit(lambda: refresh_salon_day_rollups.delay(salon_days))
+
+
+@receiver(post_save, sender='booking_system.Booking')
+def refresh_rollups_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    old_row = getattr(instance, '_stored_row', None)
+    new_row = availability.booking_row(instance, STORED_BOOKING_FIELDS)
+    if old_row != new_row:
+        _refresh_rollups((row['salon_id'], row['appointment_date']) for row in (old_row, new_row) if row)
+
+
+@receiver(post_save, sender='booking_system.Payment')
+@receiver(post_delete, sender='booking_system.Payment')
+def refresh_rollups_on_payment_change(sender, instance, raw=False, **kwargs):
+    from booking_system.models import Booking
+
+    if raw:
+        return
+    # When the booking itself is deleted its payments go first, while the booking row still exists
+    _refresh_rollups(
+        Booking.objects.filter(pk=instance.booking_id).values_list('salon_id', 'appointment_date')
+    )
+
+
+@receiver(post_delete, sender='booking_system.Booking')
+def refresh_rollups_on_delete(sender, instance, **kwargs):
+    _refresh_rollups([(instance.salon_id, instance.appointment_date)])
+
+
+@receiver(bookings_bulk_updated)
+def refresh_rollups_on_bulk_update(sender, bookings, status, **kwargs):
+    _refresh_rollups((booking['salon_id'], booking['appointment_date']) for booking in bookings)
+
+
+# Profile counters (updated in the saving transaction, so they commit or roll back with it)
+
+@receiver(post_save, sender='booking_system.Booking')
+def count_booking(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # The stored row as read by remember_stored_booking
+    old_state = profile_counters.row_state(getattr(instance, '_stored_row', None))
+    if old_state is None and not created:
+        # The row was not there before the save; reconcile_profile_counters catches up
+        return
+    new_state = profile_counters.row_state(availability.booking_row(instance, STORED_BOOKING_FIELDS))
+    profile_counters.booking_saved(old_state, new_state)
+
+
+# Salon id -> the delete() call (``origin``) that is cascading from it to the
+# salon's bookings, which uncount_salon_bookings has already uncounted
+_deleting_salons = {}
+
+
+@receiver(post_delete, sender='booking_system.Booking')
+@receiver(post_delete, sender='user_accounts.ArchivedBooking')
+def uncount_booking(sender, instance, origin=None, **kwargs):
+    if origin is not None and _deleting_salons.get(instance.salon_id) is origin:
+        return
+    state = profile_counters.booking_state(instance)
+    if state is not None:
+        profile_counters.booking_deleted(state)
+
+
+@receiver(pre_save, sender='salon_management.Salon')
+def remember_salon_owner(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Like remember_stored_booking: one read per save instead of a post_init receiver on every load
+    if raw or instance._state.adding or 'owner_id' in instance.get_deferred_fields():
+        instance._stored_owner_id = None
+        return
+    if update_fields is not None and 'owner' not in update_fields and 'owner_id' not in update_fields:
+        instance._stored_owner_id = instance.owner_id
+        return
+    instance._stored_owner_id = (
+        type(instance)._base_manager.filter(pk=instance.pk).values_list('owner_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender='salon_management.Salon')
+def count_salon(sender, instance, created, raw=False, **kwargs):
+    if raw or 'owner_id' in instance.get_deferred_fields():
+        return
+    old_owner_id = getattr(instance, '_stored_owner_id', None)
+    if created or old_owner_id is not None:
+        profile_counters.salon_saved(instance.pk, old_owner_id, instance.owner_id, created)
+
+
+@receiver(pre_delete, sender='salon_management.Salon')
+def uncount_salon_bookings(sender, instance, origin=None, **kwargs):
+    # Sent once the cascade is collected, before any of it is deleted
+    profile_counters.salon_bookings_deleted(instance.pk)
+    _deleting_salons[instance.pk] = origin
+
+
+@receiver(post_delete, sender='salon_management.Salon')
+def uncount_salon(sender, instance, **kwargs):
+    _deleting_salons.pop(instance.pk, None)
+    profile_counters.salon_deleted(instance.owner_id)
@@ -0,0 +1,421 @@
+"""
+Deterministic synthetic data for benchmarks and load tests.
+
+``generate`` creates users in the three roles, salons with opening hours,
+services and staff, and then bookings with their reviews, notifications and
+payments. Everything is drawn from one ``random.Random(seed)``, so the same
+arguments always produce the same rows. The data is skewed the way real
+traffic is:
+
+* salon popularity and customer activity follow Zipf-like distributions, so a
+  few salons and customers account for most bookings;
+* bookings cluster on Fridays and Saturdays and in the early evening, with
+  Saturday evenings the busiest;
+* most past bookings are completed, future ones confirmed or pending, and
+  about a third of completed bookings get a (mostly positive) review.
+
+Rows are written with ``bulk_create`` one batch per transaction, or with
+PostgreSQL ``COPY`` for the booking tables. Primary keys of bookings are
+assigned here so reviews and payments can reference them without reading them
+back. Only fields the models actually have are filled in. Bulk inserts skip
+model signals, so rebuild derived data (rollups, availability) afterwards.
+
+Overlapping bookings of the same staff member are not prevented; the data is
+meant for load, not for checking scheduling rules.
+"""
+import bisect
+import csv
+import io
+import itertools
+import random
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Avg, Count, Max
+from django.utils import timezone
+
+from .models import CustomerProfile, SalonOwnerProfile, User
+
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Carlos', 'Karen',
+    'Daniel', 'Lisa', 'Matthew', 'Nancy', 'Anthony', 'Sofia', 'Mark', 'Aisha', 'Kevin', 'Mei',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Jackson', 'Martin',
+    'Lee', 'Perez', 'Thompson', 'White', 'Harris', 'Sanchez', 'Clark', 'Nguyen', 'Patel', 'Kim',
+]
+# (city, state, relative size); bigger cities get more salons
+CITIES = [
+    ('New York', 'NY', 10), ('Los Angeles', 'CA', 8), ('Chicago', 'IL', 6), ('Houston', 'TX', 5),
+    ('Phoenix', 'AZ', 3), ('Philadelphia', 'PA', 3), ('San Antonio', 'TX', 3), ('San Diego', 'CA', 3),
+    ('Dallas', 'TX', 3), ('Austin', 'TX', 2), ('Seattle', 'WA', 2), ('Denver', 'CO', 2),
+    ('Boston', 'MA', 2), ('Miami', 'FL', 2), ('Atlanta', 'GA', 2), ('Portland', 'OR', 1),
+]
+SALON_WORDS = ['Glow', 'Luxe', 'Velvet', 'Shear', 'Bloom', 'Urban', 'Golden', 'Silk', 'Mirror', 'Crown', 'Halo', 'Edge']
+SALON_KINDS = ['Salon', 'Studio', 'Hair Lounge', 'Beauty Bar', 'Barbershop', 'Spa']
+# (name, price, duration in minutes)
+SERVICES = [
+    ('Haircut', 35, 30), ('Haircut & Style', 55, 45), ('Beard Trim', 20, 15), ('Blow Dry', 40, 30),
+    ('Hair Coloring', 120, 90), ('Highlights', 150, 120), ('Keratin Treatment', 220, 150), ('Manicure', 30, 30),
+    ('Pedicure', 45, 45), ('Gel Nails', 55, 60), ('Facial', 80, 60), ('Eyebrow Threading', 15, 15),
+    ('Waxing', 40, 30), ('Bridal Makeup', 250, 120), ('Scalp Massage', 35, 30), ('Kids Haircut', 20, 15),
+]
+REVIEW_COMMENTS = {
+    5: ['Absolutely loved it!', 'Best salon in town.', 'Great service, will be back.', 'Perfect as always.'],
+    4: ['Very good, slight wait.', 'Nice staff and result.', 'Good value for money.'],
+    3: ['It was okay.', 'Decent, nothing special.', 'Average experience.'],
+    2: ['Had to wait a long time.', 'Not what I asked for.'],
+    1: ['Very disappointed.', 'Would not recommend.'],
+}
+RATING_WEIGHTS = [(5, 45), (4, 30), (3, 13), (2, 7), (1, 5)]
+PAYMENT_METHODS = [('card', 60), ('cash', 25), ('wallet', 15)]
+
+# Monday .. Sunday
+WEEKDAY_WEIGHTS = [0.6, 0.7, 0.8, 0.9, 1.3, 1.8, 1.0]
+OPEN_HOUR, CLOSE_HOUR = 9, 21
+# Demand per opening hour; Saturday evenings are busier still
+HOUR_WEIGHTS = [0.5, 0.7, 0.9, 1.0, 1.0, 0.9, 1.0, 1.2, 1.5, 1.7, 1.4, 0.8]
+SATURDAY_EVENING_BOOST = 1.6
+
+SALON_ZIPF = 1.1
+CUSTOMER_ZIPF = 0.8
+
+
+def _cumulative(weights):
+    return list(itertools.accumulate(weights))
+
+
+def _zipf_weights(count, exponent):
+    return _cumulative(1.0 / (rank ** exponent) for rank in range(1, count + 1))
+
+
+def _weighted(rng, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights=weights)[0]
+
+
+def _field_names(model):
+    return {field.name for field in model._meta.get_fields() if getattr(field, 'concrete', False)}
+
+
+def _existing(model, values):
+    """Keep only the ``values`` the model has fields for"""
+    names = _field_names(model)
+    names |= {f'{name}_id' for name in names}
+    return {key: value for key, value in values.items() if key in names}
+
+
+def _build(model, **values):
+    if 'created_at' in values:
+        values.setdefault('updated_at', values['created_at'])
+    return model(**_existing(model, values))
+
+
+@contextmanager
+def historic_timestamps(*models):
+    """Let ``created_at``-style fields keep the values we set instead of "now\""""
+    changed = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                changed.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in changed:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Loader:
+    """Writes batches with ``bulk_create`` or ``COPY`` and keeps rows-per-second counts"""
+
+    def __init__(self, batch_size=5000, use_copy=False, stdout=None):
+        self.batch_size = batch_size
+        self.use_copy = use_copy and connection.vendor == 'postgresql'
+        self.stdout = stdout
+        self.counts = {}
+        self.seconds = {}
+
+    def write(self, model, objects, copy=False):
+        if not objects:
+            return objects
+        started = time.perf_counter()
+        for start in range(0, len(objects), self.batch_size):
+            batch = objects[start:start + self.batch_size]
+            with transaction.atomic():
+                if copy and self.use_copy:
+                    self._copy(model, batch)
+                else:
+                    model.objects.bulk_create(batch, batch_size=self.batch_size)
+        name = model._meta.label
+        self.counts[name] = self.counts.get(name, 0) + len(objects)
+        self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - started
+        return objects
+
+    def _copy(self, model, objects):
+        fields = [field for field in model._meta.concrete_fields]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for obj in objects:
+            row = []
+            for field in fields:
+                value = field.get_db_prep_save(getattr(obj, field.attname), connection)
+                if value is None:
+                    row.append('\\N')
+                elif isinstance(value, bool):
+                    row.append('t' if value else 'f')
+                else:
+                    row.append(value)
+            writer.writerow(row)
+        buffer.seek(0)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) "
+                f"FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer,
+            )
+
+    def report(self):
+        for name, count in self.counts.items():
+            seconds = self.seconds[name]
+            yield name, count, seconds, count / seconds if seconds else 0.0
+
+
+class Generator:
+
+    def __init__(self, seed=42, days=365, future_days=30, loader=None, log=None):
+        self.rng = random.Random(seed)
+        self.seed = seed
+        self.today = timezone.localdate()
+        self.first_day = self.today - timedelta(days=days)
+        self.last_day = self.today + timedelta(days=future_days)
+        self.loader = loader or Loader()
+        self.log = log or (lambda message: None)
+
+        self.dates = [self.first_day + timedelta(days=offset) for offset in range((self.last_day - self.first_day).days + 1)]
+        self.date_weights = _cumulative(WEEKDAY_WEIGHTS[day.weekday()] for day in self.dates)
+        self.hours = list(range(OPEN_HOUR, CLOSE_HOUR))
+        self.hour_weights = _cumulative(HOUR_WEIGHTS)
+        self.saturday_hour_weights = _cumulative(
+            weight * (SATURDAY_EVENING_BOOST if hour >= 16 else 1.0) for hour, weight in zip(self.hours, HOUR_WEIGHTS)
+        )
+        self.password = make_password(f'synthetic-{seed}')
+
+    def _moment(self, day, hour=12, minute=0):
+        moment = datetime.combine(day, dt_time(hour, minute))
+        return timezone.make_aware(moment) if settings.USE_TZ else moment
+
+    def _joined(self):
+        # Sign-ups grow over time: more recent dates are likelier
+        offset = int((self.rng.random() ** 0.6) * (self.today - self.first_day).days)
+        return self._moment(self.first_day + timedelta(days=offset), self.rng.randrange(8, 23), self.rng.randrange(60))
+
+    # Users
+
+    def users(self, count, owners, admins):
+        customers = count - owners - admins
+        self.log(f'Users: {customers} customers, {owners} salon owners, {admins} admins')
+        roles = ['admin'] * admins + ['salon_owner'] * owners + ['customer'] * customers
+        users = []
+        for index, role in enumerate(roles):
+            first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+            email = f'{role}.{index}.s{self.seed}@example.com'
+            joined = self._joined()
+            users.append(_build(
+                User, username=email, email=email, password=self.password, first_name=first, last_name=last,
+                role=role, is_active=True, is_staff=role == 'admin', is_verified=self.rng.random() < 0.8,
+                phone_number=f'555{self.rng.randrange(10 ** 7):07d}', date_joined=joined, created_at=joined,
+            ))
+        self.loader.write(User, users)
+
+        by_role = {
+            role: list(User.objects.filter(email__endswith=f'.s{self.seed}@example.com', role=role).order_by('id'))
+            for role in ('customer', 'salon_owner', 'admin')
+        }
+        self.loader.write(CustomerProfile, [CustomerProfile(user=user) for user in by_role['customer']])
+        self.loader.write(SalonOwnerProfile, [SalonOwnerProfile(user=user) for user in by_role['salon_owner']])
+        return by_role
+
+    # Salons
+
+    def salons(self, owners, count):
+        from salon_management.models import Salon, SalonHours, Service, Staff
+
+        self.log(f'Salons: {count} with hours, services and staff')
+        city_weights = _cumulative(size for _, _, size in CITIES)
+        salons = []
+        for index in range(count):
+            # Most owners have one salon, a few run chains
+            owner = owners[min(int(self.rng.paretovariate(1.5)) - 1, len(owners) - 1)] if index >= len(owners) else owners[index]
+            city, state, _ = CITIES[bisect.bisect_left(city_weights, self.rng.random() * city_weights[-1])]
+            name = f'{self.rng.choice(SALON_WORDS)} {self.rng.choice(SALON_KINDS)} {index}'
+            salons.append(_build(
+                Salon, owner=owner, name=name, description=f'{name} in {city}.',
+                address=f'{self.rng.randrange(1, 9999)} Main St', city=city, state=state,
+                zip_code=f'{self.rng.randrange(10000, 99999)}', phone_number=f'555{self.rng.randrange(10 ** 7):07d}',
+                email=f'salon{index}.s{self.seed}@example.com',
+                status=_weighted(self.rng, [('approved', 90), ('pending', 7), ('rejected', 3)]),
+                is_active=True, created_at=self._joined(),
+            ))
+        self.loader.write(Salon, salons)
+        salons = list(Salon.objects.filter(email__endswith=f'.s{self.seed}@example.com').order_by('id'))
+
+        hours, services, staff = [], [], []
+        for salon in salons:
+            closed_sunday = self.rng.random() < 0.3
+            for day in range(7):
+                closed = day == 6 and closed_sunday
+                hours.append(_build(
+                    SalonHours, salon=salon, day=day, is_closed=closed,
+                    open_time=dt_time(OPEN_HOUR), close_time=dt_time(CLOSE_HOUR),
+                ))
+            for name, price, duration in self.rng.sample(SERVICES, self.rng.randint(5, 12)):
+                # Prices vary a little between salons
+                price = Decimal(price * self.rng.uniform(0.8, 1.4)).quantize(Decimal('1.00'))
+                services.append(_build(
+                    Service, salon=salon, name=name, description=name, price=price, duration=duration, is_active=True,
+                ))
+            for _ in range(self.rng.randint(2, 8)):
+                first, last = self.rng.choice(FIRST_NAMES), self.rng.choice(LAST_NAMES)
+                staff.append(_build(
+                    Staff, salon=salon, name=f'{first} {last}', first_name=first, last_name=last,
+                    email=f'{first.lower()}.{last.lower()}@example.com', is_active=True,
+                ))
+        self.loader.write(SalonHours, hours)
+        self.loader.write(Service, services)
+        self.loader.write(Staff, staff)
+
+        salon_ids = [salon.id for salon in salons]
+        services_by_salon, staff_by_salon = {}, {}
+        for service in Service.objects.filter(salon_id__in=salon_ids).order_by('id'):
+            services_by_salon.setdefault(service.salon_id, []).append(service)
+        for member_id, salon_id in Staff.objects.filter(salon_id__in=salon_ids).order_by('id').values_list('id', 'salon_id'):
+            staff_by_salon.setdefault(salon_id, []).append(member_id)
+        return salons, services_by_salon, staff_by_salon
+
+    # Bookings and what hangs off them
+
+    def bookings(self, count, customers, salons, services_by_salon, staff_by_salon, review_rate=0.35):
+        from booking_system.models import Booking, Notification, Payment, Review
+
+        self.log(f'Bookings: {count} with reviews, notifications and payments')
+        # Only approved salons take bookings; shuffle so popularity is not tied to age
+        bookable = [salon for salon in salons if getattr(salon, 'status', 'approved') == 'approved'] or salons
+        bookable = sorted(bookable, key=lambda salon: salon.id)
+        self.rng.shuffle(bookable)
+        salon_weights = _zipf_weights(len(bookable), SALON_ZIPF)
+        customers = sorted(customers, key=lambda user: user.id)
+        self.rng.shuffle(customers)
+        customer_weights = _zipf_weights(len(customers), CUSTOMER_ZIPF)
+
+        next_id = (Booking.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        created = 0
+        chunk = self.loader.batch_size * 4
+        while created < count:
+            size = min(chunk, count - created)
+            bookings, reviews, notifications, payments = [], [], [], []
+            salon_picks = self.rng.choices(bookable, cum_weights=salon_weights, k=size)
+            customer_picks = self.rng.choices(customers, cum_weights=customer_weights, k=size)
+            day_picks = self.rng.choices(self.dates, cum_weights=self.date_weights, k=size)
+            for salon, customer, day in zip(salon_picks, customer_picks, day_picks):
+                service = self.rng.choice(services_by_salon[salon.id])
+                staff = staff_by_salon.get(salon.id)
+                weights = self.saturday_hour_weights if day.weekday() == 5 else self.hour_weights
+                hour = self.rng.choices(self.hours, cum_weights=weights)[0]
+                appointment = self._moment(day, hour, self.rng.choice((0, 15, 30, 45)))
+                booked_at = appointment - timedelta(days=self.rng.expovariate(1 / 5), hours=self.rng.randrange(24))
+
+                if day < self.today:
+                    status = _weighted(self.rng, [('completed', 84), ('cancelled', 12), ('pending', 4)])
+                else:
+                    status = _weighted(self.rng, [('confirmed', 70), ('pending', 25), ('cancelled', 5)])
+
+                booking = _build(
+                    Booking, id=next_id, customer=customer, salon=salon, service=service,
+                    staff_id=self.rng.choice(staff) if staff and self.rng.random() < 0.7 else None,
+                    appointment_date=day, appointment_time=appointment.time(), status=status,
+                    notes='', total_amount=service.price, created_at=booked_at, updated_at=booked_at,
+                )
+                next_id += 1
+                bookings.append(booking)
+
+                notifications.append(_build(
+                    Notification, user=customer, booking=booking, title='Booking received',
+                    message=f'Your {service.name} at {salon.name} on {day:%b %d} is {status}.',
+                    notification_type='booking', is_read=day < self.today or self.rng.random() < 0.3,
+                    created_at=booked_at,
+                ))
+                if status in ('completed', 'confirmed'):
+                    payments.append(_build(
+                        Payment, booking=booking, amount=service.price,
+                        status='completed' if status == 'completed' else 'pending',
+                        payment_method=_weighted(self.rng, PAYMENT_METHODS),
+                        transaction_id=f'syn-{self.seed}-{booking.id}', created_at=booked_at,
+                    ))
+                if status == 'completed' and self.rng.random() < review_rate:
+                    rating = _weighted(self.rng, RATING_WEIGHTS)
+                    reviews.append(_build(
+                        Review, customer=customer, salon=salon, booking=booking, service=service, rating=rating,
+                        comment=self.rng.choice(REVIEW_COMMENTS[rating]),
+                        created_at=appointment + timedelta(hours=self.rng.randrange(2, 72)),
+                    ))
+
+            self.loader.write(Booking, bookings, copy=True)
+            self.loader.write(Payment, payments, copy=True)
+            self.loader.write(Review, reviews, copy=True)
+            self.loader.write(Notification, notifications, copy=True)
+            created += size
+            self.log(f'  {created}/{count} bookings')
+
+        # Explicit ids leave PostgreSQL sequences behind
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Booking, Payment, Review, Notification]):
+                cursor.execute(sql)
+
+    def salon_ratings(self, salons):
+        """Fill the denormalized rating columns from the generated reviews"""
+        from booking_system.models import Review
+        from salon_management.models import Salon
+
+        names = _field_names(Salon)
+        if 'rating' not in names:
+            return
+        stats = Review.objects.filter(salon__in=salons).values('salon_id').annotate(average=Avg('rating'), total=Count('id'))
+        for row in stats:
+            values = {'rating': round(row['average'], 1)}
+            if 'total_reviews' in names:
+                values['total_reviews'] = row['total']
+            Salon.objects.filter(pk=row['salon_id']).update(**values)
+
+
+def generate(users=10000, salons=None, bookings=1_000_000, seed=42, days=365, batch_size=5000,
+             use_copy=False, log=None):
+    """Generate a whole platform; returns the ``Loader`` with per-model counts and timings"""
+    from booking_system.models import Booking, Notification, Payment, Review
+    from salon_management.models import Salon
+
+    salons = salons or max(1, users // 50)
+    admins = max(1, users // 5000)
+    owners = max(1, min(salons, int(salons * 0.8)))
+    if owners + admins >= users:
+        raise ValueError('Not enough users for the salon owners and admins')
+
+    loader = Loader(batch_size=batch_size, use_copy=use_copy)
+    generator = Generator(seed=seed, days=days, loader=loader, log=log)
+    with historic_timestamps(User, Salon, Booking, Review, Notification, Payment):
+        by_role = generator.users(users, owners, admins)
+        salon_rows, services_by_salon, staff_by_salon = generator.salons(by_role['salon_owner'], salons)
+        generator.bookings(bookings, by_role['customer'], salon_rows, services_by_salon, staff_by_salon)
+    generator.salon_ratings(salon_rows)
+    return loader
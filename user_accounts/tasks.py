@@ -0,0 +1,125 @@
+from celery import shared_task
+
+
+@shared_task(ignore_result=True, autoretry_for=(OSError,), retry_backoff=True, retry_jitter=True, max_retries=5)
+def send_due_reminders():
+    """
+    Send appointment reminders that are due (run every minute from celery beat).
+
+    Unsent reminders are queued again when the mail server fails, then the
+    task is retried with backoff (SMTPException is an OSError).
+    """
+    from .reminders import get_scheduler
+
+    scheduler = get_scheduler()
+    if scheduler is None:
+        # Reported by the user_accounts.W001 system check
+        return 0
+    return scheduler.send_due()
+
+
+@shared_task(ignore_result=True)
+def update_salon_rollups():
+    """Refresh daily salon rollups touched since the last run (run every few minutes)"""
+    from .rollups import update_rollups
+
+    return update_rollups()
+
+
+@shared_task(ignore_result=True)
+def refresh_salon_day_rollups(salon_days):
+    """Refresh the rollups of ``[salon_id, 'YYYY-MM-DD']`` pairs right away"""
+    from datetime import date
+    from .rollups import refresh_salon_days
+
+    return refresh_salon_days((salon_id, date.fromisoformat(day)) for salon_id, day in salon_days)
+
+
+@shared_task(ignore_result=True)
+def export_analytics_snapshot():
+    """Write the columnar platform snapshot read by admin analytics (run nightly)"""
+    from .platform_analytics import export_snapshot
+
+    return export_snapshot()
+
+
+@shared_task(ignore_result=True)
+def archive_booking_history():
+    """Move finished bookings and past appointments to the archive tables (run nightly)"""
+    from .archival import archive_history
+
+    return archive_history()
+
+
+# Account side effects: queued with transaction.on_commit by the views, retried
+# with backoff when the mail server is unreachable (SMTPException is an OSError)
+
+def queue_registration_emails(user_id):
+    """
+    Welcome a new user and ask them to confirm their email address.
+
+    Each email is its own task, so retrying one never sends the other again.
+    """
+    send_welcome_email.delay(user_id)
+    send_verification_email.delay(user_id)
+
+
+@shared_task(ignore_result=True, autoretry_for=(OSError,), retry_backoff=True, retry_jitter=True, max_retries=5)
+def send_welcome_email(user_id):
+    from .account_emails import welcome_message
+    from .models import User
+
+    user = User.objects.filter(pk=user_id).first()
+    if user is None or not user.email:
+        return 0
+    return welcome_message(user).send()
+
+
+@shared_task(ignore_result=True, autoretry_for=(OSError,), retry_backoff=True, retry_jitter=True, max_retries=5)
+def send_verification_email(user_id):
+    from .account_emails import verification_message
+    from .models import User
+
+    user = User.objects.filter(pk=user_id).first()
+    if user is None or not user.email or user.is_verified:
+        return 0
+    return verification_message(user).send()
+
+
+def queue_new_salon_alert():
+    """Report new salons to admins, batching those created within ``ADMIN_ALERT_WINDOW`` into one email"""
+    from django.core.cache import cache
+    from .account_emails import ADMIN_ALERT_WINDOW
+
+    # The first salon of a window schedules the digest; the rest are picked up by it
+    if cache.add('admin_salon_alert:window', 1, ADMIN_ALERT_WINDOW):
+        alert_admins_new_salons.apply_async(countdown=ADMIN_ALERT_WINDOW)
+
+
+@shared_task(ignore_result=True, autoretry_for=(OSError,), retry_backoff=True, retry_jitter=True, max_retries=5)
+def alert_admins_new_salons():
+    """Email active admins one digest of the salons created since the previous digest"""
+    from datetime import datetime, timedelta
+    from django.core.cache import cache
+    from django.db.models import Q
+    from django.utils import timezone
+    from salon_management.models import Salon
+    from .account_emails import ADMIN_ALERT_WINDOW, new_salons_message
+    from .models import User
+
+    until = timezone.now()
+    reported_until = cache.get('admin_salon_alert:reported_until')
+    # Without a mark (first digest, or evicted) look back over a couple of windows
+    since = datetime.fromisoformat(reported_until) if reported_until else until - timedelta(seconds=2 * ADMIN_ALERT_WINDOW)
+
+    salons = list(
+        Salon.objects.filter(created_at__gt=since, created_at__lte=until).select_related('owner').order_by('created_at')
+    )
+    admin_emails = list(
+        User.objects.filter(Q(role='admin') | Q(is_superuser=True), is_active=True)
+        .exclude(email='').values_list('email', flat=True)
+    )
+    sent = new_salons_message(salons, admin_emails).send() if salons and admin_emails else 0
+    # Only move the mark once the email is out, so a retry reports the same salons
+    cache.set('admin_salon_alert:reported_until', until.isoformat(), None)
+    return sent
@@ -0,0 +1,49 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from user_accounts.tiered_cache import get_cache
+
+
+register = template.Library()
+
+
+class TieredCacheNode(template.Node):
+
+    def __init__(self, nodelist, ttl, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.ttl = ttl
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        try:
+            ttl = int(self.ttl.resolve(context))
+        except (ValueError, TypeError):
+            raise template.TemplateSyntaxError(f'"tieredcache" tag got a non-integer timeout value: {self.ttl.var!r}')
+        key = make_template_fragment_key(self.fragment_name, [var.resolve(context) for var in self.vary_on])
+        return get_cache('fragments').get_or_set(key, lambda: self.nodelist.render(context), ttl)
+
+
+@register.tag('tieredcache')
+def do_tieredcache(parser, token):
+    """
+    Cache a template fragment in the two-tier cache.
+
+    Usage::
+
+        {% load tiered_cache %}
+        {% tieredcache 300 salon_card salon.id salon.updated_at %}
+            ... expensive markup ...
+        {% endtieredcache %}
+    """
+    nodelist = parser.parse(('endtieredcache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(f'"{bits[0]}" tag requires at least 2 arguments.')
+    return TieredCacheNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        bits[2],
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
@@ -1,3 +1,2081 @@
-from django.test import TestCase
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time as time_module
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.template import TemplateDoesNotExist
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from . import (
+    availability, clock, holds, opening_hours, rate_limiting, reminders, request_metrics, scheduling, tiered_cache,
+)
+from .account_emails import verification_token
+from .models import CustomerProfile, SalonOwnerProfile, User
+from .search_index import AutocompleteIndex, PrefixIndex
+from .synthetic_data import Generator, _build
+
+
+def _users(*roles):
+    return [
+        User.objects.create_user(username=f'{role}{number}@example.com', email=f'{role}{number}@example.com',
+                                 password='x', role=role)
+        for number, role in enumerate(roles)
+    ]
+
+
+def _create_booking(customer, service, day, start, status='pending', staff_id=None):
+    """Save a booking through the ORM, so its signals run"""
+    from booking_system.models import Booking
+
+    booking = _build(
+        Booking, customer=customer, salon_id=service.salon_id, service=service, staff_id=staff_id,
+        appointment_date=day, appointment_time=start, status=status, notes='', total_amount=service.price,
+    )
+    booking.save()
+    return booking
+
+
+SMALL = 10
+LARGE = 1000
+
+# Views that would end the test client's session
+SKIPPED_URLS = {'accounts:logout'}
+
+
+def _normalized(sql):
+    # Same statement with different ids or values counts as a repeat
+    sql = re.sub(r"'(?:[^']|'')*'", "'?'", sql)
+    return re.sub(r'\b\d+(\.\d+)?\b', '?', sql)
+
+
+def _report(view_name, small, large):
+    repeated = Counter(_normalized(query['sql']) for query in large).most_common(5)
+    lines = [f'{view_name}: {len(small)} queries with {SMALL} rows, {len(large)} with {LARGE}']
+    lines += [f'  {count} x {sql}' for sql, count in repeated if count > 1]
+    lines.append('  All queries:')
+    lines += [f'    {query["sql"]}' for query in large]
+    return '\n'.join(lines)
+
+
+@mock.patch('user_accounts.async_queries._executor', None)
+class QueryCountTests(TestCase):
+    """
+    Every page of a namespace must run as many queries with 1,000 related rows
+    as with 10, so a template touching ``booking.salon.name`` without
+    ``select_related`` fails here instead of in production.
+    """
+
+    def setUp(self):
+        self.customer = User.objects.create_user(
+            username='customer@example.com', email='customer@example.com', password='x', role='customer',
+        )
+        self.owner = User.objects.create_user(
+            username='owner@example.com', email='owner@example.com', password='x', role='salon_owner',
+        )
+        self.admin = User.objects.create_user(
+            username='admin@example.com', email='admin@example.com', password='x', role='admin',
+        )
+        CustomerProfile.objects.create(user=self.customer)
+        SalonOwnerProfile.objects.create(user=self.owner)
+        self.seeded = 0
+        self.round = 0
+
+    def seed(self, size):
+        """Bring the customer's bookings, the owner's salons and the user list up to ``size`` rows each"""
+        count = size - self.seeded
+        self.round += 1
+        generator = Generator(seed=self.round)
+        generator.users(count + 2, owners=1, admins=1)
+        salons, services, staff = generator.salons([self.owner], count)
+        generator.bookings(count, [self.customer], salons, services, staff)
+        self.seeded = size
+
+    def url_kwargs(self):
+        from booking_system.models import Booking
+
+        booking = Booking.objects.filter(customer=self.customer).order_by('id').first()
+        return {
+            'booking_id': booking.id,
+            'salon_id': booking.salon_id,
+            'user_id': User.objects.filter(role='customer').exclude(pk=self.customer.pk).order_by('id').first().pk,
+            'token': verification_token(self.customer),
+        }
+
+    def view_names(self, namespace):
+        _, resolver = get_resolver().namespace_dict[namespace]
+        for pattern in resolver.url_patterns:
+            view_name = f'{namespace}:{pattern.name}'
+            if pattern.name and view_name not in SKIPPED_URLS:
+                yield view_name, list(pattern.pattern.converters)
+
+    def captured_queries(self, client, url):
+        # Start from the same cache state every time; warm up sessions and content types
+        cache.clear()
+        for namespace_cache in tiered_cache.all_caches().values():
+            namespace_cache.l1.clear()
+        self._get(client, url)
+        with CaptureQueriesContext(connection) as context:
+            self._get(client, url)
+        return context.captured_queries
+
+    def _get(self, client, url):
+        response = client.get(url)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def query_counts(self, namespace, user):
+        self.client.force_login(user)
+        kwargs = self.url_kwargs()
+        queries = {}
+        for view_name, params in self.view_names(namespace):
+            url = reverse(view_name, kwargs={param: kwargs[param] for param in params})
+            try:
+                queries[view_name] = self.captured_queries(self.client, url)
+            except TemplateDoesNotExist as exc:
+                queries[view_name] = exc
+        return queries
+
+    def assertConstantQueries(self, namespace, user):
+        self.seed(SMALL)
+        small = self.query_counts(namespace, user)
+        self.seed(LARGE)
+        large = self.query_counts(namespace, user)
+
+        self.assertTrue(small)
+        for view_name in small:
+            with self.subTest(view=view_name):
+                if isinstance(small[view_name], TemplateDoesNotExist):
+                    self.skipTest(f'Template {small[view_name]} is missing')
+                self.assertLessEqual(
+                    len(large[view_name]), len(small[view_name]),
+                    _report(view_name, small[view_name], large[view_name]),
+                )
+
+    def test_accounts_pages(self):
+        self.assertConstantQueries('accounts', self.customer)
+
+    def test_customer_pages(self):
+        self.assertConstantQueries('customer', self.customer)
+
+    def test_salon_owner_pages(self):
+        self.assertConstantQueries('salon_owner', self.owner)
+
+    def test_admin_pages(self):
+        self.assertConstantQueries('user_admin', self.admin)
+
+
+class PrefixIndexTests(TestCase):
+
+    def setUp(self):
+        self.index = PrefixIndex()
+        self.index.bulk_load([
+            (('salon', 1), 'salon', 'Glow Studio'),
+            (('salon', 1), 'city', 'Mumbai'),
+            (('salon', 2), 'salon', 'Glamour Lounge'),
+            (('salon', 2), 'city', 'Mumbai'),
+            (('salon', 3), 'salon', 'Mumbai Cuts'),
+            (('salon', 3), 'city', 'Pune'),
+            (('service', 7), 'service', 'Gel Manicure'),
+            (('service', 8), 'service', 'gel manicure'),
+        ])
+
+    def labels(self, prefix, limit=10):
+        return [(result['type'], result['label']) for result in self.index.search(prefix, limit)]
+
+    def test_matches_prefix_case_and_whitespace_insensitively(self):
+        self.assertEqual(self.labels('  GL'), [('salon', 'Glamour Lounge'), ('salon', 'Glow Studio')])
+        self.assertEqual(self.labels('glow   s'), [('salon', 'Glow Studio')])
+        self.assertEqual(self.labels('x'), [])
+        self.assertEqual(self.labels('   '), [])
+
+    def test_results_are_ordered_by_label_and_cut_at_limit(self):
+        self.assertEqual(self.labels('g'), [
+            ('service', 'Gel Manicure'), ('salon', 'Glamour Lounge'), ('salon', 'Glow Studio'),
+        ])
+        self.assertEqual(self.labels('g', limit=2), [('service', 'Gel Manicure'), ('salon', 'Glamour Lounge')])
+
+    def test_cities_and_services_are_suggested_once_salons_each(self):
+        self.assertEqual(self.labels('mum'), [('city', 'Mumbai'), ('salon', 'Mumbai Cuts')])
+        self.assertEqual(self.index.search('mumbai c')[0]['salon_id'], 3)
+
+    def test_replace_and_remove_keep_the_order(self):
+        self.index.replace(('salon', 1), [('salon', 'Aura Spa'), ('city', 'Mumbai')])
+        self.assertEqual(self.labels('a'), [('salon', 'Aura Spa')])
+        self.assertNotIn(('salon', 'Glow Studio'), self.labels('gl'))
+        self.index.remove(('salon', 3))
+        self.assertEqual(self.labels('mum'), [('city', 'Mumbai')])
+
+
+class AutocompleteIndexTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.index = AutocompleteIndex()
+        self.owner = User.objects.create_user(
+            username='owner@example.com', email='owner@example.com', password='x', role='salon_owner',
+        )
+
+    def create_salon(self, name, status='approved'):
+        from salon_management.models import Salon
+
+        with self.captureOnCommitCallbacks(execute=True):
+            return Salon.objects.create(owner=self.owner, name=name, city='Pune', status=status)
+
+    def salon_labels(self, prefix):
+        return [result['label'] for result in self.index.search(prefix) if result['type'] == 'salon']
+
+    def test_only_approved_salons_are_indexed(self):
+        self.create_salon('Glow Studio')
+        self.create_salon('Glamour Lounge', status='pending')
+        self.assertEqual(self.salon_labels('gl'), ['Glow Studio'])
+
+    @mock.patch('user_accounts.signals.autocomplete_index')
+    def test_index_is_updated_only_after_commit(self, index):
+        from salon_management.models import Salon
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            Salon.objects.create(owner=self.owner, name='Glow Studio', city='Pune', status='approved')
+        index.update_salon.assert_not_called()
+        for callback in callbacks:
+            callback()
+        index.update_salon.assert_called_once()
+
+    def test_changes_from_other_workers_are_picked_up_after_the_check_interval(self):
+        salon = self.create_salon('Glow Studio')
+        self.assertEqual(self.salon_labels('glow'), ['Glow Studio'])
+
+        # Another worker renames the salon: its signal bumps the shared version
+        other_worker = AutocompleteIndex()
+        other_worker.search('x')
+        with mock.patch('user_accounts.signals.autocomplete_index', other_worker):
+            with self.captureOnCommitCallbacks(execute=True):
+                salon.name = 'Aura Spa'
+                salon.save()
+
+        with mock.patch('user_accounts.search_index.VERSION_CHECK_SECONDS', 60):
+            self.assertEqual(self.salon_labels('glow'), ['Glow Studio'])
+        with mock.patch('user_accounts.search_index.VERSION_CHECK_SECONDS', 0):
+            self.assertEqual(self.salon_labels('glow'), [])
+            self.assertEqual(self.salon_labels('aura'), ['Aura Spa'])
+
+    def test_deleted_salons_are_removed(self):
+        salon = self.create_salon('Glow Studio')
+        self.assertEqual(self.salon_labels('glow'), ['Glow Studio'])
+        with mock.patch('user_accounts.signals.autocomplete_index', self.index):
+            with self.captureOnCommitCallbacks(execute=True):
+                salon.delete()
+        self.assertEqual(self.salon_labels('glow'), [])
+
+
+class AvailabilityIndexTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.day = date.today() + timedelta(days=400)
+        self.entry = {'open': 540, 'step': 30, 'free': [2, 2, 2, 2]}
+
+    def built(self, *args):
+        return {**self.entry, 'free': list(self.entry['free'])}
+
+    def test_entries_are_built_once_and_adjusted_in_place(self):
+        with mock.patch('user_accounts.availability.build_day', side_effect=self.built) as build_day:
+            availability.get_days([1], self.day)
+            availability.adjust_booking(1, self.day, time(9, 30), 60, -1)
+            entries = availability.get_days([1], self.day)
+        self.assertEqual(build_day.call_count, 1)
+        self.assertEqual(entries[1]['free'], [2, 1, 1, 2])
+
+    def test_entry_changed_while_building_is_not_stored(self):
+        def build_during_booking(salon_id, day):
+            # The booking commits and is adjusted after the build read the database
+            availability.adjust_booking(salon_id, day, time(9, 0), 30, -1)
+            return self.built()
+
+        with mock.patch('user_accounts.availability.build_day', side_effect=build_during_booking):
+            availability.get_days([1], self.day)
+        with mock.patch('user_accounts.availability.build_day', side_effect=self.built) as build_day:
+            availability.get_days([1], self.day)
+        build_day.assert_called_once()
+
+    def test_invalidate_salon_drops_every_day(self):
+        with mock.patch('user_accounts.availability.build_day', side_effect=self.built) as build_day:
+            availability.get_days([1, 2], self.day)
+            availability.invalidate_salon(1)
+            availability.get_days([1, 2], self.day)
+        self.assertEqual([call.args[0] for call in build_day.call_args_list], [1, 2, 1])
+
+    @mock.patch('user_accounts.availability.apply_slot')
+    def test_booking_saves_occupy_and_release_their_slot(self, apply_slot):
+        from booking_system.models import Booking
+
+        customer, owner = _users('customer', 'salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 1)
+        service = services[salons[0].id][0]
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = _create_booking(customer, service, self.day, time(10, 0))
+        slot = (service.salon_id, self.day, time(10, 0), service.id)
+        apply_slot.assert_called_once_with(slot, -1)
+
+        apply_slot.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = Booking.objects.only('id').get(pk=booking.pk)
+            booking.status = 'cancelled'
+            booking.save(update_fields=['status'])
+        apply_slot.assert_called_once_with(slot, 1)
+
+
+class SchedulingTests(TestCase):
+
+    def test_interval_mask_covers_every_touched_tick(self):
+        self.assertEqual(scheduling.interval_mask(0, 5), 0b1)
+        self.assertEqual(scheduling.interval_mask(10, 10), 0b1100)
+        self.assertEqual(scheduling.interval_mask(7, 5), 0b110)
+        self.assertEqual(scheduling.interval_mask(60, 0), 0)
+        # Clipped at midnight
+        self.assertEqual(scheduling.interval_mask(23 * 60 + 55, 30), 1 << (scheduling.TICKS_PER_DAY - 1))
+
+    def test_run_starts_marks_starts_of_long_enough_free_runs(self):
+        self.assertEqual(scheduling.run_starts(0b01110111, 1), 0b01110111)
+        self.assertEqual(scheduling.run_starts(0b01110111, 3), 0b00010001)
+        self.assertEqual(scheduling.run_starts(0b01110111, 4), 0)
+
+        rng = random.Random(7)
+        for _ in range(200):
+            free = rng.getrandbits(64)
+            ticks = rng.randint(1, 12)
+            expected = sum(
+                1 << start for start in range(64)
+                if all(free >> (start + offset) & 1 for offset in range(ticks))
+            )
+            self.assertEqual(scheduling.run_starts(free, ticks), expected, (bin(free), ticks))
+
+    def schedule(self):
+        # Open 09:00-10:00; stylist 1 busy 09:00-09:30, stylist 2 busy 09:30-10:00
+        schedule = scheduling.DaySchedule(scheduling.interval_mask(9 * 60, 60), [1, 2])
+        schedule.book(9 * 60, 30, 1)
+        schedule.book(9 * 60 + 30, 30, 2)
+        return schedule
+
+    def test_feasible_starts_for_any_and_one_stylist(self):
+        schedule = self.schedule()
+        self.assertEqual(schedule.feasible_starts(30, step_minutes=30), [540, 570])
+        self.assertEqual(schedule.feasible_starts(30, step_minutes=30, staff_id=1), [570])
+        self.assertEqual(schedule.feasible_starts(15), [540, 545, 550, 555, 570, 575, 580, 585])
+        self.assertEqual(schedule.feasible_starts(45), [])
+
+    def test_unplaceable_bookings_are_counted(self):
+        schedule = self.schedule()
+        self.assertIsNone(schedule.book(9 * 60, 60))
+        self.assertEqual(schedule.unplaced, 1)
+
+    def test_validate_booking_slot(self):
+        service = mock.Mock(duration=30)
+        with mock.patch('user_accounts.scheduling.load_day', return_value=self.schedule()):
+            self.assertEqual(scheduling.validate_booking_slot(1, date.today(), time(9, 30), service), 1)
+            self.assertEqual(scheduling.validate_booking_slot(1, date.today(), time(9, 0), service, staff_id=2), 2)
+            for start, staff_id, message in [
+                (time(9, 30), 2, 'already booked'),
+                (time(9, 15), None, 'no longer available'),
+                (time(8, 30), None, 'not open'),
+                (time(9, 30), 3, 'does not work at this salon'),
+            ]:
+                with self.subTest(start=start, staff_id=staff_id):
+                    with self.assertRaisesMessage(ValidationError, message):
+                        scheduling.validate_booking_slot(1, date.today(), start, service, staff_id=staff_id)
+
+
+class BookSalonViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        holds.get_store().clear()
+        self.customer, owner = _users('customer', 'salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 1)
+        self.salon = salons[0]
+        self.salon.status = 'approved'
+        self.salon.save()
+        self.service = services[self.salon.id][0]
+        # Next Monday, when the generated salons are open
+        self.day = date.today() + timedelta(days=7 - date.today().weekday())
+        self.url = reverse('customer:book_salon', kwargs={'salon_id': self.salon.id})
+        self.client.force_login(self.customer)
+
+    def test_lists_free_times_and_books_one(self):
+        from booking_system.models import Booking
+
+        params = {'service': self.service.id, 'appointment_date': self.day.isoformat()}
+        response = self.client.get(self.url, params)
+        self.assertIn('10:00', response.context['available_times'])
+
+        response = self.client.post(self.url, {**params, 'appointment_time': '10:00'})
+        booking = Booking.objects.get(customer=self.customer)
+        self.assertRedirects(
+            response, reverse('customer:booking_detail', kwargs={'booking_id': booking.id}),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual((booking.appointment_date, booking.appointment_time), (self.day, time(10, 0)))
+
+    def test_picking_a_time_holds_it_for_other_customers(self):
+        from salon_management.models import Staff
+
+        stylist = Staff.objects.filter(salon=self.salon).first()
+        data = {
+            'service': self.service.id, 'appointment_date': self.day.isoformat(),
+            'staff': stylist.id, 'appointment_time': '10:00',
+        }
+        response = self.client.post(self.url, {**data, 'hold': '1'})
+        self.assertEqual(response.json()['held'], True)
+
+        other = User.objects.create_user(
+            username='other@example.com', email='other@example.com', password='x', role='customer',
+        )
+        self.client.force_login(other)
+        response = self.client.post(self.url, {**data, 'hold': '1'})
+        self.assertEqual(response.json()['held'], False)
+        response = self.client.get(self.url, {key: data[key] for key in ('service', 'appointment_date', 'staff')})
+        self.assertNotIn('10:00', response.context['available_times'])
+
+    def test_rejects_a_time_outside_opening_hours(self):
+        from booking_system.models import Booking
+
+        response = self.client.post(self.url, {
+            'service': self.service.id, 'appointment_date': self.day.isoformat(), 'appointment_time': '03:00',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'not open')
+        self.assertFalse(Booking.objects.exists())
+
+
+class HoldTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        holds.get_store().clear()
+        self.day = date.today() + timedelta(days=7 - date.today().weekday())
+
+    def test_overlapping_holds_on_one_stylist_are_rejected(self):
+        self.assertTrue(holds.place_hold(1, self.day, 10, 600, 30, 'a'))
+        self.assertFalse(holds.place_hold(1, self.day, 10, 615, 30, 'b'))
+        self.assertTrue(holds.place_hold(1, self.day, 11, 600, 30, 'b'))
+        self.assertTrue(holds.place_hold(2, self.day, 10, 600, 30, 'c'))
+        # Holding again moves the owner's hold
+        self.assertTrue(holds.place_hold(1, self.day, 10, 660, 30, 'a'))
+        self.assertTrue(holds.place_hold(1, self.day, 10, 600, 30, 'c'))
+        self.assertEqual(sorted(holds.other_holds(1, self.day, 'c')), [(10, 660, 30), (11, 600, 30)])
+
+    def test_confirm_and_release_consume_the_hold_once(self):
+        holds.place_hold(1, self.day, 10, 600, 30, 'a')
+        holds.place_hold(1, self.day, 10, 630, 30, 'b')
+        self.assertTrue(holds.confirm_hold(1, self.day, 'a'))
+        self.assertFalse(holds.confirm_hold(1, self.day, 'a'))
+        holds.release_hold(1, self.day, 'b')
+        self.assertEqual(holds.other_holds(1, self.day), [])
+        metrics = holds.hold_metrics()
+        self.assertEqual(
+            [metrics[name] for name in ('placed', 'converted', 'released', 'lost')], [2, 1, 1, 1],
+        )
+
+    def test_expired_holds_free_the_slot(self):
+        now = time_module.time()
+        with mock.patch('user_accounts.holds.time.time', return_value=now):
+            holds.place_hold(1, self.day, 10, 600, 30, 'a', ttl=60)
+        with mock.patch('user_accounts.holds.time.time', return_value=now + 61):
+            self.assertEqual(holds.other_holds(1, self.day), [])
+            self.assertTrue(holds.place_hold(1, self.day, 10, 600, 30, 'b'))
+            self.assertFalse(holds.confirm_hold(1, self.day, 'a'))
+
+    def test_legacy_appointment_holds_share_the_store_and_counters(self):
+        # bookmystyle.booking holds its fixed times like this, with an ISO day string
+        day = self.day.isoformat()
+        self.assertEqual(holds.appointment_interval('3 PM'), (900, 30))
+        self.assertEqual(holds.appointment_interval('3:30 PM'), (930, 30))
+        self.assertTrue(holds.place_hold(holds.APPOINTMENT_SCOPE, day, None, *holds.appointment_interval('4 PM'), 'a'))
+        self.assertFalse(holds.place_hold(holds.APPOINTMENT_SCOPE, day, None, *holds.appointment_interval('4 PM'), 'b'))
+        self.assertTrue(holds.held_by_others(holds.APPOINTMENT_SCOPE, day, None, 960, 30, 'b'))
+        self.assertFalse(holds.held_by_others(holds.APPOINTMENT_SCOPE, day, None, 960, 30, 'a'))
+        # Picking another time moves the hold rather than placing a second one
+        self.assertTrue(holds.place_hold(holds.APPOINTMENT_SCOPE, day, None, *holds.appointment_interval('5 PM'), 'a'))
+        self.assertEqual(holds.other_holds(holds.APPOINTMENT_SCOPE, day, 'b'), [(None, 1020, 30)])
+        self.assertTrue(holds.place_hold(holds.APPOINTMENT_SCOPE, day, None, 960, 30, 'b'))
+        self.assertTrue(holds.confirm_hold(holds.APPOINTMENT_SCOPE, day, 'a'))
+        metrics = holds.hold_metrics()
+        self.assertEqual(
+            [metrics[name] for name in ('placed', 'converted', 'rejected', 'expired')], [2, 1, 1, 1],
+        )
+
+    def test_held_times_are_taken_for_everyone_but_the_holder(self):
+        owner, = _users('salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 1)
+        salon = salons[0]
+        service = services[salon.id][0]
+        stylist_id = staff[salon.id][0]
+        self.assertTrue(holds.place_hold(salon.id, self.day, stylist_id, 600, 30, 'a'))
+
+        others = scheduling.find_start_times(salon.id, self.day, service, staff_id=stylist_id, hold_owner='b')
+        mine = scheduling.find_start_times(salon.id, self.day, service, staff_id=stylist_id, hold_owner='a')
+        self.assertNotIn('10:00', others)
+        self.assertIn('10:00', mine)
+        with self.assertRaisesMessage(ValidationError, 'already booked'):
+            scheduling.validate_booking_slot(
+                salon.id, self.day, time(10, 0), service, staff_id=stylist_id, hold_owner='b',
+            )
+
+    def test_without_holds_takes_capacity_from_the_index_entry(self):
+        entry = {'open': 540, 'step': 30, 'free': [2, 1, 2, 2]}
+        held = availability.without_holds(entry, [(10, 540, 60), (11, 570, 30)])
+        self.assertEqual(held['free'], [1, 0, 2, 2])
+        self.assertEqual(entry['free'], [2, 1, 2, 2])
+
+
+class BookingApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        holds.get_store().clear()
+        self.customer, self.other, owner = _users('customer', 'customer', 'salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 1)
+        self.salon = salons[0]
+        self.salon.status = 'approved'
+        self.salon.save()
+        self.service = services[self.salon.id][0]
+        self.stylist_id = staff[self.salon.id][0]
+        self.day = date.today() + timedelta(days=7 - date.today().weekday())
+        self.url = reverse('customer:api_create_booking')
+        self.data = {
+            'salon': self.salon.id, 'service': self.service.id, 'staff': self.stylist_id,
+            'appointment_date': self.day.isoformat(), 'appointment_time': '10:00',
+        }
+        self.client.force_login(self.customer)
+
+    def test_retries_replay_the_first_response(self):
+        from booking_system.models import Booking
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(self.url, self.data, HTTP_IDEMPOTENCY_KEY='k1')
+        retry = self.client.post(self.url, self.data, HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual((first.status_code, retry.status_code), (201, 201))
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_retry_during_a_slow_first_attempt_does_not_book_twice(self):
+        from booking_system.models import Booking
+        from .serializers import BookingCreateSerializer
+
+        is_valid = BookingCreateSerializer.is_valid
+        retries = []
+
+        def slow_first_attempt(serializer, **kwargs):
+            if not retries:
+                # The client gives up after its own timeout and retries while this attempt still runs
+                later = time_module.time() + 60
+                with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+                    retries.append(self.client.post(self.url, self.data, HTTP_IDEMPOTENCY_KEY='k1'))
+            return is_valid(serializer, **kwargs)
+
+        with mock.patch.object(BookingCreateSerializer, 'is_valid', slow_first_attempt), \
+                self.captureOnCommitCallbacks(execute=True):
+            first = self.client.post(self.url, self.data, HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual((first.status_code, retries[0].status_code), (201, 409))
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_interleaved_requests_book_a_slot_once(self):
+        from booking_system.models import Booking
+        from .bookings import create_booking
+        from .serializers import BookingCreateSerializer
+
+        is_valid = BookingCreateSerializer.is_valid
+
+        def other_request_books_first(serializer, **kwargs):
+            # The other customer's request runs between this request's checks and its save
+            valid = is_valid(serializer, **kwargs)
+            create_booking(self.other, self.salon, self.service, self.day, time(10, 0), staff_id=self.stylist_id)
+            return valid
+
+        with mock.patch.object(BookingCreateSerializer, 'is_valid', other_request_books_first):
+            response = self.client.post(self.url, self.data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already booked', response.json()['appointment_time'][0])
+        self.assertEqual(list(Booking.objects.values_list('customer_id', flat=True)), [self.other.id])
+
+    def test_api_bookings_leave_the_hold_counters_alone(self):
+        self.assertTrue(holds.place_hold(self.salon.id, self.day, self.stylist_id, 900, 30, 'session'))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, self.data)
+        self.assertEqual(response.status_code, 201)
+        metrics = holds.hold_metrics()
+        self.assertEqual((metrics['placed'], metrics['converted'], metrics['lost']), (1, 0, 0))
+
+    def test_create_booking_locks_the_salon_before_checking(self):
+        from salon_management.models import Salon
+        from .bookings import create_booking
+
+        calls = []
+        select_for_update = Salon.objects.select_for_update
+
+        def locking(*args, **kwargs):
+            calls.append('lock')
+            return select_for_update(*args, **kwargs)
+
+        def validating(*args, **kwargs):
+            calls.append('validate')
+            return self.stylist_id
+
+        with mock.patch.object(Salon.objects, 'select_for_update', locking), \
+                mock.patch('user_accounts.bookings.validate_booking_slot', validating):
+            create_booking(self.customer, self.salon, self.service, self.day, time(10, 0))
+        self.assertEqual(calls, ['lock', 'validate'])
+
+
+class BulkBookingStatusTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.customer, owner = _users('customer', 'salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 1)
+        self.service = services[salons[0].id][0]
+        self.day = date.today() + timedelta(days=7 - date.today().weekday())
+        self.bookings = [
+            _create_booking(self.customer, self.service, self.day, time(hour, 0), status=status)
+            for hour, status in [(10, 'pending'), (11, 'pending'), (12, 'confirmed')]
+        ]
+
+    def test_locks_rows_and_updates_them_in_one_statement(self):
+        from booking_system.models import Booking
+        from django.db.models import QuerySet
+        from .bookings import bulk_update_booking_status
+        from .signals import bookings_bulk_updated
+
+        received = []
+        bookings_bulk_updated.connect(lambda sender, **kwargs: received.append(kwargs), weak=False,
+                                      dispatch_uid='test_bulk')
+        self.addCleanup(bookings_bulk_updated.disconnect, dispatch_uid='test_bulk')
+        select_for_update = QuerySet.select_for_update
+        locks = []
+
+        def recording(queryset, *args, **kwargs):
+            locks.append(kwargs)
+            return select_for_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'select_for_update', recording), \
+                CaptureQueriesContext(connection) as queries, \
+                self.captureOnCommitCallbacks(execute=True):
+            updated = bulk_update_booking_status(Booking.objects.filter(customer=self.customer), 'confirmed')
+
+        self.assertEqual(updated, 2)
+        self.assertEqual(locks, [{'of': ('self',)}])
+        booking_updates = [query for query in queries if query['sql'].startswith('UPDATE "booking_system_booking"')]
+        self.assertEqual(len(booking_updates), 1)
+        self.assertEqual(set(Booking.objects.values_list('status', flat=True)), {'confirmed'})
+
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0]['status'], 'confirmed')
+        self.assertEqual(
+            sorted(booking['id'] for booking in received[0]['bookings']),
+            [booking.id for booking in self.bookings[:2]],
+        )
+        self.assertEqual({booking['status'] for booking in received[0]['bookings']}, {'pending'})
+
+    def test_nothing_to_change_sends_no_signal(self):
+        from booking_system.models import Booking
+        from .bookings import bulk_update_booking_status
+
+        with mock.patch('user_accounts.bookings.bookings_bulk_updated') as signal, \
+                self.captureOnCommitCallbacks(execute=True):
+            updated = bulk_update_booking_status(Booking.objects.filter(status='confirmed'), 'confirmed')
+        self.assertEqual(updated, 0)
+        signal.send.assert_not_called()
+
+
+class ReminderTests(TestCase):
+
+    def setUp(self):
+        self.day = date.today() + timedelta(days=7)
+        self.starts = reminders.appointment_timestamp(self.day, time(10, 0))
+        self.clock = clock.FakeClock(self.starts - 3 * 24 * 3600)
+        self.scheduler = reminders.ReminderScheduler(
+            reminders.LocalReminderQueue(), clock=self.clock, lead=timedelta(hours=24),
+        )
+
+    def advance_until_due(self):
+        self.clock.current = self.starts - 24 * 3600
+
+    def test_reminders_pop_once_they_are_due(self):
+        self.scheduler.schedule(1, self.day, time(10, 0))
+        self.assertEqual(self.scheduler.pop_due(), [])
+        self.advance_until_due()
+        self.assertEqual(self.scheduler.pop_due(), [1])
+        self.assertEqual(self.scheduler.pop_due(), [])
+
+    def test_cancel_and_reschedule(self):
+        self.scheduler.schedule(1, self.day, time(10, 0))
+        self.scheduler.schedule(2, self.day, time(10, 0))
+        self.scheduler.cancel(1)
+        # Moved a day later, so its old due time no longer counts
+        self.scheduler.schedule(2, self.day + timedelta(days=1), time(10, 0))
+        self.advance_until_due()
+        self.assertEqual(self.scheduler.pop_due(), [])
+        self.clock.advance(24 * 3600)
+        self.assertEqual(self.scheduler.pop_due(), [2])
+        self.assertEqual(len(self.scheduler.queue), 0)
+
+    def test_past_appointments_are_not_queued(self):
+        self.clock.current = self.starts + 60
+        self.scheduler.schedule(1, self.day, time(10, 0))
+        self.assertEqual(len(self.scheduler.queue), 0)
+
+    def test_send_due_sends_confirmed_bookings_only(self):
+        from django.core import mail
+
+        customer, owner = _users('customer', 'salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 1)
+        service = services[salons[0].id][0]
+        confirmed = _create_booking(customer, service, self.day, time(10, 0), status='confirmed')
+        cancelled = _create_booking(customer, service, self.day, time(11, 0), status='cancelled')
+        for booking in (confirmed, cancelled):
+            self.scheduler.schedule(booking.id, self.day, time(10, 0))
+        self.advance_until_due()
+
+        self.assertEqual(self.scheduler.send_due(), 1)
+        self.assertEqual([message.to for message in mail.outbox], [[customer.email]])
+
+    def test_failed_sends_are_queued_again(self):
+        customer, owner = _users('customer', 'salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 1)
+        service = services[salons[0].id][0]
+        bookings = [
+            _create_booking(customer, service, self.day, time(hour, 0), status='confirmed') for hour in (10, 11, 12)
+        ]
+        for booking in bookings:
+            self.scheduler.schedule(booking.id, self.day, time(10, 0))
+        self.advance_until_due()
+
+        sent = []
+
+        def send_messages(messages):
+            if len(sent) == 1:
+                raise ConnectionRefusedError
+            sent.extend(messages)
+            return len(messages)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=send_messages):
+            with self.assertRaises(ConnectionRefusedError):
+                self.scheduler.send_due()
+        self.assertEqual(len(sent), 1)
+        self.assertEqual(len(self.scheduler.queue), 2)
+        self.assertEqual(self.scheduler.send_due(), 2)
+
+    @override_settings(REMINDER_QUEUE='local')
+    def test_bookings_touch_the_queue_only_when_confirmation_changes(self):
+        customer, owner = _users('customer', 'salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 1)
+        scheduler = reminders.get_scheduler()
+
+        def save(booking=None, **changes):
+            with mock.patch.object(scheduler, 'schedule') as schedule, \
+                    mock.patch.object(scheduler, 'cancel') as cancel, \
+                    self.captureOnCommitCallbacks(execute=True):
+                if booking is None:
+                    booking = _create_booking(customer, services[salons[0].id][0], self.day, time(10, 0))
+                elif changes.pop('delete', False):
+                    booking.delete()
+                else:
+                    for field, value in changes.items():
+                        setattr(booking, field, value)
+                    booking.save()
+            return booking, schedule.call_count, cancel.call_count
+
+        booking, scheduled, cancelled = save()
+        self.assertEqual((scheduled, cancelled), (0, 0))
+        self.assertEqual(save(booking, status='confirmed')[1:], (1, 0))
+        self.assertEqual(save(booking)[1:], (0, 0))
+        self.assertEqual(save(booking, appointment_time=time(11, 0))[1:], (1, 0))
+        self.assertEqual(save(booking, status='cancelled')[1:], (0, 1))
+        self.assertEqual(save(booking, status='pending')[1:], (0, 0))
+        self.assertEqual(save(booking, delete=True)[1:], (0, 0))
+
+    @override_settings(REMINDER_QUEUE='redis', REMINDER_REDIS_URL=None)
+    def test_missing_queue_is_reported_and_skipped(self):
+        self.assertEqual([error.id for error in reminders.check_reminder_queue(None)], ['user_accounts.W001'])
+
+        customer, owner = _users('customer', 'salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 1)
+        with self.assertLogs('user_accounts.reminders', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            _create_booking(customer, services[salons[0].id][0], self.day, time(10, 0), status='confirmed')
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.customer, owner = _users('customer', 'salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 2)
+        self.services = [services[salon.id][0] for salon in salons]
+        self.day = date.today() + timedelta(days=7 - date.today().weekday())
+
+    def stats(self, service, day=None):
+        from .models import SalonDailyStats
+
+        return SalonDailyStats.objects.get(salon_id=service.salon_id, date=day or self.day)
+
+    def test_status_changes_and_payments_refresh_the_rollup(self):
+        from booking_system.models import Booking, Payment
+
+        service = self.services[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = _create_booking(self.customer, service, self.day, time(10, 0))
+        self.assertEqual((self.stats(service).pending_bookings, self.stats(service).confirmed_bookings), (1, 0))
+
+        # As approve_booking saves it
+        with self.captureOnCommitCallbacks(execute=True):
+            approved = Booking.objects.only('id').get(pk=booking.pk)
+            approved.status = 'confirmed'
+            approved.save(update_fields=['status'])
+        self.assertEqual((self.stats(service).pending_bookings, self.stats(service).confirmed_bookings), (0, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            payment = _build(Payment, booking=booking, amount=Decimal('30.00'), status='pending')
+            payment.save()
+        self.assertEqual(self.stats(service).revenue, Decimal('0'))
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.status = 'completed'
+            payment.save()
+        self.assertEqual(self.stats(service).revenue, Decimal('30.00'))
+        # e.g. a refund removed in the admin
+        with self.captureOnCommitCallbacks(execute=True):
+            payment.delete()
+        self.assertEqual(self.stats(service).revenue, Decimal('0'))
+
+    def test_moving_a_booking_refreshes_both_days(self):
+        service = self.services[0]
+        with self.captureOnCommitCallbacks(execute=True):
+            booking = _create_booking(self.customer, service, self.day, time(10, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            booking.appointment_date = self.day + timedelta(days=7)
+            booking.save()
+        self.assertEqual(self.stats(service).total_bookings, 0)
+        self.assertEqual(self.stats(service, self.day + timedelta(days=7)).total_bookings, 1)
+
+    def test_compute_salon_days_counts_only_the_requested_pairs(self):
+        from . import rollups
+
+        other_day = self.day + timedelta(days=1)
+        first, second = self.services
+        for service in self.services:
+            for day in (self.day, other_day):
+                _create_booking(self.customer, service, day, time(10, 0))
+        _create_booking(self.customer, first, self.day, time(11, 0))
+
+        rows = rollups.compute_salon_days([(first.salon_id, self.day), (second.salon_id, other_day)])
+        self.assertEqual(
+            sorted((row.salon_id, row.date, row.total_bookings) for row in rows),
+            sorted([(first.salon_id, self.day, 2), (second.salon_id, other_day, 1)]),
+        )
+        self.assertEqual(rollups.compute_salon_days([]), [])
+
+
+class ArchivalTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.customer, owner = _users('customer', 'salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 1)
+        self.service = services[salons[0].id][0]
+        self.old_day = date.today() - timedelta(days=400)
+
+    def test_batch_moves_bookings_and_payments_without_delete_signals(self):
+        from booking_system.models import Booking, Payment
+        from . import archival
+        from .models import ArchivedBooking, ArchivedPayment
+
+        booking = _create_booking(self.customer, self.service, self.old_day, time(10, 0), status='completed')
+        _build(Payment, booking=booking, amount=Decimal('30.00'), status='completed').save()
+        kept = _create_booking(self.customer, self.service, date.today(), time(10, 0), status='completed')
+
+        with mock.patch('user_accounts.profile_counters.booking_deleted') as booking_deleted, \
+                self.captureOnCommitCallbacks(execute=True):
+            moved = archival.archive_booking_batch(archival.archive_cutoff())
+        self.assertEqual(moved, 1)
+        booking_deleted.assert_not_called()
+        self.assertEqual(list(Booking.objects.values_list('id', flat=True)), [kept.id])
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(ArchivedBooking.objects.get().id, booking.id)
+        self.assertEqual(ArchivedPayment.objects.get().booking_id, booking.id)
+
+    def test_referenced_bookings_stay_live_and_do_not_block_the_batch(self):
+        from booking_system.models import Booking, Review
+        from . import archival
+
+        reviewed = _create_booking(self.customer, self.service, self.old_day, time(10, 0), status='completed')
+        Review.objects.create(
+            customer=self.customer, salon=reviewed.salon, booking=reviewed, service=self.service, rating=5,
+        )
+        plain = _create_booking(self.customer, self.service, self.old_day, time(11, 0), status='completed')
+
+        self.assertEqual(archival.archive_history(), {'bookings': 1, 'appointments': 0})
+        self.assertEqual(list(Booking.objects.values_list('id', flat=True)), [reviewed.id])
+        self.assertFalse(Booking.objects.filter(pk=plain.pk).exists())
+        # The next run has nothing left to move instead of failing on the same row
+        self.assertEqual(archival.archive_history(), {'bookings': 0, 'appointments': 0})
+
+    def test_history_pages_merge_live_and_archived_bookings(self):
+        from django.core.paginator import Paginator
+        from . import archival
+
+        for offset in range(5):
+            _create_booking(
+                self.customer, self.service, self.old_day + timedelta(days=2 * offset), time(10, 0),
+                status='completed',
+            )
+        archival.archive_booking_batch(archival.archive_cutoff(), batch_size=3)
+        for offset in range(4):
+            _create_booking(self.customer, self.service, self.old_day + timedelta(days=2 * offset + 1), time(10, 0))
+
+        history = archival.customer_booking_history(self.customer)
+        pages = Paginator(history, 4)
+        self.assertEqual(pages.count, 9)
+        days = [booking.appointment_date for number in pages.page_range for booking in pages.page(number)]
+        self.assertEqual(days, sorted(days, reverse=True))
+        self.assertEqual(len(set(days)), 9)
+
+    def test_archived_bookings_of_deleted_services_keep_their_name(self):
+        from . import archival
+
+        _create_booking(self.customer, self.service, self.old_day, time(10, 0), status='completed')
+        archival.archive_booking_batch(archival.archive_cutoff())
+        name = self.service.name
+        self.service.delete()
+
+        booking, = archival.customer_booking_history(self.customer)[0:20]
+        self.assertEqual(booking.service.name, name)
+
+
+class GatherQueriesTests(TransactionTestCase):
+
+    def test_queries_run_on_worker_threads_that_close_their_connections(self):
+        from concurrent.futures import ThreadPoolExecutor
+        from asgiref.sync import async_to_sync
+        from . import async_queries
+
+        _users('customer', 'salon_owner')
+        executor = ThreadPoolExecutor(max_workers=2)
+        self.addCleanup(executor.shutdown)
+        threads = set()
+
+        def count(role):
+            def query():
+                threads.add(threading.get_ident())
+                return User.objects.filter(role=role).count()
+            return query
+
+        # Closing is a no-op on SQLite's in-memory test database, so check the calls
+        with mock.patch('user_accounts.async_queries._executor', executor), \
+                mock.patch('user_accounts.async_queries.close_old_connections') as close_old_connections:
+            close_old_connections.side_effect = lambda: threads.add(threading.get_ident())
+            results = async_to_sync(async_queries.gather_queries)(count('customer'), count('salon_owner'), count('admin'))
+        self.assertEqual(results, [1, 1, 0])
+        self.assertNotIn(threading.get_ident(), threads)
+        # Once before and once after each query
+        self.assertEqual(close_old_connections.call_count, 6)
+
+
+@override_settings(DATABASE_ROUTERS=['user_accounts.db_router.ReplicaRouter'])
+class ReplicaRouterTests(TransactionTestCase):
+    """Primary and replica are two SQLite files holding different rows"""
+
+    def setUp(self):
+        from django.db import connections
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        connections.settings['replica'] = {
+            **connections.settings['default'],
+            'NAME': os.path.join(directory, 'replica.sqlite3'),
+            'TEST': {**connections.settings['default']['TEST'], 'MIRROR': None},
+        }
+        self.addCleanup(connections.settings.pop, 'replica')
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(lambda: connections['replica'].close())
+        with connections['replica'].schema_editor() as editor:
+            editor.create_model(User)
+        User.objects.using('replica').create(username='replica', email='replica@example.com')
+        User.objects.create(username='primary', email='primary@example.com')
+
+        has_replica = mock.patch('user_accounts.db_router.has_replica', return_value=True)
+        has_replica.start()
+        self.addCleanup(has_replica.stop)
+
+    def usernames(self):
+        return list(User.objects.values_list('username', flat=True))
+
+    def middleware(self, view):
+        from django.test import RequestFactory
+        from .db_router import ReadYourWritesMiddleware
+
+        return ReadYourWritesMiddleware(view), RequestFactory()
+
+    def test_reads_go_to_the_replica_only_when_asked(self):
+        from .db_router import primary_reads, replica_reads
+
+        self.assertEqual(self.usernames(), ['primary'])
+        with replica_reads():
+            self.assertEqual(self.usernames(), ['replica'])
+            with primary_reads():
+                self.assertEqual(self.usernames(), ['primary'])
+            with transaction.atomic():
+                self.assertEqual(self.usernames(), ['primary'])
+
+    def test_without_a_replica_everything_reads_from_the_primary(self):
+        from .db_router import replica_reads
+
+        with mock.patch('user_accounts.db_router.has_replica', return_value=False), replica_reads():
+            self.assertEqual(self.usernames(), ['primary'])
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        from django.http import JsonResponse
+        from .db_router import REPLICA_PIN_COOKIE
+
+        def view(request):
+            before = self.usernames()
+            if 'write' in request.GET:
+                User.objects.filter(username='primary').update(first_name='Written')
+            return JsonResponse({'before': before, 'after': self.usernames()})
+
+        middleware, factory = self.middleware(view)
+        response = middleware(factory.get('/'))
+        self.assertEqual(json.loads(response.content), {'before': ['replica'], 'after': ['replica']})
+        self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
+
+        response = middleware(factory.get('/', {'write': 1}))
+        self.assertEqual(json.loads(response.content), {'before': ['replica'], 'after': ['primary']})
+        self.assertIn(REPLICA_PIN_COOKIE, response.cookies)
+
+        request = factory.get('/')
+        request.COOKIES[REPLICA_PIN_COOKIE] = '1'
+        self.assertEqual(json.loads(middleware(request).content)['before'], ['primary'])
+        self.assertEqual(json.loads(middleware(factory.post('/')).content)['before'], ['primary'])
+
+    def test_logged_in_reads_stay_on_the_replica(self):
+        from django.contrib.auth.middleware import AuthenticationMiddleware
+        from django.contrib.sessions.backends.db import SessionStore
+        from django.contrib.sessions.middleware import SessionMiddleware
+        from django.http import JsonResponse
+        from .db_router import REPLICA_PIN_COOKIE
+        from .middleware import SessionSecurityMiddleware
+
+        user = User.objects.get(username='primary')
+        session = SessionStore()
+        session.update({
+            '_auth_user_id': str(user.pk),
+            '_auth_user_backend': 'django.contrib.auth.backends.ModelBackend',
+            '_auth_user_hash': user.get_session_auth_hash(),
+            'user_role': user.role or None,
+        })
+        session.create()
+
+        def view(request):
+            # Touching the session makes SessionMiddleware save it on the way out
+            request.session['last_seen'] = 'now'
+            return JsonResponse({'users': self.usernames(), 'modified': request.session.modified})
+
+        chain = SessionSecurityMiddleware(view)
+        chain = AuthenticationMiddleware(chain)
+        chain = SessionMiddleware(chain)
+        middleware, factory = self.middleware(chain)
+        request = factory.get('/')
+        request.COOKIES['sessionid'] = session.session_key
+        with mock.patch('django.contrib.auth.get_user', return_value=user):
+            response = middleware(request)
+
+        self.assertEqual(json.loads(response.content)['users'], ['replica'])
+        self.assertNotIn(REPLICA_PIN_COOKIE, response.cookies)
+        self.assertEqual(SessionStore(session.session_key).load()['last_seen'], 'now')
+
+    def test_unchanged_role_does_not_modify_the_session(self):
+        from django.contrib.sessions.backends.db import SessionStore
+        from django.test import RequestFactory
+        from .middleware import SessionSecurityMiddleware
+
+        user, = _users('customer')
+        request = RequestFactory().get('/')
+        request.user = user
+        request.session = SessionStore()
+        request.session['user_role'] = 'customer'
+        request.session.modified = False
+        SessionSecurityMiddleware(lambda request: None).process_request(request)
+        self.assertFalse(request.session.modified)
+
+    def test_streamed_bodies_keep_the_request_routing(self):
+        from django.http import StreamingHttpResponse
+
+        def body():
+            # Runs only when the server reads the response
+            yield from self.usernames()
+
+        middleware, factory = self.middleware(lambda request: StreamingHttpResponse(body()))
+        response = middleware(factory.get('/'))
+        self.assertEqual(b''.join(response.streaming_content), b'replica')
+
+
+class TieredCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.cache = tiered_cache.TieredCache('test-tiered')
+        self.calls = []
+
+    def compute(self, value='value'):
+        def compute():
+            self.calls.append(value)
+            return value
+        return compute
+
+    def test_lookups_fall_through_l1_then_l2_then_compute(self):
+        self.assertEqual(self.cache.get_or_set('k', self.compute(), 60), 'value')
+        self.assertEqual(self.cache.get_or_set('k', self.compute(), 60), 'value')
+        # Another process: empty L1, shared L2
+        self.cache.l1.clear()
+        self.assertEqual(self.cache.get_or_set('k', self.compute(), 60), 'value')
+        self.assertEqual(self.calls, ['value'])
+        stats = self.cache.stats()
+        self.assertEqual((stats['misses'], stats['l1_hits'], stats['l2_hits']), (1, 1, 1))
+
+        self.cache.delete('k')
+        self.cache.get_or_set('k', self.compute('new'), 60)
+        self.assertEqual(self.calls, ['value', 'new'])
+
+    def test_concurrent_misses_compute_once(self):
+        started = threading.Event()
+
+        def slow():
+            started.set()
+            time_module.sleep(0.2)
+            self.calls.append('value')
+            return 'value'
+
+        results = []
+        workers = [
+            threading.Thread(target=lambda: results.append(self.cache.get_or_set('k', slow, 60)))
+            for _ in range(5)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(self.calls, ['value'])
+
+    def test_waits_for_a_value_another_process_is_computing(self):
+        cache.add('test-tiered:k:lock', 'other-process', 30)
+
+        def other_process_finishes():
+            time_module.sleep(0.1)
+            cache.set('test-tiered:k', {'value': 'theirs', 'delta': 0.1, 'expires': time_module.time() + 60}, 60)
+
+        finisher = threading.Thread(target=other_process_finishes)
+        finisher.start()
+        with mock.patch('user_accounts.tiered_cache.WAIT_INTERVAL', 0.01):
+            self.assertEqual(self.cache.get_or_set('k', self.compute(), 60), 'theirs')
+        finisher.join()
+        self.assertEqual(self.calls, [])
+
+    def test_expensive_values_are_refreshed_early_by_one_caller(self):
+        entry = {'value': 'old', 'delta': 10.0, 'expires': time_module.time() + 1}
+        cache.set('test-tiered:k', entry, 60)
+        with mock.patch('user_accounts.tiered_cache.random.random', return_value=0.0):
+            self.assertEqual(self.cache.get_or_set('k', self.compute('new'), 60), 'old')
+        self.cache.l1.clear()
+        # While one caller refreshes, the others keep the old value
+        cache.add('test-tiered:k:lock', 'refreshing', 30)
+        with mock.patch('user_accounts.tiered_cache.random.random', return_value=0.99):
+            self.assertEqual(self.cache.get_or_set('k', self.compute('new'), 60), 'old')
+        cache.delete('test-tiered:k:lock')
+        self.cache.l1.clear()
+        with mock.patch('user_accounts.tiered_cache.random.random', return_value=0.99):
+            self.assertEqual(self.cache.get_or_set('k', self.compute('new'), 60), 'new')
+        self.assertEqual(self.calls, ['new'])
+        self.assertEqual(self.cache.stats()['early_refreshes'], 1)
+
+    def test_lock_is_only_released_by_its_holder(self):
+        token = self.cache._acquire('test-tiered:k')
+        self.assertIsNone(self.cache._acquire('test-tiered:k'))
+        # Our lock timed out and another caller took it
+        cache.set('test-tiered:k:lock', 'later-caller', 30)
+        self.cache._release('test-tiered:k', token)
+        self.assertEqual(cache.get('test-tiered:k:lock'), 'later-caller')
+
+    def test_redis_lock_is_compared_and_deleted_by_one_script(self):
+        from django.core.cache.backends.redis import RedisCache
+
+        l2 = RedisCache('redis://localhost:6379/0', {})
+        client = mock.Mock()
+        with mock.patch.object(tiered_cache.TieredCache, 'l2', l2), \
+                mock.patch.object(l2._cache, 'get_client', return_value=client):
+            self.cache._release('test-tiered:k', 'token')
+        client.register_script.assert_called_once_with(tiered_cache.RELEASE_LOCK)
+        client.register_script.return_value.assert_called_once_with(
+            keys=[l2.make_and_validate_key('test-tiered:k:lock')], args=[l2._cache._serializer.dumps('token')],
+        )
+        client.get.assert_not_called()
+        client.delete.assert_not_called()
+
+
+class BenchBootTests(TestCase):
+
+    def run_bench(self, budget_ms):
+        from io import StringIO
+        from django.core.management import call_command
+        from .management.commands import bench_boot
+
+        # Interpreter start-up, boot, boot plus the first request's imports
+        medians = mock.patch.object(bench_boot.Command, '_median', side_effect=[20.0, 300.0, 340.0])
+        rows = [('user_accounts.signals', 500, 4000), ('django.db', 900, 9000), ('user_accounts.views', 700, 8000)]
+        # Project apps are found from the settings, not the working directory
+        cwd = os.getcwd()
+        self.addCleanup(os.chdir, cwd)
+        os.chdir(tempfile.gettempdir())
+        with medians, mock.patch.object(bench_boot, 'import_times', return_value=rows):
+            out = StringIO()
+            call_command('bench_boot', runs=1, budget_ms=budget_ms, stdout=out)
+        return out.getvalue()
+
+    def test_reports_project_modules_and_deferred_imports(self):
+        out = self.run_bench(budget_ms=500)
+        self.assertIn('Deferred to the first request (forms, API): 40.0 ms', out)
+        self.assertIn('user_accounts.signals', out)
+        self.assertNotIn('django.db', out)
+        self.assertLess(out.index('user_accounts.views'), out.index('user_accounts.signals'))
+
+    def test_fails_over_budget(self):
+        from django.core.management import CommandError
+
+        with self.assertRaisesMessage(CommandError, 'over the 250 ms budget'):
+            self.run_bench(budget_ms=250)
+
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        request_metrics.reset()
+        self.addCleanup(request_metrics.reset)
+        request_metrics._install_query_timer(sender=None, connection=connection)
+
+    def test_streaming_response_is_recorded_after_its_body(self):
+        from django.http import StreamingHttpResponse
+        from django.test import RequestFactory
+
+        def rows():
+            for number in range(3):
+                yield f'{User.objects.count()},'
+
+        middleware = request_metrics.RequestMetricsMiddleware(lambda request: StreamingHttpResponse(rows()))
+        response = middleware(RequestFactory().get('/export/'))
+        self.assertEqual(request_metrics.requests_total._values, {})
+
+        self.assertEqual(b''.join(response.streaming_content), b'0,0,0,')
+        response.close()
+        response.close()
+        view = request_metrics.UNRESOLVED_VIEW
+        self.assertEqual(request_metrics.requests_total._values, {(view, '2xx'): 1})
+        # One observation, of the three queries run while streaming
+        self.assertEqual(request_metrics.query_count._series[view][-1], 3)
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.owner, self.customer = _users('salon_owner', 'customer')
+        salons, services, staff = Generator(seed=1).salons([self.owner], 1)
+        self.salon = salons[0]
+        self.service = services[self.salon.id][0]
+
+    def fetch(self, etag=None, user=None, session=None, cookies=None, **headers):
+        """Run a salon page through the middleware the way the request handler does"""
+        from django.contrib.auth.models import AnonymousUser
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from django.urls import ResolverMatch
+        from .middleware import ConditionalGetMiddleware
+
+        view = mock.Mock(return_value=HttpResponse('salon page'))
+        kwargs = {'salon_id': self.salon.id}
+        if etag:
+            headers['HTTP_IF_NONE_MATCH'] = etag
+        request = RequestFactory().get(f'/salons/{self.salon.id}/', **headers)
+        request.COOKIES.update(cookies or {})
+        request.user = user or AnonymousUser()
+        request.session = {} if session is None else session
+        request.resolver_match = ResolverMatch(view, (), kwargs, url_name='detail', namespaces=['salons'])
+
+        middleware = ConditionalGetMiddleware(view)
+        response = middleware.process_view(request, view, (), kwargs) or view(request)
+        return middleware.process_response(request, response), view
+
+    def test_matching_etag_is_answered_without_the_view(self):
+        response, view = self.fetch()
+        self.assertEqual(response.status_code, 200)
+        view.assert_called_once()
+
+        response, view = self.fetch(response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        view.assert_not_called()
+
+    def test_salon_service_and_review_changes_change_the_etag(self):
+        from booking_system.models import Review
+
+        def change_salon():
+            self.salon.name += ' & Co'
+            self.salon.save()
+
+        def change_service():
+            self.service.price += 1
+            self.service.save()
+
+        def add_review():
+            booking = _create_booking(self.customer, self.service, date(2026, 10, 20), time(10), status='completed')
+            Review.objects.create(
+                customer=self.customer, salon=self.salon, booking=booking, service=self.service, rating=5,
+            )
+
+        etag = self.fetch()[0]['ETag']
+        for change in (change_salon, change_service, add_review):
+            with self.subTest(change=change.__name__):
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                response, view = self.fetch(etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response['ETag'], etag)
+                etag = response['ETag']
+
+    def test_anonymous_requests_do_not_load_the_session(self):
+        session = mock.MagicMock()
+        response, view = self.fetch(session=session)
+        self.assertEqual(response.status_code, 200)
+        session.get.assert_not_called()
+
+        # A flash message waiting in the session is rendered, not answered with a 304
+        etag = response['ETag']
+        response, view = self.fetch(etag, session={'_messages': '[]'}, cookies={'sessionid': 'abc'})
+        view.assert_called_once()
+        response, view = self.fetch(etag, session={}, cookies={'sessionid': 'abc'})
+        self.assertEqual(response.status_code, 304)
+
+    def test_logging_in_is_not_answered_by_the_modification_date(self):
+        response, view = self.fetch()
+        self.assertFalse(response.has_header('Last-Modified'))
+        # A cache that only kept the date revalidates the anonymous copy
+        response, view = self.fetch(user=self.customer, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        view.assert_called_once()
+
+
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        self.clock = clock.FakeClock(start=1000)
+        self.store = rate_limiting.LocalBucketStore(self.clock)
+
+    def request(self, ip='10.0.0.1', **headers):
+        from django.contrib.auth.models import AnonymousUser
+        from django.test import RequestFactory
+
+        request = RequestFactory().get('/', REMOTE_ADDR=ip, **headers)
+        request.user = AnonymousUser()
+        return request
+
+    def test_bucket_spends_and_refills_at_its_rate(self):
+        bucket = [('search:ip:10.0.0.1', 2.0, 3)]
+        self.assertEqual([self.store.take(bucket)[0] for _ in range(3)], [True] * 3)
+        self.assertEqual(self.store.take(bucket), (False, 0.5))
+
+        self.clock.advance(0.5)
+        self.assertEqual(self.store.take(bucket), (True, 0.0))
+        # Refilling stops at the burst
+        self.clock.advance(60)
+        self.assertEqual([self.store.take(bucket)[0] for _ in range(4)], [True] * 3 + [False])
+
+    def test_rejected_request_spends_no_tokens(self):
+        rules = [
+            {'name': 'booking', 'match': ['customer:book'], 'key': 'ip', 'rate': 0.01, 'burst': 1},
+            {'name': 'per-ip', 'match': ['*'], 'key': 'ip', 'rate': 0.01, 'burst': 3},
+        ]
+        with mock.patch.object(rate_limiting, 'RATE_LIMITS', rules):
+            request = self.request()
+            self.assertIsNone(rate_limiting.check_rate_limits(request, 'customer:book', self.store))
+            for _ in range(5):
+                self.assertAlmostEqual(rate_limiting.check_rate_limits(request, 'customer:book', self.store), 100)
+            # The rejected bookings left the per-IP bucket untouched
+            allowed = [rate_limiting.check_rate_limits(request, 'core:about', self.store) for _ in range(3)]
+            self.assertEqual(allowed[:2], [None, None])
+            self.assertIsNotNone(allowed[2])
+
+    def test_full_buckets_are_pruned(self):
+        self.store.MAX_BUCKETS = 2
+        self.store.take([('a', 1.0, 1), ('b', 1.0, 1)])
+        self.clock.advance(5)
+        self.store.take([('c', 1.0, 1)])
+        self.assertEqual(set(self.store._buckets), {'c'})
+
+    def test_shedding_thresholds(self):
+        def shed(view_name, in_flight=1, queued_ms=None):
+            request = self.request()
+            request.queue_ms = queued_ms
+            with mock.patch.object(rate_limiting.load_gauge, 'in_flight', in_flight):
+                return rate_limiting.should_shed(request, view_name)
+
+        with mock.patch.object(rate_limiting, 'MAX_IN_FLIGHT', 4), \
+                mock.patch.object(rate_limiting, 'MAX_QUEUE_MS', 100):
+            self.assertFalse(shed('salons:search', in_flight=4))
+            # At the threshold only low-priority pages go
+            self.assertTrue(shed('salons:search', in_flight=5))
+            self.assertFalse(shed('customer:dashboard', in_flight=5))
+            self.assertTrue(shed('customer:dashboard', in_flight=9))
+            self.assertTrue(shed('customer:dashboard', queued_ms=200))
+            self.assertFalse(shed('salons:book', in_flight=50, queued_ms=5000))
+
+    def test_queue_time_from_proxy_header(self):
+        now = 1_700_000_000.0
+        for header in ('t=1699999999.75', '1699999999750', '1699999999750000'):
+            with self.subTest(header=header):
+                request = self.request(HTTP_X_REQUEST_START=header)
+                self.assertAlmostEqual(rate_limiting.queue_ms(request, now=now), 250, places=0)
+        self.assertIsNone(rate_limiting.queue_ms(self.request()))
+
+
+class AccountEmailTests(TestCase):
+
+    def register(self, **overrides):
+        data = {
+            'first_name': 'Ada', 'last_name': 'Lovelace', 'email': 'ada@example.com', 'phone_number': '',
+            'password1': 'a-long-Passw0rd', 'password2': 'a-long-Passw0rd',
+        }
+        data.update(overrides)
+        return self.client.post(reverse('accounts:customer_register'), data)
+
+    def test_registration_emails_are_queued_after_commit(self):
+        from django.core import mail
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.register()
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(mail.outbox, [])
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(
+            [message.subject for message in mail.outbox], ['Welcome to BookMyStyle', 'Confirm your email address'],
+        )
+
+    def test_retrying_verification_does_not_resend_welcome(self):
+        from django.core import mail
+        from django.core.mail import EmailMessage
+
+        send = EmailMessage.send
+        failed = []
+
+        def flaky_send(message, fail_silently=False):
+            if message.subject.startswith('Confirm') and not failed:
+                failed.append(message)
+                raise OSError('mail server unreachable')
+            return send(message, fail_silently)
+
+        with mock.patch.object(EmailMessage, 'send', autospec=True, side_effect=flaky_send):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.register()
+        self.assertEqual(len(failed), 1)
+        self.assertEqual(
+            [message.subject for message in mail.outbox], ['Welcome to BookMyStyle', 'Confirm your email address'],
+        )
+
+    def test_verify_email_link(self):
+        customer, = _users('customer')
+
+        def verify(token):
+            self.client.get(reverse('accounts:verify_email', args=[token]))
+            customer.refresh_from_db()
+            return customer.is_verified
+
+        expired = verification_token(customer)
+        with mock.patch('django.core.signing.time.time', return_value=time_module.time() + 4 * 24 * 3600):
+            self.assertFalse(verify(expired))
+
+        changed = verification_token(customer)
+        User.objects.filter(pk=customer.pk).update(email='new@example.com')
+        self.assertFalse(verify(changed))
+
+        customer.refresh_from_db()
+        self.assertTrue(verify(verification_token(customer)))
+
+    def test_new_salons_are_reported_in_one_digest_per_window(self):
+        from django.core import mail
+        from salon_management.models import Salon
+        from .tasks import alert_admins_new_salons, queue_new_salon_alert
+
+        cache.clear()
+        owner, admin = _users('salon_owner', 'admin')
+        with mock.patch.object(alert_admins_new_salons, 'apply_async') as schedule:
+            queue_new_salon_alert()
+            queue_new_salon_alert()
+        schedule.assert_called_once()
+
+        salons, services, staff = Generator(seed=1).salons([owner], 2)
+        Salon.objects.filter(pk__in=[salon.pk for salon in salons]).update(
+            created_at=timezone.now() - timedelta(seconds=10),
+        )
+        alert_admins_new_salons()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [admin.email])
+        self.assertTrue(mail.outbox[0].subject.startswith('2 new salons'))
+
+        # Salons already reported are not reported again
+        alert_admins_new_salons()
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class ProfileCounterTests(TestCase):
+
+    COUNTERS = ('total_bookings', 'pending_bookings', 'confirmed_bookings', 'completed_bookings', 'cancelled_bookings')
+
+    def setUp(self):
+        self.owner, self.other_owner, self.customer = _users('salon_owner', 'salon_owner', 'customer')
+        CustomerProfile.objects.create(user=self.customer)
+        SalonOwnerProfile.objects.create(user=self.owner)
+        SalonOwnerProfile.objects.create(user=self.other_owner)
+        salons, services, staff = Generator(seed=1).salons([self.owner], 1)
+        self.salon = salons[0]
+        self.service = services[self.salon.id][0]
+        self.day = date(2026, 10, 20)
+
+    def counters(self, profile_model, user):
+        profile = profile_model.objects.get(user=user)
+        return [getattr(profile, field) for field in self.COUNTERS]
+
+    def test_booking_counters_follow_create_status_change_and_delete(self):
+        from booking_system.models import Booking
+
+        booking = _create_booking(self.customer, self.service, self.day, time(10))
+        self.assertEqual(self.counters(CustomerProfile, self.customer), [1, 1, 0, 0, 0])
+        self.assertEqual(self.counters(SalonOwnerProfile, self.owner), [1, 1, 0, 0, 0])
+
+        booking.status = 'confirmed'
+        booking.save()
+        self.assertEqual(self.counters(CustomerProfile, self.customer), [1, 0, 1, 0, 0])
+
+        # Saved from a partially loaded instance
+        partial = Booking.objects.only('id').get(pk=booking.pk)
+        partial.status = 'cancelled'
+        partial.save(update_fields=['status'])
+        self.assertEqual(self.counters(CustomerProfile, self.customer), [1, 0, 0, 0, 1])
+        self.assertEqual(self.counters(SalonOwnerProfile, self.owner), [1, 0, 0, 0, 1])
+
+        Booking.objects.get(pk=booking.pk).delete()
+        self.assertEqual(self.counters(CustomerProfile, self.customer), [0] * 5)
+        self.assertEqual(self.counters(SalonOwnerProfile, self.owner), [0] * 5)
+
+    def test_salon_counters_follow_create_owner_change_and_delete(self):
+        from salon_management.models import Salon
+        from . import profile_counters
+
+        _create_booking(self.customer, self.service, self.day, time(10))
+        # The generator bulk-creates salons, which skips the counters
+        list(profile_counters.reconcile(SalonOwnerProfile))
+
+        copy = Salon.objects.get(pk=self.salon.pk)
+        copy.pk = None
+        copy._state.adding = True
+        copy.save()
+        self.assertEqual(SalonOwnerProfile.objects.get(user=self.owner).total_salons, 2)
+
+        salon = Salon.objects.get(pk=self.salon.pk)
+        salon.owner = self.other_owner
+        salon.save()
+        self.assertEqual(SalonOwnerProfile.objects.get(user=self.owner).total_salons, 1)
+        self.assertEqual(self.counters(SalonOwnerProfile, self.owner), [0] * 5)
+        self.assertEqual(SalonOwnerProfile.objects.get(user=self.other_owner).total_salons, 1)
+        self.assertEqual(self.counters(SalonOwnerProfile, self.other_owner), [1, 1, 0, 0, 0])
+
+        salon.delete()
+        self.assertEqual(SalonOwnerProfile.objects.get(user=self.other_owner).total_salons, 0)
+        self.assertEqual(self.counters(SalonOwnerProfile, self.other_owner), [0] * 5)
+
+    def test_deleting_a_salon_uncounts_its_bookings_once(self):
+        from booking_system.models import Booking
+        from . import archival, profile_counters
+
+        other = User.objects.create_user(
+            username='other@example.com', email='other@example.com', password='x', role='customer',
+        )
+        CustomerProfile.objects.create(user=other)
+        _create_booking(self.customer, self.service, date.today() - timedelta(days=400), time(9), status='completed')
+        archival.archive_booking_batch(archival.archive_cutoff())
+        _create_booking(self.customer, self.service, self.day, time(10))
+        _create_booking(other, self.service, self.day, time(11), status='confirmed')
+        list(profile_counters.reconcile(SalonOwnerProfile))
+        self.assertEqual(self.counters(SalonOwnerProfile, self.owner), [3, 1, 1, 1, 0])
+
+        salon_id = self.salon.pk
+        with mock.patch.object(
+            profile_counters, '_owner_profiles', wraps=profile_counters._owner_profiles,
+        ) as owner_profiles:
+            self.salon.delete()
+        owner_profiles.assert_called_once_with(salon_id)
+        self.assertFalse(Booking.objects.exists())
+        self.assertEqual(self.counters(SalonOwnerProfile, self.owner), [0] * 5)
+        self.assertEqual(SalonOwnerProfile.objects.get(user=self.owner).total_salons, 0)
+        self.assertEqual(self.counters(CustomerProfile, self.customer), [0] * 5)
+        self.assertEqual(self.counters(CustomerProfile, other), [0] * 5)
+
+        # Bookings deleted on their own are still uncounted one by one
+        booking = _create_booking(other, self.other_service(), self.day, time(10))
+        self.assertEqual(self.counters(CustomerProfile, other), [1, 1, 0, 0, 0])
+        booking.delete()
+        self.assertEqual(self.counters(CustomerProfile, other), [0] * 5)
+
+    def other_service(self):
+        salons, services, staff = Generator(seed=2).salons([self.other_owner], 1)
+        return services[salons[0].id][0]
+
+    def test_loading_bookings_runs_no_receivers(self):
+        from booking_system.models import Booking
+
+        _create_booking(self.customer, self.service, self.day, time(10))
+        _create_booking(self.customer, self.service, self.day, time(11))
+        with self.assertNumQueries(1):
+            list(Booking.objects.all())
+
+    def test_migration_backfills_counters(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        booking = _create_booking(self.customer, self.service, self.day, time(10))
+        _create_booking(self.customer, self.service, self.day, time(11), status='completed')
+        booking.delete()
+        CustomerProfile.objects.update(**{field: 0 for field in self.COUNTERS})
+        SalonOwnerProfile.objects.update(total_salons=0, **{field: 0 for field in self.COUNTERS})
+
+        migration = import_module('user_accounts.migrations.0008_backfill_profile_counters')
+        migration.backfill_counters(apps, None)
+        self.assertEqual(self.counters(CustomerProfile, self.customer), [1, 0, 0, 1, 0])
+        self.assertEqual(self.counters(SalonOwnerProfile, self.owner), [1, 0, 0, 1, 0])
+        self.assertEqual(SalonOwnerProfile.objects.get(user=self.owner).total_salons, 1)
+        self.assertEqual(SalonOwnerProfile.objects.get(user=self.other_owner).total_salons, 0)
+
+
+class RequestProfilingTests(TestCase):
+
+    def setUp(self):
+        self.admin, self.customer = _users('admin', 'customer')
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        patcher = mock.patch('user_accounts.request_profiling.PROFILE_DIR', self.profile_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        from django.conf import settings
+
+        middleware = list(settings.MIDDLEWARE)
+        middleware.insert(
+            middleware.index('django.contrib.auth.middleware.AuthenticationMiddleware') + 1,
+            'user_accounts.request_profiling.RequestProfilingMiddleware',
+        )
+        profiling = override_settings(MIDDLEWARE=middleware)
+        profiling.enable()
+        self.addCleanup(profiling.disable)
+        self.url = reverse('user_admin:users')
+
+    def test_tokens_are_signed_for_one_admin_and_expire(self):
+        from types import SimpleNamespace
+        from .request_profiling import TOKEN_MAX_AGE, _token_allowed, make_token
+
+        token = make_token(self.admin)
+        self.assertTrue(_token_allowed(SimpleNamespace(user=self.admin), token))
+        self.assertFalse(_token_allowed(SimpleNamespace(user=self.admin), token[:-1] + 'x'))
+        self.assertFalse(_token_allowed(SimpleNamespace(user=self.admin), make_token(self.customer)))
+        self.assertFalse(_token_allowed(SimpleNamespace(user=self.customer), token))
+        later = time_module.time() + TOKEN_MAX_AGE + 1
+        with mock.patch('django.core.signing.time.time', return_value=later):
+            self.assertFalse(_token_allowed(SimpleNamespace(user=self.admin), token))
+
+    def test_admin_request_writes_stats_and_its_queries(self):
+        from .request_profiling import _logged_execute, make_token
+
+        self.client.force_login(self.admin)
+        response = self.client.get(self.url, HTTP_X_PROFILE=make_token(self.admin))
+        profile_id = response['X-Profile-Id']
+        self.assertTrue(os.path.exists(os.path.join(self.profile_dir, f'{profile_id}.prof')))
+        with open(os.path.join(self.profile_dir, f'{profile_id}.json')) as fh:
+            meta = json.load(fh)
+        self.assertEqual((meta['view'], meta['status']), ('user_admin:users', response.status_code))
+        self.assertEqual(meta['query_count'], len(meta['queries']))
+        self.assertTrue(any('user_accounts_user' in query['sql'] for query in meta['queries']))
+        # The query log is only installed while the profiled request runs
+        self.assertNotIn(_logged_execute, connection.execute_wrappers)
+
+        response = self.client.get(self.url, {'_profile': make_token(self.admin)})
+        self.assertIn('X-Profile-Id', response)
+
+    def test_other_users_are_not_profiled(self):
+        from .request_profiling import make_token
+
+        self.client.force_login(self.customer)
+        for token in (make_token(self.admin), make_token(self.customer)):
+            response = self.client.get(self.url, HTTP_X_PROFILE=token)
+            self.assertNotIn('X-Profile-Id', response)
+        self.client.force_login(self.admin)
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url, HTTP_X_PROFILE='forged'))
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+    def test_list_profiles_lists_summarizes_and_issues_tokens(self):
+        from io import StringIO
+        from django.core.management import CommandError, call_command
+        from types import SimpleNamespace
+        from .request_profiling import _token_allowed, make_token
+
+        self.client.force_login(self.admin)
+        profile_id = self.client.get(self.url, HTTP_X_PROFILE=make_token(self.admin))['X-Profile-Id']
+
+        out = StringIO()
+        call_command('list_profiles', stdout=out)
+        self.assertIn(profile_id, out.getvalue())
+        out = StringIO()
+        call_command('list_profiles', view='customer:dashboard', stdout=out)
+        self.assertIn('No profiles', out.getvalue())
+        out = StringIO()
+        call_command('list_profiles', profile_id, stdout=out)
+        self.assertIn('Functions by cumulative time', out.getvalue())
+        self.assertIn('Slowest queries', out.getvalue())
+
+        out = StringIO()
+        call_command('list_profiles', token=self.admin.email, stdout=out, stderr=StringIO())
+        self.assertTrue(_token_allowed(SimpleNamespace(user=self.admin), out.getvalue().strip()))
+        with self.assertRaisesMessage(CommandError, 'not an admin'):
+            call_command('list_profiles', token=self.customer.email, stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, 'No profile'):
+            call_command('list_profiles', 'missing', stdout=StringIO())
+
+    def test_async_requests_refuse_profiling(self):
+        import asyncio
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .request_profiling import RequestProfilingMiddleware, make_token
+
+        async def view(request):
+            return HttpResponse('page')
+
+        request = RequestFactory().get(self.url, HTTP_X_PROFILE=make_token(self.admin))
+        request.user = self.admin
+        response = asyncio.run(RequestProfilingMiddleware(view)(request))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(os.listdir(self.profile_dir), [])
+
+
+class PlatformAnalyticsTests(TestCase):
+
+    def setUp(self):
+        from booking_system.models import Booking, Payment, Review
+        from salon_management.models import Salon
+        from . import archival
+        from .synthetic_data import historic_timestamps
+
+        generator = Generator(seed=5, days=400)
+        with historic_timestamps(User, Salon, Booking, Payment, Review):
+            users = generator.users(60, owners=6, admins=1)
+            salons, services, staff = generator.salons(users['salon_owner'], 10)
+            generator.bookings(400, users['customer'], salons, services, staff)
+        # Part of the history is archived; the snapshot has to include it
+        archival.archive_booking_batch(date.today() - timedelta(days=90), batch_size=1000)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'platform.npz')
+
+    def snapshot(self):
+        from . import platform_analytics
+
+        platform_analytics.export_snapshot(self.path)
+        return platform_analytics.load_snapshot(self.path)
+
+    @staticmethod
+    def month_index(moment):
+        moment = timezone.localtime(moment) if isinstance(moment, datetime) else moment
+        return moment.year * 12 + moment.month - 1
+
+    def test_export_includes_archived_bookings_and_payments(self):
+        from booking_system.models import Booking, Payment
+        from . import platform_analytics
+        from .models import ArchivedBooking, ArchivedPayment
+
+        self.assertTrue(ArchivedBooking.objects.exists())
+        self.assertTrue(ArchivedPayment.objects.exists())
+        totals = platform_analytics.totals(self.snapshot())
+        self.assertEqual(totals['bookings'], Booking.objects.count() + ArchivedBooking.objects.count())
+        paid = platform_analytics.PAID_PAYMENT_STATUSES
+        revenue = sum(
+            model.objects.filter(status__in=paid).aggregate(total=Sum('amount'))['total'] or 0
+            for model in (Payment, ArchivedPayment)
+        )
+        self.assertAlmostEqual(totals['revenue'], float(revenue), places=2)
+
+    def test_cohort_retention_matches_the_database(self):
+        from booking_system.models import Booking
+        from . import platform_analytics
+        from .models import ArchivedBooking
+
+        rows = platform_analytics.cohort_retention(self.snapshot(), months=12)
+
+        first = self.month_index(timezone.now()) - 11
+        joined = {
+            user_id: self.month_index(moment)
+            for user_id, moment in User.objects.filter(role='customer').values_list('id', 'date_joined')
+        }
+        sizes, active = Counter(), set()
+        for month in joined.values():
+            sizes[month - first] += 1
+        for model in (Booking, ArchivedBooking):
+            for customer_id, created in model.objects.values_list('customer_id', 'created_at'):
+                if customer_id in joined:
+                    active.add((customer_id, self.month_index(created) - joined[customer_id]))
+        self.assertTrue(any(row['size'] for row in rows))
+        for index, row in enumerate(rows):
+            self.assertEqual(row['size'], sizes[index])
+            for offset, rate in enumerate(row['rates']):
+                if offset >= 12 - index or not sizes[index]:
+                    self.assertIsNone(rate)
+                    continue
+                customers = {
+                    customer_id for customer_id, months in active
+                    if months == offset and joined[customer_id] - first == index
+                }
+                self.assertAlmostEqual(rate, len(customers) / sizes[index])
+
+    def test_bookings_per_city_match_the_database(self):
+        from booking_system.models import Booking, Payment
+        from salon_management.models import Salon
+        from . import platform_analytics
+        from .models import ArchivedBooking, ArchivedPayment
+
+        expected = {
+            row['city']: [0, row['count'], Decimal('0')]
+            for row in Salon.objects.values('city').annotate(count=Count('id'))
+        }
+        for model in (Booking, ArchivedBooking):
+            for row in model.objects.values('salon__city').annotate(count=Count('id')):
+                expected[row['salon__city']][0] += row['count']
+        for model in (Payment, ArchivedPayment):
+            paid = model.objects.filter(status__in=platform_analytics.PAID_PAYMENT_STATUSES)
+            for row in paid.values('booking__salon__city').annotate(total=Sum('amount')):
+                expected[row['booking__salon__city']][2] += row['total']
+
+        cities = platform_analytics.bookings_per_city(self.snapshot(), limit=len(expected))
+        self.assertEqual({city: (bookings, salons) for city, bookings, salons, revenue in cities},
+                         {city: (bookings, salons) for city, (bookings, salons, revenue) in expected.items()})
+        for city, bookings, salons, revenue in cities:
+            self.assertAlmostEqual(revenue, float(expected[city][2]), places=2)
+        self.assertEqual([row[1] for row in cities], sorted((row[1] for row in cities), reverse=True))
+
+    def test_owner_growth_matches_the_database(self):
+        from salon_management.models import Salon
+        from . import platform_analytics
+
+        growth = platform_analytics.owner_growth(self.snapshot(), months=12)
+
+        owners = [self.month_index(moment) for moment in User.objects.filter(role='salon_owner').values_list('date_joined', flat=True)]
+        salons = Counter(self.month_index(moment) for moment in Salon.objects.values_list('created_at', flat=True))
+        first = self.month_index(timezone.now()) - 11
+        self.assertEqual(len(growth), 12)
+        for index, (month, new_owners, total_owners, new_salons) in enumerate(growth):
+            self.assertEqual(self.month_index(month), first + index)
+            self.assertEqual(new_owners, owners.count(first + index))
+            self.assertEqual(total_owners, sum(1 for joined in owners if joined <= first + index))
+            self.assertEqual(new_salons, salons[first + index])
+
+    def test_missing_snapshot_reports_nothing(self):
+        from . import platform_analytics
+
+        self.assertIsNone(platform_analytics.platform_report(path=self.path))
+        admin, = User.objects.filter(role='admin')
+        self.client.force_login(admin)
+        with mock.patch('user_accounts.platform_analytics.SNAPSHOT_DIR', os.path.dirname(self.path)):
+            response = self.client.get(reverse('user_admin:analytics'))
+            self.assertContains(response, 'No snapshot available')
+            self.snapshot()
+            response = self.client.get(reverse('user_admin:analytics'))
+        self.assertEqual(response.context['report']['totals']['users'], User.objects.count())
+
+
+class BookingExportTests(TestCase):
+
+    def setUp(self):
+        from . import archival
+
+        cache.clear()
+        self.customer, self.owner, other_owner = _users('customer', 'salon_owner', 'salon_owner')
+        self.customer.first_name, self.customer.last_name = '=HYPERLINK("x")', 'Doe'
+        self.customer.save()
+        salons, services, staff = Generator(seed=1).salons([self.owner], 2)
+        self.salons = salons
+        self.services = [services[salon.id][0] for salon in salons]
+        others, other_services, staff = Generator(seed=2).salons([other_owner], 1)
+        self.other_service = other_services[others[0].id][0]
+
+        self.old_day = date.today() - timedelta(days=400)
+        self.day = date.today() + timedelta(days=7)
+        self.archived = _create_booking(self.customer, self.services[0], self.old_day, time(9, 0), status='completed')
+        archival.archive_booking_batch(archival.archive_cutoff())
+        self.pending = _create_booking(self.customer, self.services[0], self.day, time(10, 0))
+        self.confirmed = _create_booking(self.customer, self.services[1], self.day, time(11, 0), status='confirmed')
+        self.later = _create_booking(
+            self.customer, self.services[1], self.day + timedelta(days=7), time(10, 0), status='confirmed',
+        )
+        _create_booking(self.customer, self.other_service, self.day, time(10, 0))
+        self.url = reverse('salon_owner:export_bookings')
+        self.client.force_login(self.owner)
+
+    def export(self, **params):
+        import csv
+        import io
+
+        response = self.client.get(self.url, params)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        return list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+
+    def test_owner_gets_their_own_bookings_with_the_archive_first(self):
+        from .exports import BOOKING_EXPORT_HEADER
+        from .models import ArchivedBooking
+
+        self.assertTrue(ArchivedBooking.objects.filter(id=self.archived.id).exists())
+        rows = self.export()
+        self.assertEqual(rows[0], BOOKING_EXPORT_HEADER)
+        self.assertEqual(rows.count(BOOKING_EXPORT_HEADER), 1)
+        self.assertEqual(
+            [int(row[0]) for row in rows[1:]],
+            [self.archived.id, self.pending.id, self.confirmed.id, self.later.id],
+        )
+        self.assertEqual(rows[1][5], self.services[0].name)
+
+    def test_filters_apply_to_live_and_archived_bookings(self):
+        ids = lambda **params: [int(row[0]) for row in self.export(**params)[1:]]
+
+        self.assertEqual(ids(start=self.day.isoformat()), [self.pending.id, self.confirmed.id, self.later.id])
+        self.assertEqual(ids(end=self.day.isoformat()), [self.archived.id, self.pending.id, self.confirmed.id])
+        self.assertEqual(ids(start=self.day.isoformat(), end=self.day.isoformat()), [self.pending.id, self.confirmed.id])
+        self.assertEqual(ids(status='completed'), [self.archived.id])
+        self.assertEqual(ids(status='confirmed'), [self.confirmed.id, self.later.id])
+        self.assertEqual(ids(salon=str(self.salons[1].id)), [self.confirmed.id, self.later.id])
+        # Malformed values are ignored rather than failing the download
+        self.assertEqual(len(ids(start='yesterday', salon='x')), 4)
+        # Another owner's salon filters down to nothing instead of leaking rows
+        self.assertEqual(ids(salon=str(self.other_service.salon_id)), [])
+
+    def test_formulas_are_escaped(self):
+        from .exports import _safe
+
+        self.assertEqual(self.export()[1][3], '\'=HYPERLINK("x") Doe')
+        for value in ('=1+1', '+1', '-1', '@SUM(A1)', '\tx', '\rx'):
+            self.assertEqual(_safe(value), "'" + value)
+        self.assertEqual(_safe('Jane'), 'Jane')
+        self.assertEqual(_safe(None), '')
+        self.assertEqual(_safe(12), '12')
+
+
+class BookingIndexMigrationTests(TransactionTestCase):
+    """Migration 0006 run by hand: the test database is built without user_accounts migrations"""
+
+    def setUp(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        self.migration = import_module('user_accounts.migrations.0006_booking_notification_indexes')
+        with connection.schema_editor() as schema_editor:
+            self.migration.create_indexes(apps, schema_editor)
+        self.addCleanup(self.drop_indexes)
+
+    def drop_indexes(self):
+        from django.apps import apps
+
+        with connection.schema_editor() as schema_editor:
+            self.migration.drop_indexes(apps, schema_editor)
+
+    def test_indexes_are_created(self):
+        from django.apps import apps
+
+        for app_label, model_name, index in self.migration.INDEXES:
+            table = apps.get_model(app_label, model_name)._meta.db_table
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(cursor, table)
+            self.assertIn(index.name, constraints)
+            self.assertTrue(constraints[index.name]['index'])
+
+    def test_customer_upcoming_bookings_use_the_composite_index(self):
+        from booking_system.models import Booking
+
+        customer, owner = _users('customer', 'salon_owner')
+        salons, services, staff = Generator(seed=1).salons([owner], 1)
+        service = services[salons[0].id][0]
+        for offset in range(20):
+            _create_booking(customer, service, date.today() + timedelta(days=offset), time(10, 0))
+
+        plan = Booking.objects.filter(
+            customer=customer, appointment_date__gte=date.today(), status__in=['pending', 'confirmed'],
+        ).order_by('appointment_date', 'appointment_time')[:5].explain()
+        self.assertIn('booking_customer_date_idx', plan)
+
+
+class OpeningHoursTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        owner, = _users('salon_owner')
+        self.salons, _, _ = Generator(seed=1).salons([owner], 3)
+        for salon in self.salons:
+            salon.status = 'approved'
+            salon.save()
+        monday = date.today() + timedelta(days=7 - date.today().weekday())
+        self.monday_morning = timezone.make_aware(datetime.combine(monday, time(10, 0)))
+
+    def test_week_mask_wraps_overnight_hours_into_the_next_day(self):
+        week = opening_hours.compile_week([(6, time(22, 0), time(2, 0), False)])
+        sunday = week >> (6 * scheduling.TICKS_PER_DAY) & scheduling.FULL_DAY
+        monday = week & scheduling.FULL_DAY
+        self.assertEqual(sunday, scheduling.interval_mask(22 * 60, 2 * 60))
+        self.assertEqual(monday, scheduling.interval_mask(0, 2 * 60))
+
+    def test_open_salons_follow_hours_changes(self):
+        from salon_management.models import SalonHours
+
+        salon_ids = sorted(salon.id for salon in self.salons)
+        self.assertEqual(sorted(opening_hours.open_salon_ids(self.monday_morning)), salon_ids)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for hours in SalonHours.objects.filter(salon=self.salons[0], day=0):
+                hours.is_closed = True
+                hours.save()
+        self.assertEqual(sorted(opening_hours.open_salon_ids(self.monday_morning)), salon_ids[1:])
+        self.assertFalse(opening_hours.is_open(self.salons[0].id, self.monday_morning))
+
+    def test_compiling_one_salon_keeps_the_others(self):
+        opening_hours.open_salon_ids(self.monday_morning)
+        opening_hours.compile_salon(self.salons[0].id)
+        opening_hours.forget_salon(self.salons[1].id)
+        self.assertEqual(len(opening_hours.open_salon_ids(self.monday_morning)), 3)
+
+    def test_open_during(self):
+        salon_ids = [salon.id for salon in self.salons]
+        morning = scheduling.interval_mask(7 * 60, 60)
+        self.assertEqual(opening_hours.open_during(salon_ids, self.monday_morning.date(), morning), [])
+        evening = scheduling.interval_mask(20 * 60, 60)
+        self.assertEqual(opening_hours.open_during(salon_ids, self.monday_morning.date(), evening), salon_ids)
@@ -0,0 +1,336 @@
+"""
+Two-tier cache with stampede protection.
+
+``TieredCache.get_or_set`` looks in a small in-process LRU (L1, bounded size,
+a few seconds TTL) and then in the shared Django cache (L2, Redis in
+production). On a miss only one caller computes the value:
+
+* threads of the same process wait for the thread already computing it;
+* other processes see the L2 lock and wait briefly for the value to appear.
+
+Values also carry how long they took to compute, and each L2 read may decide
+to recompute before the value expires ("probabilistic early expiration", aka
+XFetch): the closer to expiry and the more expensive the value, the likelier
+a caller refreshes it while everyone else keeps being served the old value,
+so popular keys never expire under load.
+
+Use the ``cached`` decorator for functions and the ``{% tieredcache %}`` tag
+(``{% load tiered_cache %}``) for template fragments. Hit, miss and latency
+counters are kept per namespace; see ``manage.py cache_stats``.
+"""
+import hashlib
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+
+
+L2_ALIAS = getattr(settings, 'TIERED_CACHE_ALIAS', 'default')
+L1_MAX_ENTRIES = getattr(settings, 'TIERED_CACHE_L1_MAX_ENTRIES', 1024)
+L1_TTL = getattr(settings, 'TIERED_CACHE_L1_TTL', 5)
+# Larger values refresh earlier; 1.0 is the usual choice
+EARLY_REFRESH_BETA = getattr(settings, 'TIERED_CACHE_BETA', 1.0)
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 5.0
+WAIT_INTERVAL = 0.05
+STATS_FLUSH_INTERVAL = 10.0
+
+STAT_NAMES = ('l1_hits', 'l2_hits', 'misses', 'early_refreshes', 'coalesced', 'computes', 'lookup_us', 'compute_us')
+
+_MISSING = object()
+
+# Deletes the lock only while it still holds our token, in one step on the server
+RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries=L1_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Flight:
+    """One in-progress computation that other threads of this process wait for"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = _MISSING
+
+
+class TieredCache:
+
+    def __init__(self, namespace, l1_max_entries=L1_MAX_ENTRIES, l1_ttl=L1_TTL, beta=EARLY_REFRESH_BETA):
+        self.namespace = namespace
+        self.l1 = LRUCache(l1_max_entries)
+        self.l1_ttl = l1_ttl
+        self.beta = beta
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self._stats = Counter()
+        self._stats_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    @property
+    def l2(self):
+        return caches[L2_ALIAS]
+
+    def _key(self, key):
+        return f'{self.namespace}:{key}'
+
+    def get_or_set(self, key, compute, ttl, l1_ttl=None):
+        """Cached value of ``key``, calling ``compute()`` at most once across workers when missing"""
+        started = time.perf_counter()
+        full_key = self._key(key)
+        try:
+            value = self.l1.get(full_key)
+            if value is not _MISSING:
+                self._record('l1_hits')
+                return value
+
+            entry = self.l2.get(full_key)
+            if entry is not None:
+                token = self._should_refresh_early(entry) and self._acquire(full_key)
+                if token:
+                    # We refresh; everyone else keeps getting the current value meanwhile
+                    self._record('early_refreshes')
+                    try:
+                        return self._compute(full_key, compute, ttl, l1_ttl)
+                    finally:
+                        self._release(full_key, token)
+                self._record('l2_hits')
+                self._fill_l1(full_key, entry, l1_ttl)
+                return entry['value']
+
+            self._record('misses')
+            return self._compute_once(full_key, compute, ttl, l1_ttl)
+        finally:
+            self._record('lookup_us', int((time.perf_counter() - started) * 1_000_000))
+            self._maybe_flush_stats()
+
+    def delete(self, key):
+        """Drop ``key`` from L2 and this process's L1 (other processes' L1 expire within ``l1_ttl``)"""
+        full_key = self._key(key)
+        self.l1.delete(full_key)
+        self.l2.delete(full_key)
+
+    def _should_refresh_early(self, entry):
+        return time.time() - entry['delta'] * self.beta * math.log(1.0 - random.random()) >= entry['expires']
+
+    def _fill_l1(self, full_key, entry, l1_ttl):
+        remaining = entry['expires'] - time.time()
+        ttl = min(self.l1_ttl if l1_ttl is None else l1_ttl, remaining)
+        if ttl > 0:
+            self.l1.set(full_key, entry['value'], ttl)
+
+    def _compute(self, full_key, compute, ttl, l1_ttl):
+        started = time.perf_counter()
+        value = compute()
+        delta = time.perf_counter() - started
+        self._record('computes')
+        self._record('compute_us', int(delta * 1_000_000))
+
+        entry = {'value': value, 'delta': delta, 'expires': time.time() + ttl}
+        self.l2.set(full_key, entry, ttl)
+        self._fill_l1(full_key, entry, l1_ttl)
+        return value
+
+    def _compute_once(self, full_key, compute, ttl, l1_ttl):
+        with self._flights_lock:
+            flight = self._flights.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[full_key] = _Flight()
+
+        if not leader:
+            flight.event.wait(WAIT_TIMEOUT)
+            if flight.value is not _MISSING:
+                self._record('coalesced')
+                return flight.value
+            # The leader failed or is too slow; compute it ourselves
+            return self._compute(full_key, compute, ttl, l1_ttl)
+
+        try:
+            token = self._acquire(full_key)
+            if token:
+                try:
+                    flight.value = self._compute(full_key, compute, ttl, l1_ttl)
+                finally:
+                    self._release(full_key, token)
+            else:
+                # Another process is computing it; wait for it to land in L2
+                entry = self._wait_for_l2(full_key)
+                if entry is not None:
+                    self._record('coalesced')
+                    self._fill_l1(full_key, entry, l1_ttl)
+                    flight.value = entry['value']
+                else:
+                    flight.value = self._compute(full_key, compute, ttl, l1_ttl)
+            return flight.value
+        finally:
+            flight.event.set()
+            with self._flights_lock:
+                self._flights.pop(full_key, None)
+
+    def _wait_for_l2(self, full_key):
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_INTERVAL)
+            entry = self.l2.get(full_key)
+            if entry is not None:
+                return entry
+        return None
+
+    def _acquire(self, full_key):
+        """Take the L2 lock of ``full_key``; returns its token, or ``None`` if someone else holds it"""
+        token = uuid.uuid4().hex
+        return token if self.l2.add(f'{full_key}:lock', token, LOCK_TIMEOUT) else None
+
+    def _release(self, full_key, token):
+        """
+        Drop the lock only if it is still ours: a computation that outlived
+        ``LOCK_TIMEOUT`` must not delete the lock a later caller has taken since.
+
+        On Redis the check and the delete are one Lua script; other backends
+        (the local-memory cache of tests and development) compare and delete
+        in two steps.
+        """
+        lock_key = f'{full_key}:lock'
+        l2 = self.l2
+        if isinstance(l2, RedisCache):
+            key = l2.make_and_validate_key(lock_key)
+            client = l2._cache.get_client(key, write=True)
+            client.register_script(RELEASE_LOCK)(keys=[key], args=[l2._cache._serializer.dumps(token)])
+        elif l2.get(lock_key) == token:
+            l2.delete(lock_key)
+
+    # Stats
+
+    def _stat_key(self, name):
+        return f'{self.namespace}:stats:{name}'
+
+    def _record(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def _maybe_flush_stats(self):
+        if time.monotonic() - self._last_flush >= STATS_FLUSH_INTERVAL:
+            self.flush_stats()
+
+    def flush_stats(self):
+        """Add this process's counters to the shared totals in L2"""
+        with self._stats_lock:
+            pending, self._stats = self._stats, Counter()
+            self._last_flush = time.monotonic()
+        for name, amount in pending.items():
+            key = self._stat_key(name)
+            try:
+                self.l2.incr(key, amount)
+            except ValueError:
+                if not self.l2.add(key, amount, None):
+                    self.l2.incr(key, amount)
+
+    def stats(self):
+        """Counters across all processes (as of their last flush) plus derived rates"""
+        self.flush_stats()
+        values = self.l2.get_many([self._stat_key(name) for name in STAT_NAMES])
+        stats = {name: values.get(self._stat_key(name), 0) for name in STAT_NAMES}
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses'] + stats['early_refreshes']
+        stats['lookups'] = lookups
+        stats['hit_rate'] = (stats['l1_hits'] + stats['l2_hits']) / lookups if lookups else 0.0
+        stats['l1_hit_rate'] = stats['l1_hits'] / lookups if lookups else 0.0
+        stats['mean_lookup_ms'] = stats['lookup_us'] / lookups / 1000 if lookups else 0.0
+        stats['mean_compute_ms'] = stats['compute_us'] / stats['computes'] / 1000 if stats['computes'] else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats = Counter()
+        self.l2.delete_many([self._stat_key(name) for name in STAT_NAMES])
+
+
+_namespaces = {}
+_namespaces_lock = threading.Lock()
+
+
+def get_cache(namespace='tiered'):
+    """The process-wide ``TieredCache`` of ``namespace``"""
+    with _namespaces_lock:
+        if namespace not in _namespaces:
+            _namespaces[namespace] = TieredCache(namespace)
+        return _namespaces[namespace]
+
+
+def all_caches():
+    return dict(_namespaces)
+
+
+def _arguments_key(args, kwargs):
+    # Arguments should be plain values (ids, dates, strings) with a stable repr
+    return hashlib.md5(repr((args, sorted(kwargs.items()))).encode(), usedforsecurity=False).hexdigest()
+
+
+def cached(ttl, namespace='tiered', l1_ttl=None):
+    """
+    Cache a function's result per arguments in the two-tier cache.
+
+    The wrapped function gets an ``invalidate(*args, **kwargs)`` attribute.
+    """
+    def decorator(func):
+        prefix = f'{func.__module__}.{func.__qualname__}'
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = f'{prefix}:{_arguments_key(args, kwargs)}'
+            return get_cache(namespace).get_or_set(key, lambda: func(*args, **kwargs), ttl, l1_ttl)
+
+        def invalidate(*args, **kwargs):
+            get_cache(namespace).delete(f'{prefix}:{_arguments_key(args, kwargs)}')
+
+        wrapper.invalidate = invalidate
+        return wrapper
+    return decorator
@@ -11,6 +11,10 @@ urlpatterns = [
     path('register/', views.register_choice_view, name='register'),
     path('register/customer/', views.customer_register_view, name='customer_register'),
     path('register/salon-owner/', views.salon_owner_register_view, name='salon_owner_register'),
+    path('verify/<str:token>/', views.verify_email_view, name='verify_email'),
     path('profile/', views.profile_view, name='profile'),
     path('profile/edit/', views.edit_profile_view, name='edit_profile'),
+    # Search helpers
+    path('autocomplete/', views.autocomplete_view, name='autocomplete'),
+    path('availability/', views.availability_search_view, name='availability_search'),
 ]
@@ -3,16 +3,27 @@ from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from .decorators import admin_required, customer_required, salon_owner_required
 from django.contrib import messages
-from django.db.models import Q, Count, Avg
+from django.core.paginator import Paginator
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
+from django.db import transaction
 from django.utils import timezone
 from datetime import datetime, timedelta
-from .models import User, CustomerProfile, SalonOwnerProfile
-from .forms import CustomerRegistrationForm, SalonOwnerRegistrationForm, UserLoginForm, UserProfileForm, CustomerProfileForm, SalonOwnerProfileForm, AdminUserCreationForm
-from salon_management.models import Salon, Service, Staff, SalonHours
-from booking_system.models import Booking, Review, Notification, Payment
+# Kept at module level: every app's models are imported by the app registry
+# before the URLconf loads this module, so deferring them saves no boot time
+from .models import User, ArchivedBooking, CustomerProfile, SalonOwnerProfile
+from salon_management.models import Salon
+from booking_system.models import Booking, Review, Notification
+from .search_index import autocomplete_index
+from . import archival, availability, request_metrics, rollups
+from .bookings import bulk_update_booking_status
+from .async_queries import evaluated, gather_queries
+from .tiered_cache import cached
 
 def login_view(request):
     """User login view"""
+    
+    from .forms import UserLoginForm
+    
     if request.user.is_authenticated:
         # Redirect to appropriate dashboard based on user type
         if request.user.is_customer:
@@ -58,6 +69,9 @@ def login_view(request):
 
 def admin_login_view(request):
     """Admin login view - separate from regular user login"""
+    
+    from .forms import UserLoginForm
+    
     if request.user.is_authenticated:
         if request.user.is_admin:
             return redirect('user_admin:dashboard')
@@ -116,6 +130,10 @@ def logout_view(request):
 
 def customer_register_view(request):
     """Customer registration view"""
+    
+    from .forms import CustomerRegistrationForm
+    from .tasks import queue_registration_emails
+    
     if request.user.is_authenticated:
         # Redirect to appropriate dashboard based on user type
         if request.user.is_customer:
@@ -130,7 +148,11 @@ def customer_register_view(request):
     if request.method == 'POST':
         form = CustomerRegistrationForm(request.POST)
         if form.is_valid():
-            user = form.save()
+            with transaction.atomic():
+                user = form.save()
+                # Emails go out from a worker once the account is committed
+                user_id = user.pk
+                transaction.on_commit(lambda: queue_registration_emails(user_id))
             login(request, user)
             messages.success(request, 'Customer account created successfully! Welcome to BookMyStyle!')
             return redirect('customer:dashboard')
@@ -146,6 +168,10 @@ def customer_register_view(request):
 
 def salon_owner_register_view(request):
     """Salon owner registration view"""
+    
+    from .forms import SalonOwnerRegistrationForm
+    from .tasks import queue_registration_emails
+    
     if request.user.is_authenticated:
         # Redirect to appropriate dashboard based on user type
         if request.user.is_customer:
@@ -160,7 +186,11 @@ def salon_owner_register_view(request):
     if request.method == 'POST':
         form = SalonOwnerRegistrationForm(request.POST)
         if form.is_valid():
-            user = form.save()
+            with transaction.atomic():
+                user = form.save()
+                # Emails go out from a worker once the account is committed
+                user_id = user.pk
+                transaction.on_commit(lambda: queue_registration_emails(user_id))
             login(request, user)
             messages.success(request, 'Salon owner account created successfully! Welcome to BookMyStyle!')
             return redirect('salon_owner:dashboard')
@@ -174,6 +204,25 @@ def salon_owner_register_view(request):
     response['Expires'] = '0'
     return response
 
+def verify_email_view(request, token):
+    """Confirm a user's email address from the link in their verification email"""
+    
+    from .account_emails import verified_user
+    
+    user = verified_user(token)
+    if user is None:
+        messages.error(request, 'This verification link is invalid or has expired.')
+    elif not user.is_verified:
+        user.is_verified = True
+        user.save(update_fields=['is_verified'])
+        messages.success(request, 'Your email address has been confirmed. Thank you!')
+    else:
+        messages.info(request, 'Your email address is already confirmed.')
+    
+    if request.user.is_authenticated:
+        return redirect('accounts:profile')
+    return redirect('accounts:login')
+
 def register_choice_view(request):
     """Registration choice view"""
     if request.user.is_authenticated:
@@ -194,6 +243,50 @@ def register_choice_view(request):
     response['Expires'] = '0'
     return response
 
+def autocomplete_view(request):
+    """Typeahead suggestions for salon names, cities and services"""
+    query = request.GET.get('q', '')
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 20))
+    except ValueError:
+        limit = 10
+    
+    # Served from the in-process prefix index; no database access
+    return JsonResponse({
+        'query': query,
+        'results': autocomplete_index.search(query, limit),
+    })
+
+def availability_search_view(request):
+    """Salons with free capacity for a service category in a date/time window"""
+    category = request.GET.get('service', '')
+    if category == 'Any service':
+        category = ''
+    
+    try:
+        day, window_start, window_end = availability.parse_window(
+            request.GET.get('date', ''),
+            request.GET.get('time', ''),
+            request.GET.get('end_time') or None,
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Provide date=YYYY-MM-DD, time=HH:MM and optionally end_time=HH:MM.'}, status=400)
+    
+    results = availability.find_available_salons(category, day, window_start, window_end)
+    
+    return JsonResponse({
+        'date': day.isoformat(),
+        'results': [
+            {
+                'salon_id': salon.id,
+                'name': salon.name,
+                'city': salon.city,
+                'start_times': start_times,
+            }
+            for salon, start_times in results
+        ],
+    })
+
 @login_required
 def profile_view(request):
     """User profile view"""
@@ -212,6 +305,9 @@ def profile_view(request):
 @login_required
 def edit_profile_view(request):
     """Edit user profile view"""
+    
+    from .forms import UserProfileForm
+    
     user = request.user
     
     if request.method == 'POST':
@@ -232,25 +328,32 @@ def edit_profile_view(request):
 
 # Customer Views
 @customer_required
-def customer_dashboard(request):
+async def customer_dashboard(request):
     """Customer dashboard view"""
     
     user = request.user
-    upcoming_bookings = Booking.objects.filter(
-        customer=user,
+    bookings = Booking.objects.filter(customer=user)
+    profile = CustomerProfile.objects.filter(user=user)
+    upcoming_bookings = bookings.filter(
         appointment_date__gte=timezone.now().date(),
         status__in=['pending', 'confirmed']
-    ).order_by('appointment_date', 'appointment_time')[:5]
+    ).select_related('salon', 'service').order_by('appointment_date', 'appointment_time')[:5]
+    
+    recent_bookings = bookings.select_related('salon', 'service').order_by('-created_at')[:5]
     
-    recent_bookings = Booking.objects.filter(
-        customer=user
-    ).order_by('-created_at')[:5]
+    # Independent queries run concurrently
+    upcoming_bookings, recent_bookings, profile = await gather_queries(
+        evaluated(upcoming_bookings),
+        evaluated(recent_bookings),
+        profile.first,
+    )
     
+    # Maintained counters instead of counting the bookings table
     context = {
         'upcoming_bookings': upcoming_bookings,
         'recent_bookings': recent_bookings,
-        'total_bookings': Booking.objects.filter(customer=user).count(),
-        'pending_bookings': Booking.objects.filter(customer=user, status='pending').count(),
+        'total_bookings': profile.total_bookings if profile else 0,
+        'pending_bookings': profile.pending_bookings if profile else 0,
     }
     
     return render(request, 'user_accounts/customer/dashboard.html', context)
@@ -259,10 +362,13 @@ def customer_dashboard(request):
 def customer_bookings(request):
     """Customer bookings list view"""
     
-    bookings = Booking.objects.filter(customer=request.user).order_by('-appointment_date', '-appointment_time')
+    # Live and archived bookings, newest first, one page at a time
+    paginator = Paginator(archival.customer_booking_history(request.user), 20)
+    page_obj = paginator.get_page(request.GET.get('page'))
     
     context = {
-        'bookings': bookings,
+        'bookings': page_obj.object_list,
+        'page_obj': page_obj,
     }
     
     return render(request, 'user_accounts/customer/bookings.html', context)
@@ -270,7 +376,12 @@ def customer_bookings(request):
 @customer_required
 def booking_detail(request, booking_id):
     """Booking detail view"""
-    booking = get_object_or_404(Booking, id=booking_id, customer=request.user)
+    booking = Booking.objects.filter(id=booking_id, customer=request.user).first()
+    if booking is None:
+        booking = get_object_or_404(
+            ArchivedBooking.objects.select_related('service'), id=booking_id, customer=request.user,
+        )
+        archival.with_service_names([booking])
     
     context = {
         'booking': booking,
@@ -296,11 +407,59 @@ def cancel_booking(request, booking_id):
     
     return render(request, 'user_accounts/customer/cancel_booking.html', context)
 
+@customer_required
+def book_salon(request, salon_id):
+    """Book a service at a salon; picking a service and date lists the free start times"""
+    
+    from django.core.exceptions import ValidationError
+    from . import holds
+    from .bookings import create_booking
+    from .forms import BookingSlotForm
+    
+    salon = get_object_or_404(Salon, id=salon_id, status='approved')
+    owner = holds.hold_owner(request)
+    
+    # Picking a time places a short hold on it (sent by the page before the final submit)
+    if request.method == 'POST' and request.POST.get('hold'):
+        form = BookingSlotForm(salon, request.POST, hold_owner=owner)
+        held = form.is_valid() and form.place_hold()
+        return JsonResponse({'held': bool(held), 'expires_in': holds.HOLD_TTL})
+    
+    if request.method == 'POST':
+        form = BookingSlotForm(salon, request.POST, hold_owner=owner)
+        if form.is_valid():
+            try:
+                # The stylist picked by the form, who is the one the hold is on
+                booking = create_booking(
+                    request.user, salon, form.cleaned_data['service'],
+                    form.cleaned_data['appointment_date'], form.cleaned_data['appointment_time'],
+                    staff_id=form.cleaned_data['staff_id'], hold_owner=owner,
+                )
+            except ValidationError as exc:
+                form.add_error('appointment_time', exc)
+            else:
+                messages.success(request, 'Booking requested! The salon will confirm it shortly.')
+                return redirect('customer:booking_detail', booking_id=booking.id)
+    else:
+        # The service and date picked so far come back as query parameters
+        form = BookingSlotForm(salon, request.GET or None, hold_owner=owner)
+        if form.is_bound:
+            form.is_valid()
+    
+    context = {
+        'salon': salon,
+        'form': form,
+        'available_times': form.available_times() if form.is_bound else [],
+        'hold_ttl': holds.HOLD_TTL,
+    }
+    
+    return render(request, 'user_accounts/customer/book_salon.html', context)
+
 @customer_required
 def customer_reviews(request):
     """Customer reviews view"""
     
-    reviews = Review.objects.filter(customer=request.user).order_by('-created_at')
+    reviews = Review.objects.filter(customer=request.user).select_related('salon').order_by('-created_at')
     
     context = {
         'reviews': reviews,
@@ -314,8 +473,8 @@ def customer_notifications(request):
     
     notifications = Notification.objects.filter(user=request.user).order_by('-created_at')
     
-    # Mark notifications as read
-    notifications.update(is_read=True)
+    # Mark notifications as read; only unread rows are rewritten
+    notifications.filter(is_read=False).update(is_read=True)
     
     context = {
         'notifications': notifications,
@@ -325,28 +484,28 @@ def customer_notifications(request):
 
 # Salon Owner Views
 @salon_owner_required
-def salon_owner_dashboard(request):
+async def salon_owner_dashboard(request):
     """Salon owner dashboard view"""
     
     user = request.user
     salons = Salon.objects.filter(owner=user)
+    bookings = Booking.objects.filter(salon__owner=user)
+    profile = SalonOwnerProfile.objects.filter(user=user)
     
-    # Get statistics
-    total_bookings = Booking.objects.filter(salon__owner=user).count()
-    pending_bookings = Booking.objects.filter(salon__owner=user, status='pending').count()
-    today_bookings = Booking.objects.filter(
-        salon__owner=user,
-        appointment_date=timezone.now().date()
-    ).count()
+    recent_bookings = bookings.select_related('customer', 'salon', 'service').order_by('-created_at')[:5]
     
-    recent_bookings = Booking.objects.filter(
-        salon__owner=user
-    ).order_by('-created_at')[:5]
+    # Get statistics; independent queries run concurrently, totals come from maintained counters
+    salons, profile, today_bookings, recent_bookings = await gather_queries(
+        evaluated(salons),
+        profile.first,
+        bookings.filter(appointment_date=timezone.now().date()).count,
+        evaluated(recent_bookings),
+    )
     
     context = {
         'salons': salons,
-        'total_bookings': total_bookings,
-        'pending_bookings': pending_bookings,
+        'total_bookings': profile.total_bookings if profile else 0,
+        'pending_bookings': profile.pending_bookings if profile else 0,
         'today_bookings': today_bookings,
         'recent_bookings': recent_bookings,
     }
@@ -370,13 +529,16 @@ def create_salon(request):
     """Create salon view"""
     
     from salon_management.forms import SalonForm
+    from .tasks import queue_new_salon_alert
     
     if request.method == 'POST':
         form = SalonForm(request.POST, request.FILES)
         if form.is_valid():
-            salon = form.save(commit=False)
-            salon.owner = request.user
-            salon.save()
+            with transaction.atomic():
+                salon = form.save(commit=False)
+                salon.owner = request.user
+                salon.save()
+                transaction.on_commit(queue_new_salon_alert)
             messages.success(request, 'Salon created successfully! It will be reviewed by our admin team.')
             return redirect('salon_owner:salons')
     else:
@@ -402,7 +564,9 @@ def edit_salon(request, salon_id):
 def salon_owner_bookings(request):
     """Salon owner bookings view"""
     
-    bookings = Booking.objects.filter(salon__owner=request.user).order_by('-appointment_date', '-appointment_time')
+    bookings = Booking.objects.filter(salon__owner=request.user).select_related(
+        'customer', 'salon', 'service',
+    ).order_by('-appointment_date', '-appointment_time')
     
     context = {
         'bookings': bookings,
@@ -410,6 +574,17 @@ def salon_owner_bookings(request):
     
     return render(request, 'user_accounts/salon_owner/bookings.html', context)
 
+@salon_owner_required
+def export_salon_owner_bookings(request):
+    """Download the owner's bookings as CSV, filtered by date, status and salon"""
+    
+    from . import exports
+    
+    bookings = exports.filter_bookings(Booking.objects.filter(salon__owner=request.user), request.GET)
+    archived = exports.filter_bookings(ArchivedBooking.objects.filter(salon__owner=request.user), request.GET)
+    filename = f'bookings-{timezone.now():%Y%m%d}.csv'
+    return exports.booking_csv_response(bookings, filename, archived)
+
 @salon_owner_required
 def approve_booking(request, booking_id):
     """Approve booking view"""
@@ -428,6 +603,40 @@ def approve_booking(request, booking_id):
     
     return render(request, 'user_accounts/salon_owner/approve_booking.html', context)
 
+@salon_owner_required
+def bulk_moderate_bookings(request):
+    """Approve or cancel many pending bookings at once"""
+    
+    if request.method != 'POST':
+        return redirect('salon_owner:bookings')
+    
+    action = request.POST.get('action')
+    statuses = {'approve': 'confirmed', 'cancel': 'cancelled'}
+    if action not in statuses:
+        messages.error(request, 'Please choose whether to approve or cancel the bookings.')
+        return redirect('salon_owner:bookings')
+    
+    bookings = Booking.objects.filter(salon__owner=request.user, status='pending')
+    booking_ids = request.POST.getlist('booking_ids')
+    appointment_date = request.POST.get('appointment_date')
+    if booking_ids:
+        bookings = bookings.filter(id__in=[booking_id for booking_id in booking_ids if booking_id.isdigit()])
+    elif appointment_date:
+        try:
+            bookings = bookings.filter(appointment_date=datetime.strptime(appointment_date, '%Y-%m-%d').date())
+        except ValueError:
+            messages.error(request, 'Please enter a valid date.')
+            return redirect('salon_owner:bookings')
+    else:
+        messages.error(request, 'Please select bookings or a date.')
+        return redirect('salon_owner:bookings')
+    
+    updated = bulk_update_booking_status(bookings, statuses[action])
+    
+    verb = 'approved' if action == 'approve' else 'cancelled'
+    messages.success(request, f'{updated} booking{"s" if updated != 1 else ""} {verb} successfully.')
+    return redirect('salon_owner:bookings')
+
 @salon_owner_required
 def manage_staff(request):
     """Manage staff view"""
@@ -440,29 +649,58 @@ def manage_staff(request):
 def salon_analytics(request):
     """Salon analytics view"""
     
-    # This would show analytics - for now, just show message
-    messages.info(request, 'Analytics dashboard will be implemented soon.')
-    return redirect('salon_owner:dashboard')
+    salons = Salon.objects.filter(owner=request.user).order_by('name')
+    salon_id = request.GET.get('salon')
+    selected_salon = None
+    if salon_id and salon_id.isdigit():
+        selected_salon = get_object_or_404(Salon, id=salon_id, owner=request.user)
+    
+    try:
+        days = max(1, min(int(request.GET.get('days', 30)), 365))
+    except ValueError:
+        days = 30
+    end_date = timezone.now().date()
+    start_date = end_date - timedelta(days=days - 1)
+    
+    # Read pre-aggregated daily rows instead of grouping the bookings table
+    salon_ids = [selected_salon.id] if selected_salon else list(salons.values_list('id', flat=True))
+    summary = rollups.salon_summary(salon_ids, start_date, end_date)
+    
+    context = {
+        'salons': salons,
+        'selected_salon': selected_salon,
+        'days': days,
+        'start_date': start_date,
+        'end_date': end_date,
+        'summary': summary,
+    }
+    
+    return render(request, 'user_accounts/salon_owner/analytics.html', context)
 
 # Admin Views
+@cached(ttl=60)
+def platform_counts():
+    """Site-wide totals for the admin dashboard, shared by all admins for a minute"""
+    return {
+        'total_users': User.objects.count(),
+        'total_salons': Salon.objects.count(),
+        'pending_salons': Salon.objects.filter(status='pending').count(),
+        'total_bookings': Booking.objects.count(),
+    }
+
 @admin_required
-def admin_dashboard(request):
+async def admin_dashboard(request):
     """Admin dashboard view"""
     
-    # Get statistics
-    total_users = User.objects.count()
-    total_salons = Salon.objects.count()
-    pending_salons = Salon.objects.filter(status='pending').count()
-    total_bookings = Booking.objects.count()
-    
-    recent_salons = Salon.objects.filter(status='pending').order_by('-created_at')[:5]
-    recent_users = User.objects.order_by('-date_joined')[:5]
+    # Get statistics; independent queries run concurrently
+    counts, recent_salons, recent_users = await gather_queries(
+        platform_counts,
+        evaluated(Salon.objects.filter(status='pending').order_by('-created_at')[:5]),
+        evaluated(User.objects.order_by('-date_joined')[:5]),
+    )
     
     context = {
-        'total_users': total_users,
-        'total_salons': total_salons,
-        'pending_salons': pending_salons,
-        'total_bookings': total_bookings,
+        **counts,
         'recent_salons': recent_salons,
         'recent_users': recent_users,
     }
@@ -485,6 +723,8 @@ def manage_users(request):
 def create_user(request):
     """Create user view for admins"""
     
+    from .forms import AdminUserCreationForm
+    
     if request.method == 'POST':
         form = AdminUserCreationForm(request.POST)
         if form.is_valid():
@@ -517,7 +757,7 @@ def toggle_user_status(request, user_id):
 def manage_salons(request):
     """Manage salons view"""
     
-    salons = Salon.objects.all().order_by('-created_at')
+    salons = Salon.objects.select_related('owner').order_by('-created_at')
     
     context = {
         'salons': salons,
@@ -532,6 +772,7 @@ def approve_salon(request, salon_id):
     salon = get_object_or_404(Salon, id=salon_id)
     salon.status = 'approved'
     salon.save()
+    platform_counts.invalidate()
     
     messages.success(request, f'Salon {salon.name} has been approved.')
     return redirect('user_admin:salons')
@@ -543,6 +784,7 @@ def reject_salon(request, salon_id):
     salon = get_object_or_404(Salon, id=salon_id)
     salon.status = 'rejected'
     salon.save()
+    platform_counts.invalidate()
     
     messages.success(request, f'Salon {salon.name} has been rejected.')
     return redirect('user_admin:salons')
@@ -551,7 +793,7 @@ def reject_salon(request, salon_id):
 def admin_bookings(request):
     """Admin bookings view"""
     
-    bookings = Booking.objects.all().order_by('-created_at')
+    bookings = Booking.objects.select_related('customer', 'salon', 'service').order_by('-created_at')
     
     context = {
         'bookings': bookings,
@@ -559,13 +801,36 @@ def admin_bookings(request):
     
     return render(request, 'user_accounts/admin/bookings.html', context)
 
+@admin_required
+def export_admin_bookings(request):
+    """Download all bookings as CSV, filtered by date, status and salon"""
+    
+    from . import exports
+    
+    bookings = exports.filter_bookings(Booking.objects.all(), request.GET)
+    archived = exports.filter_bookings(ArchivedBooking.objects.all(), request.GET)
+    filename = f'bookings-all-{timezone.now():%Y%m%d}.csv'
+    return exports.booking_csv_response(bookings, filename, archived)
+
 @admin_required
 def admin_analytics(request):
     """Admin analytics view"""
     
-    # This would show platform analytics - for now, just show message
-    messages.info(request, 'Analytics dashboard will be implemented soon.')
-    return redirect('user_admin:dashboard')
+    from . import platform_analytics
+    
+    try:
+        months = int(request.GET.get('months', 12))
+    except ValueError:
+        months = 12
+    months = months if months in (6, 12, 24) else 12
+    
+    # Served from the nightly columnar snapshot, never from the primary database
+    context = {
+        'months': months,
+        'report': platform_analytics.platform_report(months),
+    }
+    
+    return render(request, 'user_accounts/admin/analytics.html', context)
 
 @admin_required
 def admin_settings(request):
@@ -574,3 +839,13 @@ def admin_settings(request):
     # This would show site settings - for now, just show message
     messages.info(request, 'Settings management will be implemented soon.')
     return redirect('user_admin:dashboard')
+
+
+def admin_metrics(request):
+    """Request metrics of this worker in the Prometheus text format"""
+    
+    # Not behind admin_required: a scraper can't log in, and should get a 403 rather than a login page
+    if not request_metrics.metrics_allowed(request):
+        return HttpResponseForbidden('Forbidden')
+    
+    return HttpResponse(request_metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')